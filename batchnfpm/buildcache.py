@@ -0,0 +1,93 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+
+from batchnfpm.config import Build
+
+MEGABYTE = 1024 * 1024
+
+
+class BuildCache:
+    """ Keeps finished packages keyed by a hash of all build inputs, evicting the least recently used entries. """
+
+    def __init__(self, path: str, max_size_mb: int):
+        if not path:
+            raise ValueError("path must be set")
+        self.path = path
+
+        if max_size_mb < 0:
+            raise ValueError("max_size_mb must not be negative")
+        self.max_size = max_size_mb * MEGABYTE
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(commit: str, build: Build, nfpm_config: str, version: str, filenames: list) -> str:
+        with open(nfpm_config, 'rb') as opened:
+            nfpm_config_hash = hashlib.sha256(opened.read()).hexdigest()
+
+        inputs = {
+            "commit": commit,
+            "arch": build.arch,
+            "buildsteps": build.buildsteps,
+            "env": {key: str(value) for key, value in dict(build.env).items()},
+            "nfpm_config": nfpm_config_hash,
+            "version": version,
+            "filenames": sorted(filenames),
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+    def _get_entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def restore(self, key: str, targets: list) -> bool:
+        entry = self._get_entry_path(key)
+        sources = [os.path.join(entry, os.path.basename(target)) for target in targets]
+        if not all(os.path.isfile(source) for source in sources):
+            return False
+
+        for source, target in zip(sources, targets):
+            shutil.copyfile(source, target)
+
+        # the entry's mtime is its last use
+        os.utime(entry)
+        return True
+
+    def store(self, key: str, files: list):
+        entry = self._get_entry_path(key)
+        tmp_entry = f"{entry}.tmp-{threading.get_ident()}"
+        try:
+            os.makedirs(tmp_entry, exist_ok=True)
+            for path in files:
+                shutil.copyfile(path, os.path.join(tmp_entry, os.path.basename(path)))
+            with self._lock:
+                if os.path.isdir(entry):
+                    shutil.rmtree(entry)
+                os.rename(tmp_entry, entry)
+        except Exception as err:
+            logging.warning("Could not store build result in cache: %s", err)
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            return
+
+        self._evict()
+
+    @staticmethod
+    def _get_size(path: str) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+    def _evict(self):
+        with self._lock:
+            entries = list()
+            for entry in os.scandir(self.path):
+                if entry.is_dir() and ".tmp-" not in entry.name:
+                    entries.append((entry.stat().st_mtime, BuildCache._get_size(entry.path), entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_size:
+                    break
+                logging.debug("Evicting %s from build cache", path)
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
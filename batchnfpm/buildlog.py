@@ -0,0 +1,62 @@
+import os
+import subprocess
+
+from collections import deque
+
+from batchnfpm.metrics import Span, wait
+
+DEFAULT_TAIL_LINES = 40
+# upper bound of what is read back for the tail, protects against huge single lines
+MAX_TAIL_BYTES = 64 * 1024
+_BLOCK_SIZE = 8192
+
+
+class BuildLog:
+    """ Captures the output of all commands of a build in a log file and offers its tail for failure reports. """
+
+    def __init__(self, path: str, tail_lines=DEFAULT_TAIL_LINES):
+        if not path:
+            raise ValueError("path must be set")
+
+        self.path = path
+        self.tail_lines = tail_lines
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'wb').close()
+        # append mode so parallel commands (e.g. one nfpm call per format) can share the file
+        self._file = open(path, 'ab', buffering=0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, message: str):
+        self._file.write(f"{message}\n".encode())
+
+    def run(self, cmd: list, cwd: str, env: dict, span: Span = None) -> int:
+        self.write(f"$ {' '.join(cmd)}")
+        # the child writes straight into the file, no output passes through this process
+        p = subprocess.Popen(cmd, cwd=cwd, env=env, stdin=subprocess.DEVNULL, stdout=self._file, stderr=subprocess.STDOUT)
+        exitcode = wait(p, span)
+        if exitcode != 0:
+            self.write(f"# exit code {exitcode}")
+        return exitcode
+
+    def tail(self) -> list:
+        lines = deque(maxlen=self.tail_lines)
+        with open(self.path, 'rb') as opened:
+            end = opened.seek(0, os.SEEK_END)
+            start = end
+            data = b""
+            while start > 0 and data.count(b"\n") <= self.tail_lines and len(data) < MAX_TAIL_BYTES:
+                start = max(0, start - _BLOCK_SIZE)
+                opened.seek(start)
+                data = opened.read(end - start)
+
+        for line in data[-MAX_TAIL_BYTES:].decode(errors="replace").splitlines():
+            lines.append(line)
+        return list(lines)
+
+    def close(self):
+        self._file.close()
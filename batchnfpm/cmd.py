@@ -1,15 +1,40 @@
+import os
+import json
+import time
+import signal
 import logging
 import subprocess
 import sys
 
 import configargparse
-from batchnfpm.config import Config
-from batchnfpm.rpmbuilder import GitWrapper, PackageBuilder
-from batchnfpm.rpmrepository import RpmRepository
+from batchnfpm.config import Config, AptRepositoryConfig, DEFAULT_CACHE_PATH, CHECKOUT_MODES, GITHUB_SECRET_ENV_VAR, GITLAB_TOKEN_ENV_VAR
+from batchnfpm.rpmbuilder import GitWrapper, PackageBuilder, DECISION_ERROR
+from batchnfpm.releasecache import ReleaseCache
+from batchnfpm.metrics import Tracer
+from batchnfpm.selection import select_build_configs
 from batchnfpm.resources import ResourceReader, DEFAULT_LOCATIONS
 
+# modules only some subcommands need are imported by the functions running them
+
+COMMAND_BUILD = "build"
+COMMAND_STATUS = "status"
+COMMAND_PLAN = "plan"
+COMMAND_SERVE = "serve"
+COMMAND_COORDINATOR = "coordinator"
+COMMAND_WORKER = "worker"
+COMMANDS = [COMMAND_BUILD, COMMAND_STATUS, COMMAND_PLAN, COMMAND_SERVE, COMMAND_COORDINATOR, COMMAND_WORKER]
+
 def parse_args():
     parser = configargparse.ArgumentParser(prog="batchnfpm")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=COMMANDS,
+        help=f"'{COMMAND_BUILD}' builds all outdated packages (default), '{COMMAND_STATUS}' prints the state of the last runs, "
+             f"'{COMMAND_PLAN}' prints as JSON what would be built without building anything, '{COMMAND_SERVE}' keeps running and polls for new releases, "
+             f"'{COMMAND_COORDINATOR}' queues the outdated projects for '{COMMAND_WORKER}' processes that build them",
+        default=COMMAND_BUILD
+    )
     parser.add_argument(
         "-f",
         "--force",
@@ -44,6 +69,56 @@ def parse_args():
         help="Overwrite the config's clone_path variable. Denotes where all the build repositories are checked out to.",
         default=None
     )
+    parser.add_argument(
+        "--cache-path",
+        dest="cache_path",
+        env_var="NFPM_CACHE_PATH",
+        action="store",
+        help="Overwrite the config's cache_path variable. Denotes where metadata is cached between runs.",
+        default=None
+    )
+    parser.add_argument(
+        "--log-path",
+        dest="log_path",
+        env_var="NFPM_LOG_PATH",
+        action="store",
+        help="Overwrite the config's log_path variable. Denotes where the build logs are written to, defaults to <artifacts_path>/logs.",
+        default=None
+    )
+    parser.add_argument(
+        "--trace-file",
+        dest="trace_file",
+        env_var="NFPM_TRACE_FILE",
+        action="store",
+        help="Overwrite the config's trace_file variable. Writes per-phase timings of the run as JSON to this file.",
+        default=None
+    )
+    parser.add_argument(
+        "--metrics-file",
+        dest="metrics_file",
+        env_var="NFPM_METRICS_FILE",
+        action="store",
+        help="Overwrite the config's metrics_file variable. Writes per-phase timings of the run to this Prometheus textfile.",
+        default=None
+    )
+    parser.add_argument(
+        "--checkout-mode",
+        dest="checkout_mode",
+        env_var="NFPM_CHECKOUT_MODE",
+        action="store",
+        choices=CHECKOUT_MODES,
+        help="Overwrite the config's checkout_mode variable. 'mirror' keeps a bare mirror per project and only fetches the release tag.",
+        default=None
+    )
+    parser.add_argument(
+        "--build-cache-size",
+        dest="build_cache_size",
+        env_var="NFPM_BUILD_CACHE_SIZE",
+        action="store",
+        type=int,
+        help="Overwrite the config's build_cache_size variable. Maximum size of the build cache in MB, 0 disables it.",
+        default=None
+    )
     parser.add_argument(
         "--package-repository",
         dest="package_repo",
@@ -52,6 +127,170 @@ def parse_args():
         help="Overwrite the config's package_repo variable. Defines a remote package repository (RPM/DEB) to fetch and compare package information.",
         default=None
     )
+    parser.add_argument(
+        "--apt-repository",
+        dest="apt_repo",
+        env_var="NFPM_APT_REPOSITORY",
+        action="store",
+        help="Overwrite the config's apt_repository url. Defines a remote APT repository to fetch and compare deb package information.",
+        default=None
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        env_var="NFPM_JOBS",
+        action="store",
+        type=int,
+        help="Overwrite the config's jobs variable. Denotes how many projects are built in parallel.",
+        default=None
+    )
+    parser.add_argument(
+        "--interval",
+        dest="interval",
+        env_var="NFPM_INTERVAL",
+        action="store",
+        type=int,
+        help="Overwrite the config's interval variable. Seconds between two checks of a project in serve mode.",
+        default=None
+    )
+    parser.add_argument(
+        "--jitter",
+        dest="jitter",
+        env_var="NFPM_JITTER",
+        action="store",
+        type=int,
+        help="Overwrite the config's jitter variable. Maximum random delay in seconds added to every interval in serve mode.",
+        default=None
+    )
+    parser.add_argument(
+        "--webhook-listen",
+        dest="webhook_listen",
+        env_var="NFPM_WEBHOOK_LISTEN",
+        action="store",
+        help=f"Overwrite the config's webhook_listen variable. host:port to accept GitHub/GitLab release webhooks on in serve mode, "
+             f"authenticated with the secrets from {GITHUB_SECRET_ENV_VAR} and {GITLAB_TOKEN_ENV_VAR}.",
+        default=None
+    )
+    parser.add_argument(
+        "--only",
+        dest="only",
+        env_var="NFPM_ONLY",
+        action="store",
+        help="Overwrite the config's only variable. Comma separated globs on hoster/owner/project, only matching projects are handled.",
+        default=None
+    )
+    parser.add_argument(
+        "--exclude",
+        dest="exclude",
+        env_var="NFPM_EXCLUDE",
+        action="store",
+        help="Overwrite the config's exclude variable. Comma separated globs on hoster/owner/project, matching projects are skipped.",
+        default=None
+    )
+    parser.add_argument(
+        "--shard-index",
+        dest="shard_index",
+        env_var="NFPM_SHARD_INDEX",
+        action="store",
+        type=int,
+        help="Overwrite the config's shard_index variable. Zero based index of the slice of projects this instance handles.",
+        default=None
+    )
+    parser.add_argument(
+        "--shard-count",
+        dest="shard_count",
+        env_var="NFPM_SHARD_COUNT",
+        action="store",
+        type=int,
+        help="Overwrite the config's shard_count variable. Number of instances the projects are split across by a stable hash.",
+        default=None
+    )
+    parser.add_argument(
+        "--memory-budget",
+        dest="memory_budget",
+        env_var="NFPM_MEMORY_BUDGET",
+        action="store",
+        type=int,
+        help="Overwrite the config's memory_budget variable. Peak memory in MB that concurrently running builds may use according to previous runs, 0 disables the limit.",
+        default=None
+    )
+    parser.add_argument(
+        "--pipeline",
+        dest="pipeline",
+        env_var="NFPM_PIPELINE",
+        action="store_true",
+        help="Overwrite the config's pipeline variable. Fetch, compile and package projects in separate stages so downloads, builds and packaging overlap.",
+        default=None
+    )
+    parser.add_argument(
+        "--fetch-workers",
+        dest="fetch_workers",
+        env_var="NFPM_FETCH_WORKERS",
+        action="store",
+        type=int,
+        help="Overwrite the config's fetch_workers variable. Number of workers checking out projects when pipelining.",
+        default=None
+    )
+    parser.add_argument(
+        "--package-workers",
+        dest="package_workers",
+        env_var="NFPM_PACKAGE_WORKERS",
+        action="store",
+        type=int,
+        help="Overwrite the config's package_workers variable. Number of workers running nfpm when pipelining.",
+        default=None
+    )
+    parser.add_argument(
+        "--generate-repodata",
+        dest="generate_repodata",
+        env_var="NFPM_GENERATE_REPODATA",
+        action="store_true",
+        help="Overwrite the config's generate_repodata variable. Update the repository metadata of the built rpms after every run.",
+        default=None
+    )
+    parser.add_argument(
+        "--repodata-retention",
+        dest="repodata_retention",
+        env_var="NFPM_REPODATA_RETENTION",
+        action="store",
+        type=int,
+        help="Overwrite the config's repodata_retention variable. Newest versions kept per package when generating repository metadata, 0 keeps all.",
+        default=None
+    )
+    parser.add_argument(
+        "--queue-path",
+        dest="queue_path",
+        env_var="NFPM_QUEUE_PATH",
+        action="store",
+        help="Overwrite the config's queue_path variable. SQLite database shared by coordinator and workers, defaults to <artifacts_path>/queue.db.",
+        default=None
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        dest="lease_seconds",
+        env_var="NFPM_LEASE_SECONDS",
+        action="store",
+        type=int,
+        help="Overwrite the config's lease_seconds variable. Jobs of workers that did not heartbeat for this long are queued again.",
+        default=None
+    )
+    parser.add_argument(
+        "--no-wait",
+        dest="no_wait",
+        env_var="NFPM_NO_WAIT",
+        action="store_true",
+        help="Let the coordinator exit after queueing the jobs instead of waiting for their results.",
+        default=False
+    )
+    parser.add_argument(
+        "--exit-when-empty",
+        dest="exit_when_empty",
+        env_var="NFPM_EXIT_WHEN_EMPTY",
+        action="store_true",
+        help="Let the worker exit once the queue is empty instead of waiting for new jobs.",
+        default=False
+    )
     parser.add_argument(
         "-v"
         "--verbose",
@@ -71,7 +310,7 @@ def _setup_logging(debug=False):
     if debug:
         loglevel = logging.DEBUG
     logging.basicConfig(
-        level=loglevel, format="%(levelname)s\t %(asctime)s %(message)s"
+        level=loglevel, format="%(levelname)s\t %(asctime)s [%(threadName)s] %(message)s"
     )
 
 def _check_precondition() -> bool:
@@ -91,24 +330,97 @@ def _overwrite_config(args: configargparse.Namespace, config: Config):
     if args.package_repo:
         config.dnf_repository = args.package_repo
 
+    if args.apt_repo:
+        if config.apt_repository:
+            config.apt_repository.url = args.apt_repo
+        else:
+            config.apt_repository = AptRepositoryConfig(args.apt_repo)
+
     if args.clone_path:
         config.clone_path = args.clone_path
 
     if args.artifacts_path:
         config.artifacts_path = args.artifacts_path
 
+    if args.cache_path:
+        config.cache_path = args.cache_path
+
+    if args.log_path:
+        config.log_path = args.log_path
+
+    if args.trace_file:
+        config.trace_file = args.trace_file
+
+    if args.metrics_file:
+        config.metrics_file = args.metrics_file
+
+    if args.checkout_mode:
+        config.checkout_mode = args.checkout_mode
+
+    if args.build_cache_size is not None:
+        config.build_cache_size = args.build_cache_size
+
     if args.force is not None:
         config.force = args.force
 
+    if args.jobs:
+        config.jobs = args.jobs
+
+    if args.interval:
+        config.interval = args.interval
+
+    if args.jitter is not None:
+        config.jitter = args.jitter
+
+    if args.webhook_listen:
+        config.webhook_listen = args.webhook_listen
+
+    if args.only:
+        config.only = [pattern.strip() for pattern in args.only.split(",") if pattern.strip()]
+
+    if args.exclude:
+        config.exclude = [pattern.strip() for pattern in args.exclude.split(",") if pattern.strip()]
+
+    if args.shard_index is not None:
+        config.shard_index = args.shard_index
+
+    if args.shard_count is not None:
+        config.shard_count = args.shard_count
+
+    if args.memory_budget is not None:
+        config.memory_budget = args.memory_budget
+
+    if args.pipeline is not None:
+        config.pipeline = args.pipeline
+
+    if args.fetch_workers:
+        config.fetch_workers = args.fetch_workers
+
+    if args.package_workers:
+        config.package_workers = args.package_workers
+
+    if args.generate_repodata is not None:
+        config.generate_repodata = args.generate_repodata
+
+    if args.repodata_retention is not None:
+        config.repodata_retention = args.repodata_retention
+
+    if args.queue_path:
+        config.queue_path = args.queue_path
+
+    if args.lease_seconds:
+        config.lease_seconds = args.lease_seconds
+
 def _build_config(args) -> Config:
-    config_string = ResourceReader.read_config(args.config)
+    config_string = ResourceReader.read_config(args.config, args.cache_path or DEFAULT_CACHE_PATH)
     if not config_string:
         logging.error("Could not find a config file")
         sys.exit(1)
 
+    config = None
     try:
         config = Config.from_json(config_string)
-    except ValueError as err:
+    except (ValueError, KeyError, TypeError) as err:
         logging.error("Can not parse config: %s", err)
 
     if not config:
@@ -117,20 +429,195 @@ def _build_config(args) -> Config:
 
     return config
 
+def _print_status(config: Config):
+    from batchnfpm.statestore import StateStore
+
+    store = StateStore(config.cache_path)
+    states = store.get_all()
+    store.close()
+    if not states:
+        print("No runs recorded yet")
+        return
+
+    print(f"{'PROJECT':<50} {'TAG':<20} {'RESULT':<8} {'DURATION':>9} {'COMMIT':<12} UPDATED")
+    for state in states:
+        duration = f"{state['duration']:.1f}s" if state["duration"] is not None else "-"
+        commit = (state["commit_id"] or "-")[:12]
+        updated = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(state["updated"]))
+        print(f"{state['name']:<50} {state['tag']:<20} {state['result']:<8} {duration:>9} {commit:<12} {updated}")
+
+def _write_metrics(config: Config, tracer: Tracer):
+    try:
+        if config.trace_file:
+            tracer.write_json(config.trace_file)
+        if config.metrics_file:
+            tracer.write_prometheus(config.metrics_file)
+    except Exception as err:
+        logging.error("Could not write metrics: %s", err)
+
+def _get_git_wrapper(config: Config) -> GitWrapper:
+    return GitWrapper(config.clone_path, ReleaseCache(config.cache_path), config.checkout_mode, config.github_api_url, config.gitlab_url)
+
+def _get_package_repositories(config: Config) -> tuple:
+    from batchnfpm.rpmrepository import RpmRepository
+    from batchnfpm.debrepository import DebRepository
+
+    rpm_repo = None
+    if config.dnf_repository:
+        rpm_repo = RpmRepository(config.dnf_repository, config.cache_path)
+
+    deb_repo = None
+    if config.apt_repository:
+        apt = config.apt_repository
+        deb_repo = DebRepository(apt.url, apt.suite, apt.component, apt.arch, config.cache_path)
+
+    return rpm_repo, deb_repo
+
+def _plan(config: Config):
+    from batchnfpm.statestore import StateStore
+
+    rpm_repo, deb_repo = _get_package_repositories(config)
+    state_store = StateStore(config.cache_path)
+    builder = PackageBuilder(config, _get_git_wrapper(config), rpm_repo, deb_repo, state_store=state_store)
+    plan = builder.plan()
+    state_store.close()
+    print(json.dumps(plan, indent=2))
+    if any(DECISION_ERROR == entry["decision"] for entry in plan):
+        sys.exit(1)
+
+def _create_builder(config: Config, tracer: Tracer) -> tuple:
+    from batchnfpm.buildcache import BuildCache
+    from batchnfpm.statestore import StateStore
+
+    rpm_repo, deb_repo = _get_package_repositories(config)
+
+    build_cache = None
+    if config.build_cache_size > 0:
+        build_cache = BuildCache(os.path.join(config.cache_path, "builds"), config.build_cache_size)
+
+    state_store = StateStore(config.cache_path)
+    builder = PackageBuilder(config, _get_git_wrapper(config), rpm_repo, deb_repo, build_cache, state_store, tracer)
+    return builder, state_store
+
+def _build_packages(config: Config):
+    tracer = Tracer()
+    builder, state_store = _create_builder(config, tracer)
+    results = builder.build_packages()
+    state_store.close()
+    _write_metrics(config, tracer)
+    if not all(results.values()):
+        sys.exit(1)
+
+def _serve(config: Config):
+    from batchnfpm.daemon import Daemon
+    from batchnfpm.webhook import WebhookReceiver, parse_address
+
+    builder, state_store = _create_builder(config, Tracer())
+    daemon = Daemon(builder, config.interval, config.jitter, after_cycle=lambda tracer: _write_metrics(config, tracer))
+
+    receiver = None
+    if config.webhook_listen:
+        try:
+            receiver = WebhookReceiver(builder, parse_address(config.webhook_listen), os.environ.get(GITHUB_SECRET_ENV_VAR), os.environ.get(GITLAB_TOKEN_ENV_VAR))
+        except (ValueError, OSError) as err:
+            logging.error("Can not accept webhooks: %s", err)
+            sys.exit(1)
+        receiver.start()
+
+    _stop_on_signals(daemon)
+    daemon.run()
+    if receiver:
+        receiver.stop()
+    state_store.close()
+
+def _stop_on_signals(stoppable):
+    def stop(signum, frame):
+        logging.info("Received signal %d, stopping", signum)
+        stoppable.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+def _coordinate(config: Config, wait: bool):
+    from batchnfpm.statestore import StateStore
+    from batchnfpm.workqueue import WorkQueue
+    from batchnfpm.distributed import Coordinator
+
+    tracer = Tracer()
+    rpm_repo, deb_repo = _get_package_repositories(config)
+    state_store = StateStore(config.cache_path)
+    builder = PackageBuilder(config, _get_git_wrapper(config), rpm_repo, deb_repo, state_store=state_store, tracer=tracer)
+    queue = WorkQueue(config.get_queue_path())
+    coordinator = Coordinator(builder, queue)
+    _stop_on_signals(coordinator)
+    results = coordinator.run(wait)
+    queue.close()
+    state_store.close()
+    _write_metrics(config, tracer)
+    if not all(results.values()):
+        sys.exit(1)
+
+def _work(config: Config, until_empty: bool):
+    from batchnfpm.buildcache import BuildCache
+    from batchnfpm.workqueue import WorkQueue
+    from batchnfpm.distributed import Worker
+
+    tracer = Tracer()
+    build_cache = None
+    if config.build_cache_size > 0:
+        build_cache = BuildCache(os.path.join(config.cache_path, "builds"), config.build_cache_size)
+
+    builder = PackageBuilder(config, _get_git_wrapper(config), build_cache=build_cache, tracer=tracer)
+    queue = WorkQueue(config.get_queue_path())
+    worker = Worker(builder, queue, config.lease_seconds)
+    _stop_on_signals(worker)
+    worker.run(until_empty)
+    queue.close()
+    _write_metrics(config, tracer)
+
 def main():
     args = parse_args()
     _setup_logging(args.verbose)
 
+    config = _build_config(args)
+    _overwrite_config(args, config)
+
+    if COMMAND_STATUS == args.command:
+        _print_status(config)
+        return
+
+    try:
+        selected = select_build_configs(config.buildconfigs, config.only, config.exclude, config.shard_index, config.shard_count)
+    except ValueError as err:
+        logging.error("Invalid project selection: %s", err)
+        sys.exit(1)
+
+    if len(selected) != len(config.buildconfigs):
+        logging.info("Selected %d of %d projects", len(selected), len(config.buildconfigs))
+    if not selected:
+        logging.warning("No projects selected, nothing to do")
+        return
+    config.buildconfigs = selected
+
+    # planning never invokes nfpm
+    if COMMAND_PLAN == args.command:
+        _plan(config)
+        return
+
+    # the coordinator only decides and queues, nfpm runs on the workers
+    if COMMAND_COORDINATOR == args.command:
+        _coordinate(config, not args.no_wait)
+        return
+
     if not _check_precondition():
         sys.exit(1)
 
-    config = _build_config(args)
-    _overwrite_config(args, config)
-    git_wrapper = GitWrapper(config.clone_path)
+    if COMMAND_WORKER == args.command:
+        _work(config, args.exit_when_empty)
+        return
 
-    rpm_repo = None
-    if config.dnf_repository:
-        rpm_repo = RpmRepository(config.dnf_repository)
+    if COMMAND_SERVE == args.command:
+        _serve(config)
+        return
 
-    builder = PackageBuilder(config, git_wrapper, rpm_repo)
-    builder.build_packages()
\ No newline at end of file
+    _build_packages(config)
\ No newline at end of file
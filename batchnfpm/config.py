@@ -2,18 +2,56 @@ import logging
 import os
 
 from enum import Enum
+from os.path import expanduser
+from urllib.parse import urlparse
 
 builds_node = "builds"
 DEFAULT_CONFIG_NAME = "nfpm.yaml"
+DEFAULT_CACHE_PATH = os.path.join(expanduser("~"), ".cache/batchnfpm")
+# in megabytes
+DEFAULT_BUILD_CACHE_SIZE = 1024
+# in seconds, used by the serve command
+DEFAULT_INTERVAL = 3600
+DEFAULT_JITTER = 300
+
+# how the latest release of a project is found: the hoster's release API or the repository's tags
+TAG_RESOLVER_API = "api"
+TAG_RESOLVER_GIT = "git"
+TAG_RESOLVERS = [TAG_RESOLVER_API, TAG_RESOLVER_GIT]
+
+DEFAULT_GITHUB_API_URL = "https://api.github.com"
+DEFAULT_GITLAB_URL = "https://gitlab.com"
+
+# environment variables holding the secrets release webhooks are authenticated with
+GITHUB_SECRET_ENV_VAR = "NFPM_GITHUB_WEBHOOK_SECRET"
+GITLAB_TOKEN_ENV_VAR = "NFPM_GITLAB_WEBHOOK_TOKEN"
+
+# how projects are checked out: a full clone per project or a shared bare mirror with worktrees
+CHECKOUT_MODE_CLONE = "clone"
+CHECKOUT_MODE_MIRROR = "mirror"
+CHECKOUT_MODES = [CHECKOUT_MODE_CLONE, CHECKOUT_MODE_MIRROR]
+
+
+def as_patterns(value, name: str) -> list:
+    """ Returns a list of glob patterns, a single pattern may be given as a plain string. """
+    if not value:
+        return list()
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, (list, tuple)) or not all(isinstance(pattern, str) for pattern in value):
+        raise ValueError(f"{name} must be a pattern or a list of patterns")
+    return list(value)
 
 
 class Hoster(Enum):
     GITHUB = "GITHUB"
     GITLAB = "GITLAB"
+    # any git server, needs an url and resolves tags with the git resolver
+    GIT = "GIT"
 
 
 class Config:
-    def __init__(self, buildconfigs: list, artifacts_path: str, clone_path: str, nfpm_config: str, dnf_repository=None):
+    def __init__(self, buildconfigs: list, artifacts_path: str, clone_path: str, nfpm_config: str, dnf_repository=None, apt_repository=None):
         if not buildconfigs or len(buildconfigs) < 1:
             raise ValueError("no buildconfig supplied")
         self.buildconfigs = buildconfigs
@@ -31,10 +69,53 @@ class Config:
         self.nfpm_config = nfpm_config
 
         self.dnf_repository = dnf_repository
+        self.apt_repository = apt_repository
         self.force = False
+        self.jobs = 1
+        self.cache_path = DEFAULT_CACHE_PATH
+        self.checkout_mode = CHECKOUT_MODE_CLONE
+        self.build_cache_size = DEFAULT_BUILD_CACHE_SIZE
+        self.log_path = None
+        self.trace_file = None
+        self.github_api_url = DEFAULT_GITHUB_API_URL
+        self.gitlab_url = DEFAULT_GITLAB_URL
+        self.metrics_file = None
+        self.interval = DEFAULT_INTERVAL
+        self.jitter = DEFAULT_JITTER
+        # host:port the serve command accepts release webhooks on, disabled if not set
+        self.webhook_listen = None
+        # glob patterns on hoster/owner/project, see selection.select_build_configs
+        self.only = list()
+        self.exclude = list()
+        self.shard_index = 0
+        self.shard_count = 1
+        # shared by coordinator and workers, defaults to <artifacts_path>/queue.db
+        self.queue_path = None
+        self.lease_seconds = 300
+        # in megabytes, builds are only started while their expected peak memory fits, 0 disables the limit
+        self.memory_budget = 0
+        # runs fetch, compile and package as separate stages, compiling uses jobs workers
+        self.pipeline = False
+        self.fetch_workers = 4
+        self.package_workers = 2
+        # maintains <artifacts_path>/rpm/repodata, keeping the newest repodata_retention versions per package (0 keeps all)
+        self.generate_repodata = False
+        self.repodata_retention = 3
+
+    def get_queue_path(self) -> str:
+        if not self.queue_path:
+            return os.path.join(self.artifacts_path, "queue.db")
+
+        return self.queue_path
+
+    def get_log_path(self) -> str:
+        if not self.log_path:
+            return os.path.join(self.artifacts_path, "logs")
+
+        return self.log_path
 
     def __repr__(self):
-        return f"artifacts_path: {self.artifacts_path}, clone_path: {self.clone_path}, repo: {self.dnf_repository}, force: {self.force}"
+        return f"artifacts_path: {self.artifacts_path}, clone_path: {self.clone_path}, repo: {self.dnf_repository}, force: {self.force}, jobs: {self.jobs}"
 
     @staticmethod
     def from_json(raw):
@@ -56,13 +137,90 @@ class Config:
 
         dnf_repo = None
         if "dnf_repository" in raw[builds_node]:
-            repo_path = raw[builds_node]["dnf_repository"]
+            dnf_repo = raw[builds_node]["dnf_repository"]
+
+        apt_repo = None
+        if "apt_repository" in raw[builds_node]:
+            apt_repo = AptRepositoryConfig.from_json(raw[builds_node]["apt_repository"])
 
         nfpm_config = None
         if "nfpm_config" in raw[builds_node]:
             nfpm_config = NfpmConfig.from_json(raw[builds_node]['nfpm_config'])
 
-        return Config(buildconfigs, artifacts_path=artifacts_path, clone_path=clone_path, nfpm_config=nfpm_config, dnf_repository=dnf_repo)
+        config = Config(buildconfigs, artifacts_path=artifacts_path, clone_path=clone_path, nfpm_config=nfpm_config, dnf_repository=dnf_repo, apt_repository=apt_repo)
+        if "jobs" in raw[builds_node]:
+            config.jobs = int(raw[builds_node]["jobs"])
+
+        if "cache_path" in raw[builds_node]:
+            config.cache_path = raw[builds_node]["cache_path"]
+
+        if "checkout_mode" in raw[builds_node]:
+            config.checkout_mode = raw[builds_node]["checkout_mode"]
+
+        if "github_api_url" in raw[builds_node]:
+            config.github_api_url = raw[builds_node]["github_api_url"]
+
+        if "gitlab_url" in raw[builds_node]:
+            config.gitlab_url = raw[builds_node]["gitlab_url"]
+
+        if "trace_file" in raw[builds_node]:
+            config.trace_file = raw[builds_node]["trace_file"]
+
+        if "metrics_file" in raw[builds_node]:
+            config.metrics_file = raw[builds_node]["metrics_file"]
+
+        if "log_path" in raw[builds_node]:
+            config.log_path = raw[builds_node]["log_path"]
+
+        if "build_cache_size" in raw[builds_node]:
+            config.build_cache_size = int(raw[builds_node]["build_cache_size"])
+
+        if "interval" in raw[builds_node]:
+            config.interval = int(raw[builds_node]["interval"])
+
+        if "jitter" in raw[builds_node]:
+            config.jitter = int(raw[builds_node]["jitter"])
+
+        if "webhook_listen" in raw[builds_node]:
+            config.webhook_listen = raw[builds_node]["webhook_listen"]
+
+        if "only" in raw[builds_node]:
+            config.only = as_patterns(raw[builds_node]["only"], "only")
+
+        if "exclude" in raw[builds_node]:
+            config.exclude = as_patterns(raw[builds_node]["exclude"], "exclude")
+
+        if "shard_index" in raw[builds_node]:
+            config.shard_index = int(raw[builds_node]["shard_index"])
+
+        if "shard_count" in raw[builds_node]:
+            config.shard_count = int(raw[builds_node]["shard_count"])
+
+        if "queue_path" in raw[builds_node]:
+            config.queue_path = raw[builds_node]["queue_path"]
+
+        if "lease_seconds" in raw[builds_node]:
+            config.lease_seconds = int(raw[builds_node]["lease_seconds"])
+
+        if "memory_budget" in raw[builds_node]:
+            config.memory_budget = int(raw[builds_node]["memory_budget"])
+
+        if "pipeline" in raw[builds_node]:
+            config.pipeline = bool(raw[builds_node]["pipeline"])
+
+        if "fetch_workers" in raw[builds_node]:
+            config.fetch_workers = int(raw[builds_node]["fetch_workers"])
+
+        if "package_workers" in raw[builds_node]:
+            config.package_workers = int(raw[builds_node]["package_workers"])
+
+        if "generate_repodata" in raw[builds_node]:
+            config.generate_repodata = bool(raw[builds_node]["generate_repodata"])
+
+        if "repodata_retention" in raw[builds_node]:
+            config.repodata_retention = int(raw[builds_node]["repodata_retention"])
+
+        return config
 
 
 class NfpmConfig:
@@ -93,15 +251,41 @@ class NfpmConfig:
         return conf
 
 
+class AptRepositoryConfig:
+    def __init__(self, url: str, suite="stable", component="main", arch="amd64"):
+        if not url:
+            raise ValueError("url not set")
+        self.url = url
+        self.suite = suite
+        self.component = component
+        self.arch = arch
+
+    def __repr__(self):
+        return f"{self.url} {self.suite}/{self.component} ({self.arch})"
+
+    @staticmethod
+    def from_json(raw):
+        # if simple yaml value instead of object
+        if isinstance(raw, str):
+            return AptRepositoryConfig(raw)
+
+        return AptRepositoryConfig(
+            raw.get("url"),
+            suite=raw.get("suite", "stable"),
+            component=raw.get("component", "main"),
+            arch=raw.get("arch", "amd64"),
+        )
+
+
 class BuildConfig:
-    def __init__(self, builds: list, owner: str, project: str, hoster=None):
+    __slots__ = ("_raw_builds", "_builds", "hoster", "owner", "project", "formats", "url", "interval", "tag_resolver", "tag_include", "tag_exclude", "_config_file")
+
+    def __init__(self, builds: list, owner: str, project: str, hoster=None, formats=None, url=None, interval=None, tag_resolver=None, tag_include=None, tag_exclude=None):
         if not builds:
             raise ValueError("no buildsteps defined")
-
-        tmp = list()
-        for build in builds:
-            tmp.append(Build.as_payload(build))
-        self.builds = tmp
+        # the builds are only parsed when they are needed, most runs never build most projects
+        self._raw_builds = builds
+        self._builds = None
 
         if not hoster:
             hoster = Hoster.GITHUB
@@ -117,8 +301,26 @@ class BuildConfig:
             raise ValueError("project empty")
         self.project = project
 
-        # TODO: make them available in config
-        self.formats = None
+        self.formats = formats
+        # overrides the repository url derived from hoster, owner and project
+        self.url = url
+        # overrides the global polling interval of the serve command
+        if interval is not None and int(interval) <= 0:
+            raise ValueError("interval must be positive")
+        self.interval = interval
+
+        if Hoster.GIT == hoster and not url:
+            raise ValueError("url must be set for hoster git")
+        if not tag_resolver:
+            tag_resolver = TAG_RESOLVER_GIT if Hoster.GIT == hoster else TAG_RESOLVER_API
+        if tag_resolver not in TAG_RESOLVERS:
+            raise ValueError(f"unknown tag resolver '{tag_resolver}', expected one of {TAG_RESOLVERS}")
+        if Hoster.GIT == hoster and TAG_RESOLVER_API == tag_resolver:
+            raise ValueError("hoster git has no release api")
+        self.tag_resolver = tag_resolver
+        # glob patterns on tag names, only used by the git resolver
+        self.tag_include = as_patterns(tag_include, "tag_include")
+        self.tag_exclude = as_patterns(tag_exclude, "tag_exclude")
         # TODO: make avaiable in config
         self._config_file = DEFAULT_CONFIG_NAME
 
@@ -146,13 +348,22 @@ class BuildConfig:
             return "github.com"
         if Hoster.GITLAB == self.hoster:
             return "gitlab.com"
+        if Hoster.GIT == self.hoster:
+            # scp-like urls such as git@example.com:owner/project.git have no scheme
+            return urlparse(self.url).hostname or self.url.split("@")[-1].split(":")[0]
         return None
 
+    @property
+    def name(self):
+        return f"{self.hoster.value.lower()}/{self.owner}/{self.project}"
+
     def __repr__(self):
         return f"{self.hoster}: {self.owner}/{self.project}, builds: {self.builds}"
 
     @property
     def builds(self):
+        if self._builds is None:
+            self._builds = [Build.as_payload(build) for build in self._raw_builds]
         return self._builds
     
     @builds.setter
@@ -160,6 +371,9 @@ class BuildConfig:
         self._builds = builds
 
     def get_repository_url(self) -> str:
+        if self.url:
+            return self.url
+
         if Hoster.GITHUB == self.hoster:
             return f"https://github.com/{self.owner}/{self.project}.git"
         
@@ -173,9 +387,17 @@ class BuildConfig:
             payload['project'],
             
             hoster=payload['hoster'], 
+            formats=payload.get('formats'),
+            url=payload.get('url'),
+            interval=payload.get('interval'),
+            tag_resolver=payload.get('tag_resolver'),
+            tag_include=payload.get('tag_include'),
+            tag_exclude=payload.get('tag_exclude'),
         )
 
 class Build:
+    __slots__ = ("arch", "buildsteps", "env")
+
     def __init__(self, arch: str, buildsteps: list, env: list):
         if not arch:
             raise ValueError("missing arch for build")
@@ -183,41 +405,14 @@ class Build:
 
         if not buildsteps:
             raise ValueError("missing buildsteps for build")
-        self.buildsteps = buildsteps
+        self.buildsteps = [cmd.split() for cmd in buildsteps]
 
         if not env:
             env = list()
         self.env = env
-    
-    @property
-    def env(self):
-        return self._env
-
-    @env.setter
-    def env(self, value):
-        self._env = value
-
-    @property
-    def arch(self):
-        return self._arch
-
-    @arch.setter
-    def arch(self, value):
-        self._arch = value
-
-    @property
-    def buildsteps(self):
-        return self._buildsteps
-
-    @buildsteps.setter
-    def buildsteps(self, steps):
-        self._buildsteps = list()
-        for cmd in steps:
-            self._buildsteps.append(cmd.split())
 
     def __repr__(self):
-        return f"{self._arch}, {self._buildsteps}"
-
+        return f"{self.arch}, {self.buildsteps}"
 
     @staticmethod
     def as_payload(payload):
@@ -0,0 +1,98 @@
+import time
+import random
+import logging
+import threading
+
+from batchnfpm.config import BuildConfig, DEFAULT_INTERVAL, DEFAULT_JITTER
+from batchnfpm.metrics import Tracer
+from batchnfpm.rpmbuilder import PackageBuilder
+
+
+class Daemon:
+    """ Polls for new releases and builds only the projects whose latest release changed, keeping all state warm. """
+
+    def __init__(self, builder: PackageBuilder, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER, after_cycle=None):
+        if not builder:
+            raise ValueError("No builder provided")
+        self.builder = builder
+
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.interval = interval
+
+        if jitter < 0:
+            raise ValueError("jitter must not be negative")
+        self.jitter = jitter
+
+        # called with the cycle's tracer after every cycle that built something
+        self.after_cycle = after_cycle
+        self._stop = threading.Event()
+        # project name to monotonic time of its next check, every project is due at start
+        self._next_check = dict()
+        # project name to the last tag that was handled successfully
+        self._known_tags = dict()
+
+    def stop(self):
+        self._stop.set()
+
+    def _get_interval(self, build_config: BuildConfig) -> int:
+        if build_config.interval:
+            return int(build_config.interval)
+        return self.interval
+
+    def _schedule(self, build_config: BuildConfig, now: float):
+        # jitter spreads the checks so they do not hit the APIs all at once
+        self._next_check[build_config.name] = now + self._get_interval(build_config) + random.uniform(0, self.jitter)
+
+    def _get_due(self, now: float) -> list:
+        return [build_config for build_config in self.builder.conf.buildconfigs if self._next_check.get(build_config.name, now) <= now]
+
+    def run_once(self, now=None) -> dict:
+        """ Checks all due projects, builds the ones with a new release and returns their results. """
+        if now is None:
+            now = time.monotonic()
+
+        due = self._get_due(now)
+        if not due:
+            return dict()
+
+        tracer = Tracer()
+        logging.info("Checking for new releases of %d projects", len(due))
+        with tracer.span("tags"):
+            tags = self.builder.git_wrapper.get_latest_release_tags(due, tracer=tracer)
+
+        changed = [build_config for build_config in due if tags.get(build_config) and tags[build_config] != self._known_tags.get(build_config.name)]
+        results = dict()
+        if changed:
+            logging.info("Found new releases for %d projects", len(changed))
+            self.builder.refresh()
+            results = self.builder.build_packages(changed, tags, tracer=tracer)
+            if self.after_cycle:
+                self.after_cycle(tracer)
+
+        for build_config in due:
+            self._schedule(build_config, now)
+            # failed builds are retried after the project's next interval
+            if build_config.name in results and results[build_config.name]:
+                self._known_tags[build_config.name] = tags[build_config]
+
+        return results
+
+    def _get_timeout(self) -> float:
+        if not self._next_check:
+            return 0
+        return max(0.0, min(self._next_check.values()) - time.monotonic())
+
+    def run(self):
+        logging.info("Serving %d projects, checking every %ds (+%ds jitter)", len(self.builder.conf.buildconfigs), self.interval, self.jitter)
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as err:
+                logging.error("Cycle failed: %s", err)
+                # avoid a busy loop if every project keeps failing before it is scheduled
+                for build_config in self._get_due(time.monotonic()):
+                    self._schedule(build_config, time.monotonic())
+
+            self._stop.wait(self._get_timeout())
+        logging.info("Stopped serving")
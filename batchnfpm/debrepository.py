@@ -0,0 +1,184 @@
+import io
+import os
+import logging
+import threading
+
+from typing import Optional
+from urllib.parse import urljoin
+
+from batchnfpm.indexcache import IndexCache, open_compressed
+from batchnfpm.httpclient import get_client
+
+# preferred order of the Packages index variants, smallest download first
+PACKAGES_FILES = ["Packages.xz", "Packages.gz", "Packages"]
+
+
+def _order(c: str) -> int:
+    if c == "~":
+        return -1
+    if c.isdigit():
+        return 0
+    if c.isalpha():
+        return ord(c)
+    return ord(c) + 256
+
+
+def _verrevcmp(a: str, b: str) -> int:
+    i = j = 0
+    while i < len(a) or j < len(b):
+        while (i < len(a) and not a[i].isdigit()) or (j < len(b) and not b[j].isdigit()):
+            a_order = _order(a[i]) if i < len(a) else 0
+            b_order = _order(b[j]) if j < len(b) else 0
+            if a_order != b_order:
+                return 1 if a_order > b_order else -1
+            i += 1
+            j += 1
+
+        while i < len(a) and a[i] == "0":
+            i += 1
+        while j < len(b) and b[j] == "0":
+            j += 1
+
+        first_diff = 0
+        while i < len(a) and a[i].isdigit() and j < len(b) and b[j].isdigit():
+            if not first_diff:
+                first_diff = ord(a[i]) - ord(b[j])
+            i += 1
+            j += 1
+
+        if i < len(a) and a[i].isdigit():
+            return 1
+        if j < len(b) and b[j].isdigit():
+            return -1
+        if first_diff:
+            return 1 if first_diff > 0 else -1
+
+    return 0
+
+
+def _split_version(version: str):
+    epoch, _, rest = version.partition(":") if ":" in version else ("0", "", version)
+    upstream, _, revision = rest.rpartition("-") if "-" in rest else (rest, "", "")
+    return int(epoch or 0), upstream, revision
+
+
+def deb_vercmp(a: str, b: str) -> int:
+    """ Compares two debian versions like dpkg --compare-versions, returns -1, 0 or 1. """
+    a_epoch, a_upstream, a_revision = _split_version(a)
+    b_epoch, b_upstream, b_revision = _split_version(b)
+    if a_epoch != b_epoch:
+        return 1 if a_epoch > b_epoch else -1
+
+    return _verrevcmp(a_upstream, b_upstream) or _verrevcmp(a_revision, b_revision)
+
+
+class DebRepository:
+    def __init__(self, deb_repo: str, suite="stable", component="main", arch="amd64", cache_path=None):
+        if not deb_repo:
+            raise ValueError("No repo given")
+
+        self.url = deb_repo if deb_repo.endswith("/") else f"{deb_repo}/"
+        self.suite = suite
+        self.component = component
+        self.arch = arch
+        self.index_cache = None
+        if cache_path:
+            self.index_cache = IndexCache(os.path.join(cache_path, "deb"))
+        # loaded on first use, runs that decide everything locally never download it
+        self._index = None
+        self._revision = None
+        self._stale = False
+        self._index_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"{self.url} {self.suite}/{self.component} ({self.arch})"
+
+    @staticmethod
+    def _parse_release(content: str, component: str, arch: str):
+        """ Returns the path and sha256 of the preferred Packages index listed in a Release file. """
+        hashes = dict()
+        in_sha256 = False
+        for line in content.splitlines():
+            if not line.startswith(" "):
+                in_sha256 = line.strip() == "SHA256:"
+                continue
+            if in_sha256:
+                parts = line.split()
+                if len(parts) == 3:
+                    hashes[parts[2]] = parts[0]
+
+        for filename in PACKAGES_FILES:
+            path = f"{component}/binary-{arch}/{filename}"
+            if path in hashes:
+                return path, hashes[path]
+
+        raise ValueError(f"Release file does not list a Packages index for {component}/binary-{arch}")
+
+    @staticmethod
+    def _index_packages(stream) -> dict:
+        """ Reads a Packages index line by line and keeps only the latest version per package name. """
+        index = dict()
+        name = version = None
+        for line in io.TextIOWrapper(stream, encoding="utf-8", errors="replace"):
+            if not line.strip():
+                DebRepository._add(index, name, version)
+                name = version = None
+            elif line.startswith("Package:"):
+                name = line[len("Package:"):].strip()
+            elif line.startswith("Version:"):
+                version = line[len("Version:"):].strip()
+        DebRepository._add(index, name, version)
+
+        return index
+
+    @staticmethod
+    def _add(index: dict, name: str, version: str):
+        if name and version and (name not in index or deb_vercmp(version, index[name]) > 0):
+            index[name] = version
+
+    def _load_repo(self):
+        dist_url = urljoin(self.url, f"dists/{self.suite}/")
+        response = get_client().get(urljoin(dist_url, "Release"))
+        response.raise_for_status()
+        packages_path, revision = DebRepository._parse_release(response.text, self.component, self.arch)
+        if self._index is not None and revision == self._revision:
+            return
+
+        cache_key = f"{dist_url}{self.component}/{self.arch}"
+        if self.index_cache:
+            index = self.index_cache.get(cache_key, revision)
+            if index is not None:
+                self._index, self._revision = index, revision
+                return
+
+        packages_url = urljoin(dist_url, packages_path)
+        logging.info("Loading package metadata from %s", packages_url)
+        with get_client().get(packages_url, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            self._index = DebRepository._index_packages(open_compressed(response.raw, packages_path))
+        self._revision = revision
+        logging.info("Indexed %d packages of %s", len(self._index), self)
+
+        if self.index_cache:
+            self.index_cache.put(cache_key, revision, self._index)
+
+    def _get_index(self) -> dict:
+        with self._index_lock:
+            if self._index is None or self._stale:
+                self._load_repo()
+                self._stale = False
+            return self._index
+
+    def refresh(self):
+        """ Makes the next lookup revalidate the loaded index against the repository's current metadata. """
+        with self._index_lock:
+            self._stale = True
+
+    def get_deb_version(self, name: str) -> Optional[str]:
+        version = self._get_index().get(name)
+        if not version:
+            return None
+
+        # strip epoch and debian revision so it compares to the upstream tag
+        return _split_version(version)[1]
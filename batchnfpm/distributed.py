@@ -0,0 +1,179 @@
+import os
+import socket
+import logging
+import threading
+
+from batchnfpm.config import BuildConfig
+from batchnfpm.rpmbuilder import PackageBuilder, DECISION_BUILD, DECISION_CURRENT
+from batchnfpm.statestore import RESULT_SUCCESS, RESULT_FAILED, RESULT_CURRENT
+from batchnfpm.workqueue import WorkQueue, DEFAULT_LEASE_SECONDS, STATE_DONE, STATE_FAILED
+
+# in seconds
+DEFAULT_POLL_INTERVAL = 5
+
+
+class Coordinator:
+    """ Decides which projects need to be built and queues one job per project and arch for the workers. """
+
+    def __init__(self, builder: PackageBuilder, queue: WorkQueue, poll_interval=DEFAULT_POLL_INTERVAL):
+        if not builder:
+            raise ValueError("No builder provided")
+        self.builder = builder
+
+        if not queue:
+            raise ValueError("No queue provided")
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def enqueue(self) -> dict:
+        """ Queues the jobs of all outdated projects and returns the queued build configs with their tags. """
+        build_configs = self.builder.conf.buildconfigs
+        with self.builder.tracer.span("tags"):
+            tags = self.builder.git_wrapper.get_latest_release_tags(build_configs, tracer=self.builder.tracer)
+
+        queued = dict()
+        for build_config in build_configs:
+            git_tag = tags.get(build_config)
+            try:
+                decision, _ = self.builder.decide(build_config, git_tag)
+            except Exception as err:
+                logging.error("Could not decide about %s: %s", build_config.name, err)
+                continue
+
+            if DECISION_CURRENT == decision:
+                self.builder.record_state(build_config, git_tag, RESULT_CURRENT)
+            if DECISION_BUILD != decision:
+                continue
+
+            for index, build in enumerate(build_config.builds):
+                self.queue.enqueue(build_config.name, git_tag, index, build.arch, force=self.builder.conf.force)
+            queued[build_config] = git_tag
+
+        logging.info("Queued %d of %d projects", len(queued), len(build_configs))
+        return queued
+
+    def _get_result(self, build_config: BuildConfig, git_tag: str):
+        """ Returns None while jobs of the project are unfinished, otherwise whether all of them succeeded. """
+        jobs = self.queue.get_jobs(build_config.name, git_tag)
+        if any(job["state"] not in (STATE_DONE, STATE_FAILED) for job in jobs):
+            return None
+        return all(job["state"] == STATE_DONE for job in jobs)
+
+    def collect(self, queued: dict) -> dict:
+        """ Waits until the workers finished all queued projects and records their results. """
+        results = dict()
+        queued = dict(queued)
+        while queued and not self._stop.is_set():
+            self.queue.requeue_expired()
+            for build_config, git_tag in list(queued.items()):
+                success = self._get_result(build_config, git_tag)
+                if success is None:
+                    continue
+
+                del queued[build_config]
+                results[build_config.name] = success
+                artifacts = self.builder.get_package_paths(build_config, git_tag) if success else None
+                self.builder.record_state(build_config, git_tag, RESULT_SUCCESS if success else RESULT_FAILED, artifacts=artifacts)
+
+            if queued:
+                self._stop.wait(self.poll_interval)
+
+        failed = [name for name, success in results.items() if not success]
+        if failed:
+            logging.error("Failed to build %d of %d projects: %s", len(failed), len(results), ", ".join(failed))
+        return results
+
+    def run(self, wait=True) -> dict:
+        """ Queues all outdated projects and, if wait is set, records their results once the workers finished them. """
+        queued = self.enqueue()
+        if not wait:
+            return dict()
+        return self.collect(queued)
+
+
+class Worker:
+    """ Leases jobs from the queue and builds them, heartbeating while a build is running. """
+
+    def __init__(self, builder: PackageBuilder, queue: WorkQueue, lease_seconds=DEFAULT_LEASE_SECONDS, poll_interval=DEFAULT_POLL_INTERVAL):
+        if not builder:
+            raise ValueError("No builder provided")
+        self.builder = builder
+
+        if not queue:
+            raise ValueError("No queue provided")
+        self.queue = queue
+
+        if lease_seconds <= 0:
+            raise ValueError("lease_seconds must be positive")
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+        self._build_configs = {build_config.name: build_config for build_config in builder.conf.buildconfigs}
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _heartbeat(self, job: dict, worker: str, done: threading.Event):
+        while not done.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(job["id"], worker, self.lease_seconds):
+                logging.warning("Lost the lease of job %d (%s %s %s)", job["id"], job["project"], job["tag"], job["arch"])
+                return
+
+    def process(self, job: dict, worker: str) -> bool:
+        build_config = self._build_configs.get(job["project"])
+        if not build_config:
+            logging.error("Project %s of job %d is not configured on this worker", job["project"], job["id"])
+            success = False
+        elif job["build_index"] >= len(build_config.builds) or build_config.builds[job["build_index"]].arch != job["arch"]:
+            logging.error("Build %d of %s for arch %s of job %d is not configured on this worker", job["build_index"], job["project"], job["arch"], job["id"])
+            success = False
+        else:
+            logging.info("Building %s %s for arch %s", job["project"], job["tag"], job["arch"])
+            done = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(job, worker, done), name=f"heartbeat-{job['id']}", daemon=True)
+            heartbeat.start()
+            try:
+                success = self.builder.build_arch(build_config, job["tag"], job["build_index"])
+            finally:
+                done.set()
+                heartbeat.join()
+
+        if not self.queue.complete(job["id"], worker, success):
+            logging.warning("Result of job %d was discarded, its lease had expired", job["id"])
+        return success
+
+    def _work(self, worker: str, until_empty: bool):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.lease(worker, self.lease_seconds)
+            except Exception as err:
+                # the queue may be locked or its volume briefly unavailable, the thread must not die from it
+                logging.error("Could not lease a job: %s", err)
+                self._stop.wait(self.poll_interval)
+                continue
+
+            if not job:
+                if until_empty:
+                    return
+                self._stop.wait(self.poll_interval)
+                continue
+
+            try:
+                self.process(job, worker)
+            except Exception as err:
+                logging.error("Job %d failed: %s", job["id"], err)
+
+    def run(self, until_empty=False):
+        """ Works on jobs with conf.jobs threads until stopped or, if until_empty is set, the queue is empty. """
+        jobs = max(1, self.builder.conf.jobs)
+        logging.info("Worker %s processing jobs from %s using %d jobs", self.name, self.queue.path, jobs)
+        threads = [threading.Thread(target=self._work, args=(f"{self.name}-{index}", until_empty), name=f"worker-{index}") for index in range(jobs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
@@ -1,34 +1,124 @@
 import os
+import shutil
+import fnmatch
 import logging
 
-import requests
-from git import Git, Repo
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
-from batchnfpm.config import Config, Hoster, BuildConfig
+from packaging.version import Version, InvalidVersion
 
+from batchnfpm.config import Config, Hoster, BuildConfig, TAG_RESOLVER_GIT, DEFAULT_GITHUB_API_URL, DEFAULT_GITLAB_URL, CHECKOUT_MODE_CLONE, CHECKOUT_MODE_MIRROR, CHECKOUT_MODES
+from batchnfpm.releasecache import ReleaseCache
+from batchnfpm.metrics import Tracer
+from batchnfpm.httpclient import HttpClient, get_client, TOKEN_GITHUB, TOKEN_GITLAB
+
+# GitPython is imported by the methods that use it, importing it is slow and resolving
+# releases (e.g. for 'plan') does not need it
+
+DEFAULT_TAG_WORKERS = 16
+
+MIRROR_DIR = ".mirrors"
+WORKTREE_DIR = ".worktrees"
+# in seconds, ls-remote against an unresponsive server is given up after this
+LS_REMOTE_TIMEOUT = 60
 
 class GitWrapper:
-    def __init__(self, path):
+    def __init__(self, path, release_cache: ReleaseCache = None, checkout_mode=CHECKOUT_MODE_CLONE, github_api_url=DEFAULT_GITHUB_API_URL, gitlab_url=DEFAULT_GITLAB_URL, http: HttpClient = None):
         if not path:
             raise ValueError("path must be set")
 
         self.path = path
+        self.release_cache = release_cache
+        self.github_api_url = github_api_url.rstrip("/")
+        self.gitlab_url = gitlab_url.rstrip("/")
+
+        self.http = http or get_client()
+        self.http.add_token(self.github_api_url, TOKEN_GITHUB)
+        self.http.add_token(self.gitlab_url, TOKEN_GITLAB)
+
+        if checkout_mode not in CHECKOUT_MODES:
+            raise ValueError(f"unknown checkout mode '{checkout_mode}', expected one of {CHECKOUT_MODES}")
+        self.checkout_mode = checkout_mode
 
     def get_local_repo_path(self, owner: str, project: str) -> str:
         added_path = f"{owner}/{project}"
         return os.path.join(self.path, added_path)
 
+    def get_local_mirror_path(self, owner: str, project: str) -> str:
+        return os.path.join(self.path, MIRROR_DIR, owner, f"{project}.git")
+
+    def get_local_worktree_path(self, owner: str, project: str, name: str) -> str:
+        return os.path.join(self.path, WORKTREE_DIR, owner, project, name)
+
+    @staticmethod
+    def add_worktree(repo_path: str, worktree_path: str) -> str:
+        """ Creates a detached worktree of repo_path's current HEAD that shares its object store. """
+        from git import Git
+
+        if os.path.isdir(worktree_path):
+            shutil.rmtree(worktree_path)
+
+        g = Git(repo_path)
+        g.worktree("prune")
+        g.worktree("add", "--force", "--detach", worktree_path, "HEAD")
+        return worktree_path
+
+    @staticmethod
+    def remove_worktree(repo_path: str, worktree_path: str):
+        from git import Git
+
+        try:
+            Git(repo_path).worktree("remove", "--force", worktree_path)
+        except Exception as err:
+            logging.warning("Could not remove worktree %s: %s", worktree_path, err)
+            shutil.rmtree(worktree_path, ignore_errors=True)
+
+    @staticmethod
+    def get_head_commit(repo_path: str) -> str:
+        from git import Git
+        return Git(repo_path).rev_parse("HEAD")
+
     def checkout_build_config(self, build_config: BuildConfig, tag=None):
         repo_url = build_config.get_repository_url()
         local_repo_path = self.get_local_repo_path(build_config.owner, build_config.project)
 
+        if tag and CHECKOUT_MODE_MIRROR == self.checkout_mode:
+            mirror_path = self.get_local_mirror_path(build_config.owner, build_config.project)
+            return GitWrapper.checkout_from_mirror(repo_url, mirror_path, local_repo_path, tag)
+
         return GitWrapper.checkout(repo_url, local_repo_path, tag)
 
+    @staticmethod
+    def checkout_from_mirror(repository_url: str, mirror_path: str, local_repo_path: str, tag: str) -> str:
+        if not repository_url or not mirror_path or not local_repo_path or not tag:
+            raise ValueError("no repository/mirror_path/local_repo_path/tag given")
+
+        from git import Git, Repo
+
+        if not os.path.isdir(mirror_path):
+            logging.info("Creating bare mirror for '%s' at %s", repository_url, mirror_path)
+            Repo.init(mirror_path, bare=True, mkdir=True)
+
+        mirror = Git(mirror_path)
+        logging.info("Fetching tag '%s' from '%s'", tag, repository_url)
+        mirror.fetch("--depth", "1", "--force", "--no-tags", repository_url, f"+refs/tags/{tag}:refs/tags/{tag}")
+
+        # always start from a pristine working tree instead of merging into the previous one
+        if os.path.isdir(local_repo_path):
+            shutil.rmtree(local_repo_path)
+        mirror.worktree("prune")
+        mirror.worktree("add", "--force", "--detach", local_repo_path, f"refs/tags/{tag}")
+
+        return local_repo_path
+
     @staticmethod
     def checkout(repository_url: str, local_repo_path: str, tag=None) -> str:
         if not repository_url or not local_repo_path:
             raise ValueError("no repository/local_repo_path given")
 
+        from git import Git, Repo
+
         if not tag:
             tag = "master"
 
@@ -42,51 +132,147 @@ class GitWrapper:
 
         return local_repo_path
 
-    @staticmethod
-    def get_latest_release_tag(repo):
+    def get_latest_release_tag(self, repo):
         if not repo:
             return None
 
+        if TAG_RESOLVER_GIT == repo.tag_resolver:
+            return self._get_git_tag(repo)
+
         if Hoster.GITHUB == repo.hoster:
-            return GitWrapper._get_github_tag(repo.owner, repo.project)
+            return self._get_github_tag(repo.owner, repo.project)
         
         elif Hoster.GITLAB == repo.hoster:
-            return GitWrapper._get_gitlab_tag(repo.owner, repo.project)
+            return self._get_gitlab_tag(repo.owner, repo.project)
 
         return None
 
+    def get_latest_release_tags(self, build_configs: list, max_workers=DEFAULT_TAG_WORKERS, tracer: Tracer = None) -> dict:
+        if not build_configs:
+            return dict()
+
+        def resolve(build_config):
+            try:
+                if not tracer:
+                    return self.get_latest_release_tag(build_config)
+                with tracer.span("tags", build_config.name):
+                    return self.get_latest_release_tag(build_config)
+            except Exception as err:
+                logging.error("Could not resolve latest release of %s: %s", build_config.name, err)
+                return None
+
+        workers = max(1, min(max_workers, len(build_configs)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tags") as executor:
+            tags = dict(zip(build_configs, executor.map(resolve, build_configs)))
+
+        if self.release_cache:
+            self.release_cache.save()
+        return tags
+
+    def _get_json(self, url: str, extract):
+        """ Fetches url and returns extract(json), revalidating a cached value with a conditional request. """
+        cached = None
+        headers = dict()
+        if self.release_cache:
+            cached = self.release_cache.get_response(url)
+            if cached and cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached and cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = self.http.get(url, headers=headers)
+        if response.status_code == 304 and cached:
+            logging.debug("Release metadata at %s not modified", url)
+            return cached["value"]
+
+        if not response.ok:
+            return None
+
+        value = extract(response.json())
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if self.release_cache and (etag or last_modified):
+            self.release_cache.set_response(url, value, etag=etag, last_modified=last_modified)
+        return value
+
     @staticmethod
-    def _get_github_tag(owner: str, project: str) -> str:
-        url = f"https://api.github.com/repos/{owner}/{project}/releases/latest"
-        response = requests.get(url)
-        if response.ok:
-            data = response.json()
-            if 'tag_name' in data:
-                return data['tag_name']
+    def list_remote_tags(repository_url: str) -> list:
+        """ Returns the tag names of a remote repository using a single 'git ls-remote', no API involved. """
+        from git import Git
 
-        return None
+        # never ask for credentials, a private repository without configured access is an error
+        output = Git().ls_remote("--tags", "--refs", repository_url, env={"GIT_TERMINAL_PROMPT": "0"}, kill_after_timeout=LS_REMOTE_TIMEOUT)
+        tags = list()
+        for line in output.splitlines():
+            _, _, ref = line.partition("\t")
+            if ref.startswith("refs/tags/"):
+                tags.append(ref[len("refs/tags/"):])
+        return tags
+
+    @staticmethod
+    def is_release_tag(tag: str, include=None, exclude=None) -> bool:
+        """ Returns whether tag matches any include and no exclude pattern and names a version that is no pre-release. """
+        if include and not any(fnmatch.fnmatchcase(tag, pattern) for pattern in include):
+            return False
+        if exclude and any(fnmatch.fnmatchcase(tag, pattern) for pattern in exclude):
+            return False
+
+        try:
+            version = Version(tag)
+        except InvalidVersion:
+            return False
+        return not (version.is_prerelease or version.is_devrelease)
 
     @staticmethod
-    def _get_gitlab_tag(owner: str, project: str, host="gitlab.com") -> str:
-        project_id = GitWrapper._get_gitlab_project_id(owner, project, host)
+    def select_latest_tag(tags: list, include=None, exclude=None):
+        """ Returns the highest version among tags matching any include and no exclude pattern, ignoring pre-releases. """
+        latest, latest_version = None, None
+        for tag in tags:
+            if not GitWrapper.is_release_tag(tag, include, exclude):
+                continue
+
+            version = Version(tag)
+            if latest_version is None or version > latest_version:
+                latest, latest_version = tag, version
+        return latest
+
+    def _get_git_tag(self, build_config: BuildConfig) -> str:
+        tags = GitWrapper.list_remote_tags(build_config.get_repository_url())
+        tag = GitWrapper.select_latest_tag(tags, build_config.tag_include, build_config.tag_exclude)
+        logging.debug("Selected tag %s out of %d tags of %s", tag, len(tags), build_config.name)
+        return tag
+
+    def _get_github_tag(self, owner: str, project: str) -> str:
+        url = f"{self.github_api_url}/repos/{owner}/{project}/releases/latest"
+        return self._get_json(url, lambda data: data.get('tag_name'))
+
+    def _get_gitlab_tag(self, owner: str, project: str) -> str:
+        project_id = self._get_gitlab_project_id(owner, project)
         if not project_id:
             return 
 
-        url = f"https://{host}/api/v4/projects/{project_id}/releases"
-        response = requests.get(url)
-        if not response.ok:
+        def latest_tag(releases):
+            if releases and len(releases) > 0:
+                return releases[0]["tag_name"]
             return None
 
-        releases = response.json()
-        if releases and len(releases) > 0:
-            return releases[0]["tag_name"]
+        url = f"{self.gitlab_url}/api/v4/projects/{project_id}/releases"
+        return self._get_json(url, latest_tag)
 
-        return None
+    def _get_gitlab_project_id(self, owner: str, project: str) -> int:
+        host = urlparse(self.gitlab_url).netloc
+        if self.release_cache:
+            project_id = self.release_cache.get_project_id(host, owner, project)
+            if project_id:
+                return project_id
 
-    @staticmethod
-    def _get_gitlab_project_id(owner: str, project: str, host: str) -> int:
-        url = f"https://{host}/api/v4/projects/{owner}%2F{project}"
-        response = requests.get(url)
+        url = f"{self.gitlab_url}/api/v4/projects/{owner}%2F{project}"
+        response = self.http.get(url)
         if not response.ok:
             return None
-        return response.json()["id"]
+
+        project_id = response.json()["id"]
+        # project ids never change, so they are cached without revalidation
+        if self.release_cache:
+            self.release_cache.set_project_id(host, owner, project, project_id)
+        return project_id
@@ -0,0 +1,185 @@
+import os
+import time
+import logging
+import threading
+
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# in seconds, (connect, read)
+DEFAULT_TIMEOUT = (10, 30)
+DEFAULT_POOL_SIZE = 16
+# in seconds, a request that would have to wait longer for the rate limit to reset fails instead
+DEFAULT_MAX_WAIT = 120
+# once less than this share of a host's budget is left, requests are spread over the rest of the window
+LOW_BUDGET_RATIO = 0.1
+
+# environment variable holding a token, the header it is sent in and its format
+TOKEN_GITHUB = ("GITHUB_TOKEN", "Authorization", "Bearer {}")
+TOKEN_GITLAB = ("GITLAB_TOKEN", "PRIVATE-TOKEN", "{}")
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class RateLimitExceeded(requests.exceptions.RequestException):
+    pass
+
+
+def _get_header(headers, *names) -> Optional[str]:
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+def _parse_reset(value: str, now: float) -> Optional[float]:
+    """ Returns the epoch time a rate limit resets, hosts send either epoch seconds or seconds from now. """
+    try:
+        reset = float(value)
+    except (TypeError, ValueError):
+        return None
+    # nobody sends a window of 30 years, larger numbers are epoch times
+    return reset if reset > 1e9 else now + reset
+
+
+def _parse_retry_after(value: str, now: float) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return now + float(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class _HostBudget:
+    """ Paces the requests to a single host according to the rate limit headers of its previous responses. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # epoch time before which no request may be sent
+        self._next_request = 0.0
+        # in seconds between requests, 0 while the budget is plentiful
+        self._interval = 0.0
+
+    def reserve(self) -> float:
+        """ Takes the next free slot and returns how many seconds to wait for it. """
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next_request)
+            self._next_request = start + self._interval
+            return start - now
+
+    def update(self, headers, status_code: int) -> bool:
+        """ Adjusts the pace to the response, returns whether the request was rejected by the rate limit. """
+        now = time.time()
+        remaining = _get_header(headers, "X-RateLimit-Remaining", "RateLimit-Remaining")
+        limit = _get_header(headers, "X-RateLimit-Limit", "RateLimit-Limit")
+        reset = _parse_reset(_get_header(headers, "X-RateLimit-Reset", "RateLimit-Reset"), now)
+        retry_after = _parse_retry_after(headers.get("Retry-After"), now)
+
+        try:
+            remaining = int(remaining) if remaining is not None else None
+            limit = int(limit) if limit is not None else None
+        except ValueError:
+            remaining, limit = None, None
+
+        exhausted = remaining == 0 and status_code in (403, 429)
+        rejected = status_code == 429 or exhausted or (status_code == 403 and retry_after is not None)
+        with self._lock:
+            if retry_after and rejected:
+                self._next_request = max(self._next_request, retry_after)
+            elif remaining is not None and reset:
+                window = max(0.0, reset - now)
+                if remaining == 0:
+                    self._next_request = max(self._next_request, reset)
+                elif limit and remaining < limit * LOW_BUDGET_RATIO:
+                    self._interval = window / remaining
+                else:
+                    self._interval = 0.0
+        return rejected
+
+
+class HttpClient:
+    """ The HTTP client shared by all remote calls, with pooled connections per host, timeouts, tokens and rate limiting. """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, max_wait=DEFAULT_MAX_WAIT):
+        self.timeout = timeout
+        self.max_wait = max_wait
+
+        self.session = requests.Session()
+        # connection errors and overloaded servers are retried, rate limits are handled by the budgets
+        retry = Retry(total=3, connect=3, read=2, status=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), respect_retry_after_header=False, raise_on_status=False)
+        # requests keeps a separate pool per host
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._budgets = dict()
+        self._tokens = dict()
+
+    def add_token(self, url: str, token) -> bool:
+        """ Sends the token from the environment with every request to the host of url, returns whether it was set. """
+        env_var, header, value = token
+        secret = os.environ.get(env_var)
+        if not secret:
+            return False
+
+        with self._lock:
+            self._tokens[urlparse(url).netloc] = (header, value.format(secret))
+        return True
+
+    def _get_budget(self, host: str) -> _HostBudget:
+        with self._lock:
+            budget = self._budgets.get(host)
+            if not budget:
+                budget = _HostBudget()
+                self._budgets[host] = budget
+            return budget
+
+    def _wait(self, host: str, budget: _HostBudget):
+        delay = budget.reserve()
+        if delay > self.max_wait:
+            raise RateLimitExceeded(f"rate limit of {host} resets in {delay:.0f}s")
+        if delay > 0:
+            logging.info("Waiting %.1fs for the rate limit of %s", delay, host)
+            time.sleep(delay)
+
+    def get(self, url: str, headers=None, **kwargs) -> requests.Response:
+        host = urlparse(url).netloc
+        budget = self._get_budget(host)
+        headers = dict(headers or dict())
+        with self._lock:
+            token = self._tokens.get(host)
+        if token:
+            headers.setdefault(*token)
+        kwargs.setdefault("timeout", self.timeout)
+
+        # a request rejected by the rate limit is sent once more after waiting for the reset
+        for attempt in range(2):
+            self._wait(host, budget)
+            response = self.session.get(url, headers=headers, **kwargs)
+            if not budget.update(response.headers, response.status_code) or attempt:
+                return response
+            logging.warning("Request to %s was rate limited", host)
+            response.close()
+        return response
+
+
+def get_client() -> HttpClient:
+    global _client
+    with _client_lock:
+        if not _client:
+            _client = HttpClient()
+        return _client
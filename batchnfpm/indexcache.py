@@ -0,0 +1,61 @@
+import os
+import bz2
+import gzip
+import json
+import lzma
+import hashlib
+import logging
+
+from typing import Optional
+
+
+def open_compressed(fileobj, name: str):
+    """ Wraps a binary stream in an incremental decompressor chosen by the file extension of name. """
+    if name.endswith(".gz"):
+        return gzip.GzipFile(fileobj=fileobj)
+    if name.endswith(".xz"):
+        return lzma.LZMAFile(fileobj)
+    if name.endswith(".bz2"):
+        return bz2.BZ2File(fileobj)
+    if name.endswith(".zst"):
+        raise ValueError(f"zstd compressed metadata is not supported: {name}")
+    return fileobj
+
+
+class IndexCache:
+    """ Stores one package index per repository on disk, valid as long as the repository revision matches. """
+
+    def __init__(self, cache_path: str):
+        if not cache_path:
+            raise ValueError("cache_path must be set")
+        self.path = cache_path
+
+    def _get_file_path(self, repository: str) -> str:
+        name = hashlib.sha256(repository.encode()).hexdigest()[:16]
+        return os.path.join(self.path, f"{name}.json")
+
+    def get(self, repository: str, revision: str) -> Optional[dict]:
+        path = self._get_file_path(repository)
+        try:
+            with open(path, 'r') as opened:
+                data = json.load(opened)
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            logging.warning("Ignoring unreadable index cache %s: %s", path, err)
+            return None
+
+        if data.get("revision") != revision:
+            logging.info("Cached index of %s is outdated", repository)
+            return None
+
+        logging.info("Using cached index of %s at revision %s", repository, revision)
+        return data.get("index")
+
+    def put(self, repository: str, revision: str, index: dict):
+        path = self._get_file_path(repository)
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as opened:
+            json.dump({"repository": repository, "revision": revision, "index": index}, opened)
+        os.replace(tmp_path, path)
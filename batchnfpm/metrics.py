@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import threading
+import subprocess
+
+from contextlib import contextmanager
+
+METRIC_PREFIX = "batchnfpm"
+
+
+class Span:
+    def __init__(self, phase: str, project=None, arch=None):
+        self.phase = phase
+        self.project = project
+        self.arch = arch
+        self.start = time.time()
+        self.duration = None
+        self.cpu_seconds = 0.0
+        self.max_rss_bytes = 0
+        self._lock = threading.Lock()
+
+    def add_rusage(self, rusage):
+        with self._lock:
+            self.cpu_seconds += rusage.ru_utime + rusage.ru_stime
+            # linux reports ru_maxrss in kilobytes
+            self.max_rss_bytes = max(self.max_rss_bytes, rusage.ru_maxrss * 1024)
+
+    def as_dict(self) -> dict:
+        return {
+            "phase": self.phase,
+            "project": self.project,
+            "arch": self.arch,
+            "start": self.start,
+            "duration": self.duration,
+            "cpu_seconds": self.cpu_seconds,
+            "max_rss_bytes": self.max_rss_bytes,
+        }
+
+
+def wait(p: subprocess.Popen, span: Span = None) -> int:
+    """ Waits for p like Popen.wait, but also accounts the child's resource usage to span. """
+    _, status, rusage = os.wait4(p.pid, 0)
+    if os.WIFSIGNALED(status):
+        p.returncode = -os.WTERMSIG(status)
+    else:
+        p.returncode = os.WEXITSTATUS(status)
+
+    if span:
+        span.add_rusage(rusage)
+    return p.returncode
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Tracer:
+    """ Collects timing spans of a run and exports them as a JSON trace or a Prometheus textfile. """
+
+    def __init__(self):
+        self.start = time.time()
+        self._spans = list()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, phase: str, project=None, arch=None):
+        span = Span(phase, project, arch)
+        started = time.monotonic()
+        try:
+            yield span
+        finally:
+            span.duration = time.monotonic() - started
+            with self._lock:
+                self._spans.append(span)
+
+    @property
+    def spans(self) -> list:
+        with self._lock:
+            return list(self._spans)
+
+    def write_json(self, path: str):
+        trace = {"start": self.start, "spans": [span.as_dict() for span in self.spans]}
+        Tracer._write_atomically(path, json.dumps(trace, indent=2))
+
+    def to_prometheus(self) -> str:
+        # spans of the same phase, project and arch are summed up
+        aggregated = dict()
+        for span in self.spans:
+            key = (span.phase, span.project, span.arch)
+            duration, cpu, rss = aggregated.get(key, (0.0, 0.0, 0))
+            aggregated[key] = (duration + (span.duration or 0.0), cpu + span.cpu_seconds, max(rss, span.max_rss_bytes))
+
+        metrics = [
+            ("phase_duration_seconds", "Wall time spent in a phase.", 0),
+            ("phase_cpu_seconds", "CPU time of the subprocesses run in a phase.", 1),
+            ("phase_max_rss_bytes", "Peak resident set size of the subprocesses run in a phase.", 2),
+        ]
+        lines = list()
+        for name, help_text, index in metrics:
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+            for (phase, project, arch), values in sorted(aggregated.items(), key=lambda item: tuple(str(v) for v in item[0])):
+                labels = {"phase": phase, "project": project or "", "arch": arch or ""}
+                rendered = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+                lines.append(f"{METRIC_PREFIX}_{name}{{{rendered}}} {values[index]}")
+
+        lines.append(f"# HELP {METRIC_PREFIX}_last_run_timestamp_seconds Start of the last run.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_last_run_timestamp_seconds {self.start}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        # node-exporter's textfile collector must never see partially written files
+        Tracer._write_atomically(path, self.to_prometheus())
+
+    @staticmethod
+    def _write_atomically(path: str, content: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as opened:
+            opened.write(content)
+        os.replace(tmp_path, path)
@@ -0,0 +1,196 @@
+import queue
+import logging
+import threading
+
+from batchnfpm.config import BuildConfig
+from batchnfpm.metrics import Tracer
+from batchnfpm.projectbuild import ProjectBuild, ArchBuild
+from batchnfpm.scheduler import Scheduler
+
+DEFAULT_FETCH_WORKERS = 4
+DEFAULT_PACKAGE_WORKERS = 2
+
+# tells a stage's workers that no more items will arrive
+_DONE = object()
+
+
+class _FetchItem:
+    def __init__(self, build_config: BuildConfig, git_tag: str):
+        self.build_config = build_config
+        self.git_tag = git_tag
+
+    @property
+    def name(self) -> str:
+        return self.build_config.name
+
+
+class _Project:
+    """ A project in flight, finished once all of its archs went through the pipeline. """
+
+    def __init__(self, build: ProjectBuild, lock: threading.Lock):
+        self.build = build
+        self.lock = lock
+        self.remaining = 0
+        self.success = True
+        self._lock = threading.Lock()
+
+    def finish_arch(self, success: bool) -> bool:
+        """ Returns True for the last arch of the project. """
+        with self._lock:
+            self.success = self.success and success
+            self.remaining -= 1
+            return self.remaining == 0
+
+
+class Pipeline:
+    """ Runs fetch, compile and package as stages connected by bounded queues, so network, CPU and disk are used at the same time. """
+
+    def __init__(self, builder, scheduler: Scheduler, fetch_workers=DEFAULT_FETCH_WORKERS, package_workers=DEFAULT_PACKAGE_WORKERS, tracer: Tracer = None):
+        # the PackageBuilder whose per-arch steps the stages run
+        if not builder:
+            raise ValueError("No builder provided")
+        self.builder = builder
+
+        if not scheduler:
+            raise ValueError("No scheduler provided")
+        # limits the compile stage to the CPU slots and memory budget
+        self.scheduler = scheduler
+
+        if fetch_workers < 1 or package_workers < 1:
+            raise ValueError("every stage needs at least one worker")
+        self.fetch_workers = fetch_workers
+        self.package_workers = package_workers
+        if not tracer:
+            tracer = builder.tracer
+        self.tracer = tracer
+
+        self._results = dict()
+        # project name to the _Project its archs belong to
+        self._projects = dict()
+        self._lock = threading.Lock()
+
+    def _set_result(self, build_config: BuildConfig, success: bool):
+        with self._lock:
+            self._results[build_config.name] = success
+
+    def _get_project(self, arch: ArchBuild) -> _Project:
+        with self._lock:
+            return self._projects[arch.build_config.name]
+
+    def _fetch(self, build_config: BuildConfig, git_tag: str, compile_queue: queue.Queue):
+        """ Decides about a project and, if it needs to be built, checks it out and queues its archs. """
+        builder = self.builder
+        if not builder.needs_build(build_config, git_tag, self.tracer):
+            self._set_result(build_config, True)
+            return
+
+        logging.info("Building package from git tag %s", git_tag)
+        # held until the last arch is packaged, the checkout is shared by all stages
+        lock = builder.get_project_lock(build_config)
+        lock.acquire()
+        project = _Project(ProjectBuild(build_config, git_tag, self.tracer), lock)
+        with self._lock:
+            self._projects[build_config.name] = project
+        try:
+            prepared = builder.prepare(project.build)
+        except Exception as err:
+            logging.error("Could not check out %s: %s", build_config.name, err)
+            prepared = False
+
+        if not prepared:
+            project.success = False
+            self._finish_project(project)
+            return
+
+        project.remaining = len(project.build.archs)
+        for arch in project.build.archs:
+            try:
+                restored = builder.restore(arch)
+            except Exception as err:
+                logging.error("Could not look up %s in build cache: %s", arch.name, err)
+                self._finish_arch(arch, False)
+                continue
+
+            if restored:
+                self._finish_arch(arch, True)
+            else:
+                # blocks while the compile stage is busy, which throttles fetching
+                compile_queue.put(arch)
+
+    def _compile(self, arch: ArchBuild, package_queue: queue.Queue):
+        build_config = arch.build_config
+        memory = self.scheduler.estimate(build_config)[1] / len(build_config.builds)
+        with self.scheduler.admit(memory):
+            success = self.builder.compile(arch)
+
+        if success:
+            package_queue.put(arch)
+        else:
+            self._finish_arch(arch, False)
+
+    def _package(self, arch: ArchBuild):
+        self._finish_arch(arch, self.builder.package(arch))
+
+    def _finish_arch(self, arch: ArchBuild, success: bool):
+        arch.close()
+        project = self._get_project(arch)
+        if project.finish_arch(success):
+            self._finish_project(project)
+
+    def _finish_project(self, project: _Project):
+        try:
+            self.builder.finish(project.build, project.success)
+        finally:
+            project.lock.release()
+            self._set_result(project.build.build_config, project.success)
+
+    def _stage(self, name: str, source: queue.Queue, process):
+        while True:
+            item = source.get()
+            if item is _DONE:
+                return
+
+            threading.current_thread().name = item.name
+            try:
+                process(item)
+            except Exception as err:
+                logging.error("%s of %s failed: %s", name.capitalize(), item.name, err)
+                if isinstance(item, ArchBuild):
+                    self._finish_arch(item, False)
+                else:
+                    self._set_result(item.build_config, False)
+
+    @staticmethod
+    def _start(name: str, count: int, target, *args) -> list:
+        threads = [threading.Thread(target=target, args=(name, *args), name=f"{name}-{index}") for index in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    @staticmethod
+    def _drain(threads: list, source: queue.Queue):
+        for _ in threads:
+            source.put(_DONE)
+        for thread in threads:
+            thread.join()
+
+    def run(self, build_configs: list, tags: dict) -> dict:
+        """ Builds build_configs in the scheduler's order and returns a dict of project name to success. """
+        compile_workers = self.scheduler.slots
+        fetch_queue = queue.Queue()
+        # bounded so fetching and compiling never run too far ahead of the stage after them
+        compile_queue = queue.Queue(maxsize=compile_workers)
+        package_queue = queue.Queue(maxsize=self.package_workers)
+
+        for build_config in self.scheduler.order(build_configs):
+            fetch_queue.put(_FetchItem(build_config, tags.get(build_config)))
+
+        fetchers = Pipeline._start("fetch", self.fetch_workers, self._stage, fetch_queue, lambda item: self._fetch(item.build_config, item.git_tag, compile_queue))
+        compilers = Pipeline._start("compile", compile_workers, self._stage, compile_queue, lambda arch: self._compile(arch, package_queue))
+        packagers = Pipeline._start("package", self.package_workers, self._stage, package_queue, self._package)
+
+        Pipeline._drain(fetchers, fetch_queue)
+        Pipeline._drain(compilers, compile_queue)
+        Pipeline._drain(packagers, package_queue)
+
+        return {build_config.name: self._results.get(build_config.name, False) for build_config in build_configs}
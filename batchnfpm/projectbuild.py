@@ -0,0 +1,46 @@
+import time
+
+from batchnfpm.config import BuildConfig, Build
+from batchnfpm.buildlog import BuildLog
+from batchnfpm.metrics import Tracer
+
+
+class ArchBuild:
+    """ A single build of a project, compiled and packaged in its own working directory. """
+
+    def __init__(self, build_config: BuildConfig, index: int, build: Build, nfpm_config: str, version: str, working_dir: str, tracer: Tracer):
+        self.build_config = build_config
+        self.index = index
+        self.build = build
+        self.nfpm_config = nfpm_config
+        self.version = version
+        self.working_dir = working_dir
+        self.tracer = tracer
+        self.cache_key = None
+        self.package_paths = None
+        self.build_log: BuildLog = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.build_config.name}/{self.index}-{self.build.arch}"
+
+    def close(self):
+        if self.build_log:
+            self.build_log.close()
+            self.build_log = None
+
+
+class ProjectBuild:
+    """ A checked out release of a project and the builds of its archs. """
+
+    def __init__(self, build_config: BuildConfig, git_tag: str, tracer: Tracer):
+        self.build_config = build_config
+        self.git_tag = git_tag
+        # builds running at the same time, e.g. of the serve loop and a webhook, trace into their own tracer
+        self.tracer = tracer
+        self.start = time.monotonic()
+        self.working_dir = None
+        self.commit = None
+        # the archs of a project with several builds get a worktree each
+        self.worktrees = list()
+        self.archs = list()
@@ -0,0 +1,69 @@
+import os
+import json
+import logging
+import threading
+
+from typing import Optional
+
+CACHE_FILE_NAME = "releases.json"
+
+
+class ReleaseCache:
+    """ Persists release metadata between runs so lookups can be answered by conditional requests. """
+
+    def __init__(self, cache_path: str):
+        if not cache_path:
+            raise ValueError("cache_path must be set")
+
+        self.path = os.path.join(cache_path, CACHE_FILE_NAME)
+        self._lock = threading.Lock()
+        self._project_ids = dict()
+        self._responses = dict()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as opened:
+                data = json.load(opened)
+            self._project_ids = data.get("project_ids", dict())
+            self._responses = data.get("responses", dict())
+        except FileNotFoundError:
+            logging.debug("No release cache found at %s", self.path)
+        except Exception as err:
+            logging.warning("Ignoring unreadable release cache %s: %s", self.path, err)
+
+    @staticmethod
+    def _project_key(host: str, owner: str, project: str) -> str:
+        return f"{host}/{owner}/{project}"
+
+    def get_project_id(self, host: str, owner: str, project: str) -> Optional[int]:
+        with self._lock:
+            return self._project_ids.get(ReleaseCache._project_key(host, owner, project))
+
+    def set_project_id(self, host: str, owner: str, project: str, project_id: int):
+        with self._lock:
+            self._project_ids[ReleaseCache._project_key(host, owner, project)] = project_id
+            self._dirty = True
+
+    def get_response(self, url: str) -> Optional[dict]:
+        with self._lock:
+            return self._responses.get(url)
+
+    def set_response(self, url: str, value, etag=None, last_modified=None):
+        with self._lock:
+            self._responses[url] = {"value": value, "etag": etag, "last_modified": last_modified}
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+
+            data = {"project_ids": self._project_ids, "responses": self._responses}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as opened:
+                json.dump(data, opened)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
@@ -1,41 +1,139 @@
 import os
+import glob
+import json
+import hashlib
 import logging
 from typing import Optional
 from os.path import expanduser
 
 import backoff
-import requests
 import yaml
 
-from batchnfpm.config import Config
+from batchnfpm.config import Config, DEFAULT_CACHE_PATH, builds_node
+from batchnfpm.httpclient import get_client
 
 APP_NAME = "batchnfpm"
 DEFAULT_LOCATIONS=[os.path.join(expanduser("~"), f".config/{APP_NAME}/config.yaml"), f"/etc/{APP_NAME}/config.yaml"]
+CONFIG_CACHE_DIR = "configs"
+
+# the C loader is an order of magnitude faster, but only available if PyYAML was built against libyaml
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _get_cache_file(cache_path: str, name: str, suffix: str) -> str:
+    return os.path.join(cache_path, CONFIG_CACHE_DIR, hashlib.sha256(name.encode()).hexdigest()[:32] + suffix)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path, 'r') as opened:
+            return json.load(opened)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: str, content):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w') as opened:
+            json.dump(content, opened)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as err:
+        logging.warning("Could not write config cache %s: %s", path, err)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _survives_json(value) -> bool:
+    """ Returns whether value comes back unchanged from JSON, dates or non-string keys for example do not. """
+    try:
+        return json.loads(json.dumps(value)) == value
+    except (TypeError, ValueError):
+        return False
+
 
 class ResourceReader:
     @staticmethod
-    def read_config(resource: str):
+    def read_config(resource: str, cache_path=DEFAULT_CACHE_PATH):
         # if no explicit resource is given, try all default config locations
         resources = DEFAULT_LOCATIONS
         if resource:
             resources = [resource]
 
         for path in resources:
-            content = ResourceReader.read_from_resource(path)
+            content = ResourceReader.read_from_resource(path, cache_path)
             if content:
                 try:
                     logging.info("Trying to parse yaml...")
-                    return yaml.safe_load(content)
+                    raw = ResourceReader.parse_yaml(content, path, cache_path)
+                    base_dir = None if path.startswith("http") else os.path.dirname(os.path.abspath(path))
+                    ResourceReader._resolve_includes(raw, base_dir, cache_path)
+                    return raw
                 except Exception as err:
                     logging.error("Could not parse yaml: %s", err)
 
         return None
 
     @staticmethod
-    def read_from_resource(resource: str) -> Optional[str]:
+    def parse_yaml(content, name: str, cache_path=None):
+        """ Parses content, reusing the result of a previous run as long as the content did not change. """
+        if isinstance(content, str):
+            content = content.encode()
+        digest = hashlib.sha256(content).hexdigest()
+
+        cache_file = None
+        if cache_path:
+            cache_file = _get_cache_file(cache_path, name, ".parsed.json")
+            cached = _read_json(cache_file)
+            if cached and cached.get("sha256") == digest:
+                return cached["raw"]
+
+        raw = yaml.load(content, Loader=_YAML_LOADER)
+        if cache_file and _survives_json(raw):
+            _write_json(cache_file, {"sha256": digest, "raw": raw})
+        return raw
+
+    @staticmethod
+    def _resolve_includes(raw, base_dir: str, cache_path=None):
+        """ Appends the build configurations of all fragments matched by the 'include' globs of the builds node. """
+        if not isinstance(raw, dict) or not isinstance(raw.get(builds_node), dict):
+            return
+
+        node = raw[builds_node]
+        patterns = node.pop("include", None) or list()
+        if isinstance(patterns, str):
+            patterns = [patterns]
+
+        if patterns and not base_dir:
+            # globs can not be expanded on a remote location, and resolving them locally would pick up unrelated files
+            raise ValueError("'include' is only supported in config files read from disk, not over http")
+
+        build_configurations = node.setdefault("build_configurations", list())
+        for pattern in patterns:
+            matches = sorted(glob.glob(os.path.join(base_dir, expanduser(pattern))))
+            if not matches:
+                logging.warning("Include '%s' did not match any file", pattern)
+
+            for path in matches:
+                content = ResourceReader.read_from_file(path)
+                if not content:
+                    raise ValueError(f"could not read included file {path}")
+
+                fragment = ResourceReader.parse_yaml(content, path, cache_path)
+                # a fragment is either a plain list or a mapping with build_configurations
+                if isinstance(fragment, dict):
+                    fragment = fragment.get("build_configurations")
+                if not isinstance(fragment, list):
+                    raise ValueError(f"included file {path} does not contain build configurations")
+                build_configurations.extend(fragment)
+
+    @staticmethod
+    def read_from_resource(resource: str, cache_path=None) -> Optional[str]:
         if resource:
             if resource.startswith("http"):
-                return ResourceReader.read_from_http(resource)
+                return ResourceReader.read_from_http(resource, cache_path)
 
             logging.info("Trying to read config from %s", resource)
             return ResourceReader.read_from_file(resource)
@@ -55,13 +153,30 @@ class ResourceReader:
         return None
 
     @staticmethod
-    @backoff.on_exception(backoff.expo,
-                        (requests.exceptions.Timeout, requests.exceptions.ConnectionError), 
-                        max_tries=4)
     @backoff.on_predicate(backoff.expo, max_tries=3)
-    def read_from_http(url: str):
-        r = requests.get(url)
+    def read_from_http(url: str, cache_path=None):
+        cache_file = None
+        cached = None
+        headers = dict()
+        if cache_path:
+            cache_file = _get_cache_file(cache_path, url, ".http.json")
+            cached = _read_json(cache_file)
+            if cached and cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached and cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        # connection errors and timeouts are retried by the client
+        r = get_client().get(url, headers=headers)
+        if r.status_code == 304 and cached:
+            logging.info("Config at %s not modified", url)
+            return cached["content"]
+
         if r.ok:
-            return r.content
+            etag = r.headers.get("ETag")
+            last_modified = r.headers.get("Last-Modified")
+            if cache_file and (etag or last_modified):
+                _write_json(cache_file, {"etag": etag, "last_modified": last_modified, "content": r.text})
+            return r.text
 
         return None
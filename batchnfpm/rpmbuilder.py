@@ -1,19 +1,41 @@
 import os
+import time
 import subprocess
 import logging
-import configargparse
+import threading
 
-from packaging.version import Version
+from concurrent.futures import ThreadPoolExecutor
 
-from batchnfpm.gitwrapper import GitWrapper
+from packaging.version import Version, InvalidVersion
+
+from batchnfpm.gitwrapper import GitWrapper, DEFAULT_TAG_WORKERS
+from batchnfpm.buildcache import BuildCache
+from batchnfpm.buildlog import BuildLog
+from batchnfpm.projectbuild import ProjectBuild, ArchBuild
+from batchnfpm.pipeline import Pipeline
+from batchnfpm.metrics import Tracer, Span, wait
+from batchnfpm.statestore import StateStore, RESULT_SUCCESS, RESULT_FAILED, RESULT_CURRENT
 from batchnfpm.rpmrepository import RpmRepository
+from batchnfpm.rpmmetadata import RepoMetadata
+from batchnfpm.scheduler import Scheduler, MEGABYTE
 from batchnfpm.config import BuildConfig, Build, NfpmConfig, Config
 
 NFPM_VERSION_ENV_VAR = "NFPM_APP_VERSION"
 
+DECISION_BUILD = "build"
+# the remote package repository already contains the tag
+DECISION_CURRENT = "current"
+# a previous run already handled the tag
+DECISION_DONE = "done"
+DECISION_NO_RELEASE = "no-release"
+DECISION_ERROR = "error"
+
+# marks that the packaged version has not been looked up yet
+_UNKNOWN = object()
+
 
 class PackageBuilder:
-    def __init__(self, conf: Config, git_wrapper: GitWrapper, rpm_repo=None):
+    def __init__(self, conf: Config, git_wrapper: GitWrapper, rpm_repo=None, deb_repo=None, build_cache: BuildCache = None, state_store: StateStore = None, tracer: Tracer = None):
         if not conf:
             raise ValueError("No config provided")
         self.conf = conf
@@ -27,27 +49,60 @@ class PackageBuilder:
         else:
             logging.info("Using '%s' as remote package repository", rpm_repo)
         self.rpm_repo = rpm_repo
+
+        if deb_repo:
+            logging.info("Using '%s' as remote deb package repository", deb_repo)
+        self.deb_repo = deb_repo
+        self.build_cache = build_cache
+        self.state_store = state_store
+        if not tracer:
+            tracer = Tracer()
+        self.tracer = tracer
         self.throw_error = False
         self.debug = False
+        # the nfpm config repository is fetched once and indexed, see _get_nfpm_configs
+        self._nfpm_configs = None
+        self._nfpm_configs_lock = threading.Lock()
+        # a project is never built twice at the same time, e.g. by the serve loop and a webhook
+        self._project_locks = dict()
+        self._project_locks_lock = threading.Lock()
+        # runs of the serve loop and webhooks may finish at the same time
+        self._repodata_lock = threading.Lock()
 
-    def _find_nfpm_config(self, nfpm_config: NfpmConfig, build_config: BuildConfig, project_dir: str) -> str:
-        owner = build_config.owner
-        project = build_config.project
-        path = nfpm_config.local_path
+    @staticmethod
+    def _index_nfpm_configs(path: str) -> dict:
+        index = dict()
+        for root, dirs, files in os.walk(path):
+            # skip .git and friends
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for filename in files:
+                file_path = os.path.join(root, filename)
+                index[os.path.relpath(file_path, path)] = file_path
+        return index
 
-        if nfpm_config.fetch_resource:
-            GitWrapper.checkout(nfpm_config.fetch_resource, nfpm_config.local_path)
-        
-        config_file_locations = list()
-        config_file_locations.append(os.path.join(path, build_config.host, owner, project, build_config.config_file))
-        config_file_locations.append(os.path.join(project_dir, "nfpm.yaml"))
+    def _get_nfpm_configs(self) -> dict:
+        with self._nfpm_configs_lock:
+            if self._nfpm_configs is None:
+                nfpm_config = self.conf.nfpm_config
+                if nfpm_config.fetch_resource:
+                    GitWrapper.checkout(nfpm_config.fetch_resource, nfpm_config.local_path)
+                self._nfpm_configs = PackageBuilder._index_nfpm_configs(nfpm_config.local_path)
+                logging.info("Indexed %d files in nfpm config directory %s", len(self._nfpm_configs), nfpm_config.local_path)
+            return self._nfpm_configs
 
-        for candidate in config_file_locations:
-            if not os.path.exists(candidate):
-                logging.warning("No nfpm config file found at %s", candidate)
-            else:
-                logging.info("Found nfpm config file %s", candidate)
-                return candidate
+    def _find_nfpm_config(self, build_config: BuildConfig, project_dir: str) -> str:
+        key = os.path.join(build_config.host, build_config.owner, build_config.project, build_config.config_file)
+        candidate = self._get_nfpm_configs().get(key)
+        if candidate:
+            logging.info("Found nfpm config file %s", candidate)
+            return candidate
+        logging.warning("No nfpm config file found at %s", os.path.join(self.conf.nfpm_config.local_path, key))
+
+        candidate = os.path.join(project_dir, "nfpm.yaml")
+        if os.path.exists(candidate):
+            logging.info("Found nfpm config file %s", candidate)
+            return candidate
+        logging.warning("No nfpm config file found at %s", candidate)
 
         return None
 
@@ -55,17 +110,42 @@ class PackageBuilder:
         if self.throw_error is True and return_code != 0:
             raise Exception("Command returned exit code %d", return_code)
 
-    def _compile_project(self, build: Build, working_dir: str) -> bool:
+    @staticmethod
+    def _run(cmd: list, working_dir: str, env: dict, build_log: BuildLog = None, span: Span = None) -> int:
+        if build_log:
+            return build_log.run(cmd, working_dir, env, span)
+
+        p = subprocess.Popen(cmd, cwd=working_dir, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL, env=env)
+        return wait(p, span)
+
+    @staticmethod
+    def _report_failure(build_log: BuildLog, message: str, *args):
+        if not build_log:
+            logging.error(message, *args)
+            return
+
+        tail = "\n".join(f"  | {line}" for line in build_log.tail())
+        logging.error(message + ", last lines of %s:\n%s", *args, build_log.path, tail)
+
+    def _open_build_log(self, build_config: BuildConfig, build: Build) -> BuildLog:
+        # named like the worktrees, several builds of a project may share an arch
+        index = next(index for index, candidate in enumerate(build_config.builds) if candidate is build)
+        return BuildLog(os.path.join(self.conf.get_log_path(), build_config.name, f"{index}-{build.arch}.log"))
+
+    def _compile_project(self, build: Build, working_dir: str, build_log: BuildLog = None, span: Span = None) -> bool:
         try:
             for cmd in build.buildsteps:
                 logging.info("Executing build command '%s' for arch %s", cmd, build.arch)
                 
                 env = self._get_custom_env(build.env)
-                logging.info("Using custom env %s", str(env))
+                logging.info("Using custom env %s", str(build.env))
 
-                p = subprocess.Popen(cmd, cwd=working_dir, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL, env=env)
-                exitcode = p.wait()
-                self._evaluate_exitcode(exitcode)
+                exitcode = PackageBuilder._run(cmd, working_dir, env, build_log, span)
+                if exitcode != 0:
+                    PackageBuilder._report_failure(build_log, "Build command '%s' for arch %s returned exit code %d", cmd, build.arch, exitcode)
+                    self._evaluate_exitcode(exitcode)
+                    # a failed step fails the build even without throw_error, so it is neither cached nor recorded as success
+                    return False
         except Exception as err:
             logging.error("Could not build repo: %s", err)
             return False
@@ -78,33 +158,152 @@ class PackageBuilder:
             custom_env[key] = str(env[key])
         return custom_env
 
-    def _compile_and_package(self, working_dir: str, build_config: BuildConfig, version: str) -> bool:
-        nfpm_config = self._find_nfpm_config(self.conf.nfpm_config, build_config, working_dir)
+    def _build_arch(self, arch: ArchBuild) -> bool:
+        if self.restore(arch):
+            return True
+        try:
+            return self.compile(arch) and self.package(arch)
+        finally:
+            arch.close()
+
+    def _build_archs(self, archs: list) -> bool:
+        if len(archs) == 1:
+            return self._build_arch(archs[0])
+
+        with ThreadPoolExecutor(max_workers=len(archs), thread_name_prefix=threading.current_thread().name) as executor:
+            results = list(executor.map(self._build_arch, archs))
+        return all(results)
+
+    @staticmethod
+    def _relocate(path: str, working_dir: str, worktree: str) -> str:
+        # files from the project itself have to be taken from the arch's worktree
+        path, working_dir = os.path.abspath(path), os.path.abspath(working_dir)
+        if os.path.commonpath([path, working_dir]) == working_dir:
+            return os.path.join(worktree, os.path.relpath(path, working_dir))
+        return path
+
+    def _get_cache_key(self, arch: ArchBuild) -> tuple:
+        """ Returns the build cache key and the package paths of an arch, (None, None) without build cache. """
+        if not self.build_cache:
+            return None, None
+
+        build_config = arch.build_config
+        package_paths = [self._get_package_file_path(build_config, arch.version, arch.build.arch, package_format) for package_format in build_config.get_formats()]
+        commit = GitWrapper.get_head_commit(arch.working_dir)
+        return BuildCache.get_key(commit, arch.build, arch.nfpm_config, arch.version, [os.path.basename(path) for path in package_paths]), package_paths
+
+    def needs_build(self, build_config: BuildConfig, git_tag: str, tracer: Tracer = None) -> bool:
+        """ Decides about git_tag, records projects that are current and returns whether a build is needed. """
+        decision, _ = self.decide(build_config, git_tag, tracer=tracer)
+        if DECISION_NO_RELEASE == decision:
+            logging.warning("No release found for %s/%s", build_config.owner, build_config.project)
+            return False
+
+        if DECISION_DONE == decision:
+            logging.info("Git tag %s was already handled by a previous run", git_tag)
+            return False
+
+        if DECISION_CURRENT == decision:
+            logging.info("Not building package for git tag %s", git_tag)
+            self.record_state(build_config, git_tag, RESULT_CURRENT)
+            return False
+
+        return True
+
+    def prepare(self, project: ProjectBuild, build_index=None) -> bool:
+        """ Checks out the project and sets up its archs, only the build at build_index if given. Hold the project lock while calling. """
+        build_config = project.build_config
+        self._get_nfpm_configs()
+        with project.tracer.span("clone", build_config.name):
+            project.working_dir = self.git_wrapper.checkout_build_config(build_config, project.git_tag)
+            project.commit = GitWrapper.get_head_commit(project.working_dir)
+
+        nfpm_config = self._find_nfpm_config(build_config, project.working_dir)
         if not nfpm_config or not os.path.isfile(nfpm_config):
-            logging.error(f"No nfpm file '%s' defined for %s/%s", nfpm_config, build_config.owner, build_config.project)
+            logging.error("No nfpm file '%s' defined for %s/%s", nfpm_config, build_config.owner, build_config.project)
             return False
 
-        for build in build_config.builds:
-            build_success = self._compile_project(build, working_dir)
-            if not build_success:
-                return False
+        version = PackageBuilder._get_normalized_version(project.git_tag)
+        builds = build_config.builds
+        if build_index is not None:
+            project.archs = [ArchBuild(build_config, build_index, builds[build_index], nfpm_config, version, project.working_dir, project.tracer)]
+            return True
+        if len(builds) == 1:
+            project.archs = [ArchBuild(build_config, 0, builds[0], nfpm_config, version, project.working_dir, project.tracer)]
+            return True
 
-            version = PackageBuilder._get_normalized_version(version)
-            self._build_package(build_config, build.arch, nfpm_config, version, working_dir)
-        
+        # every arch is built in its own worktree so they can run at the same time without sharing outputs
+        for index, build in enumerate(builds):
+            worktree_path = self.git_wrapper.get_local_worktree_path(build_config.owner, build_config.project, f"{index}-{build.arch}")
+            worktree = GitWrapper.add_worktree(project.working_dir, worktree_path)
+            project.worktrees.append(worktree)
+            arch_nfpm_config = PackageBuilder._relocate(nfpm_config, project.working_dir, worktree)
+            project.archs.append(ArchBuild(build_config, index, build, arch_nfpm_config, version, worktree, project.tracer))
         return True
 
-    def _build_package(self, build_config: BuildConfig, arch: str, nfpm_config: str, version: str, working_dir):
-        for package_format in build_config.get_formats():
-            package_path = self._get_package_file_path(build_config, version, arch, package_format)
+    def restore(self, arch: ArchBuild) -> bool:
+        """ Restores the packages of an arch from the build cache, returns whether they were found. """
+        arch.cache_key, arch.package_paths = self._get_cache_key(arch)
+        if arch.cache_key and self.build_cache.restore(arch.cache_key, arch.package_paths):
+            logging.info("Restored packages for arch %s from build cache", arch.build.arch)
+            return True
+        return False
 
-            # dynamically set the version
-            os.environ[NFPM_VERSION_ENV_VAR] = version
-            os.environ["MY_APP_VERSION"] = version
-            
-            package_cmd = ["nfpm", "-f", nfpm_config, "pkg", "-t", package_path]
-            p = subprocess.Popen(package_cmd, cwd=working_dir, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
-            p.wait()
+    def compile(self, arch: ArchBuild) -> bool:
+        """ Runs the build steps of an arch, logging their output to the arch's build log. """
+        arch.build_log = self._open_build_log(arch.build_config, arch.build)
+        with arch.tracer.span("compile", arch.build_config.name, arch.build.arch) as span:
+            return self._compile_project(arch.build, arch.working_dir, arch.build_log, span)
+
+    def package(self, arch: ArchBuild) -> bool:
+        """ Packages a compiled arch and stores the packages in the build cache. """
+        with arch.tracer.span("package", arch.build_config.name, arch.build.arch) as span:
+            success = self._build_package(arch.build_config, arch.build.arch, arch.nfpm_config, arch.version, arch.working_dir, arch.build_log, span)
+        if success and arch.cache_key:
+            self.build_cache.store(arch.cache_key, arch.package_paths)
+        return success
+
+    def finish(self, project: ProjectBuild, success: bool):
+        """ Removes the worktrees of the project and records the result of its build. """
+        build_config = project.build_config
+        try:
+            for worktree in project.worktrees:
+                GitWrapper.remove_worktree(project.working_dir, worktree)
+        finally:
+            result = RESULT_SUCCESS if success else RESULT_FAILED
+            artifacts = self.get_package_paths(build_config, project.git_tag) if success else None
+            self.record_state(build_config, project.git_tag, result, project.commit, artifacts, time.monotonic() - project.start, PackageBuilder._get_peak_rss(build_config, project.tracer))
+
+    @staticmethod
+    def _get_package_env(version: str, arch: str) -> dict:
+        # every nfpm process gets its own environment, os.environ is never modified
+        env = os.environ.copy()
+        env[NFPM_VERSION_ENV_VAR] = version
+        env["MY_APP_VERSION"] = version
+        env["ARCH"] = arch
+        return env
+
+    def _package_format(self, build_config: BuildConfig, arch: str, nfpm_config: str, version: str, working_dir: str, package_format: str, build_log: BuildLog = None, span: Span = None) -> bool:
+        package_path = self._get_package_file_path(build_config, version, arch, package_format)
+        logging.info("Packaging %s for arch %s", package_path, arch)
+
+        package_cmd = ["nfpm", "-f", nfpm_config, "pkg", "-t", package_path]
+        env = PackageBuilder._get_package_env(version, arch)
+        exitcode = PackageBuilder._run(package_cmd, working_dir, env, build_log, span)
+        if exitcode != 0:
+            PackageBuilder._report_failure(build_log, "Packaging %s failed with exit code %d", package_path, exitcode)
+        self._evaluate_exitcode(exitcode)
+        return exitcode == 0
+
+    def _build_package(self, build_config: BuildConfig, arch: str, nfpm_config: str, version: str, working_dir, build_log: BuildLog = None, span: Span = None) -> bool:
+        formats = build_config.get_formats()
+        if len(formats) == 1:
+            return self._package_format(build_config, arch, nfpm_config, version, working_dir, formats[0], build_log, span)
+
+        # the formats only read the compiled artifacts, so all of them are packaged at once
+        with ThreadPoolExecutor(max_workers=len(formats), thread_name_prefix=threading.current_thread().name) as executor:
+            futures = [executor.submit(self._package_format, build_config, arch, nfpm_config, version, working_dir, package_format, build_log, span) for package_format in formats]
+        return all(future.result() for future in futures)
 
     @staticmethod
     def _get_target_filename(project: str, package_type: str, arch: str, version=None) -> str:
@@ -125,7 +324,7 @@ class PackageBuilder:
         package_path = os.path.join(self.conf.artifacts_path, package_format)
         if not os.path.isdir(package_path):
             logging.info("Creating non-existing directory %s", package_path)
-            os.mkdir(package_path)
+            os.makedirs(package_path, exist_ok=True)
 
         package_filename = PackageBuilder._get_target_filename(build_config.project, package_format, arch, version)
         return os.path.join(package_path, package_filename)
@@ -147,22 +346,200 @@ class PackageBuilder:
         return Version(git_tag) > Version(package_version)
 
     def _get_packaged_version(self, build_config: BuildConfig):
+        lookups = dict()
         if self.rpm_repo:
-            return self.rpm_repo.get_rpm_version(build_config.owner)
-        return None
+            lookups["rpm"] = self.rpm_repo.get_rpm_version
+        if self.deb_repo:
+            lookups["deb"] = self.deb_repo.get_deb_version
 
-    def build_packages(self):
-        for build_config in self.conf.buildconfigs:
-            logging.info("Checking build %s", build_config)
-            git_tag = GitWrapper.get_latest_release_tag(build_config)
-            if not git_tag:
-                logging.warning("No release found for %s/%s", build_config.owner, build_config.project)
-            else:
+        versions = list()
+        for package_format in build_config.get_formats():
+            # formats without a remote repository can not be compared and are ignored
+            if package_format in lookups:
+                version = lookups[package_format](build_config.project)
+                if not version:
+                    logging.info("No %s package for %s found in remote repository", package_format, build_config.project)
+                    return None
+                versions.append(version)
+
+        if not versions:
+            return None
+
+        # the most outdated format decides whether the project needs to be built
+        try:
+            return min(versions, key=Version)
+        except InvalidVersion:
+            return versions[0]
+
+    def decide(self, build_config: BuildConfig, git_tag: str, package_version=_UNKNOWN, tracer: Tracer = None) -> tuple:
+        """ Returns what to do about git_tag and the packaged version that decision is based on. """
+        known_version = None if package_version is _UNKNOWN else package_version
+        if not git_tag:
+            return DECISION_NO_RELEASE, known_version
+
+        if self.conf.force:
+            return DECISION_BUILD, known_version
+
+        # decide locally first so unchanged runs never need to load a remote package repository
+        if self.state_store and self.state_store.is_up_to_date(build_config.name, git_tag):
+            return DECISION_DONE, known_version
+
+        if package_version is _UNKNOWN:
+            if not tracer:
+                tracer = self.tracer
+            with tracer.span("repo", build_config.name):
                 package_version = self._get_packaged_version(build_config)
-                
-                if self.conf.force or self._is_git_tag_newer(git_tag, package_version):
-                    logging.info("Building package from git tag %s", git_tag)
-                    working_dir = self.git_wrapper.checkout_build_config(build_config, git_tag)
-                    self._compile_and_package(working_dir, build_config, version=git_tag)
-                else:
-                    logging.info("Not building package for git tag %s", git_tag)
+        if not self._is_git_tag_newer(git_tag, package_version):
+            return DECISION_CURRENT, package_version
+        return DECISION_BUILD, package_version
+
+    def _build_project(self, build_config: BuildConfig, git_tag: str, tracer: Tracer) -> bool:
+        logging.info("Checking build %s", build_config)
+        if not self.needs_build(build_config, git_tag, tracer):
+            return True
+
+        logging.info("Building package from git tag %s", git_tag)
+        project = ProjectBuild(build_config, git_tag, tracer)
+        success = False
+        try:
+            success = self.prepare(project) and self._build_archs(project.archs)
+            return success
+        finally:
+            self.finish(project, success)
+
+    def build_arch(self, build_config: BuildConfig, git_tag: str, build_index: int, tracer: Tracer = None) -> bool:
+        """ Builds the packages of a single build of a project, used by distributed workers. """
+        if not 0 <= build_index < len(build_config.builds):
+            logging.error("%s has no build %d", build_config.name, build_index)
+            return False
+        arch = build_config.builds[build_index].arch
+        if not tracer:
+            tracer = self.tracer
+        threading.current_thread().name = f"{build_config.name}/{build_index}-{arch}"
+
+        try:
+            # all archs of a project share its checkout
+            with self.get_project_lock(build_config):
+                project = ProjectBuild(build_config, git_tag, tracer)
+                return self.prepare(project, build_index) and self._build_arch(project.archs[0])
+        except Exception as err:
+            logging.error("Building %s for arch %s failed: %s", build_config.name, arch, err)
+            return False
+
+    def get_package_paths(self, build_config: BuildConfig, version: str) -> list:
+        version = PackageBuilder._get_normalized_version(version)
+        return [self._get_package_file_path(build_config, version, build.arch, package_format) for build in build_config.builds for package_format in build_config.get_formats()]
+
+    @staticmethod
+    def _get_peak_rss(build_config: BuildConfig, tracer: Tracer) -> int:
+        # the archs are built at the same time, so their peaks add up
+        peaks = dict()
+        for span in tracer.spans:
+            if span.project == build_config.name and span.arch:
+                peaks[span.arch] = max(peaks.get(span.arch, 0), span.max_rss_bytes)
+        return sum(peaks.values()) or None
+
+    def record_state(self, build_config: BuildConfig, git_tag: str, result: str, commit=None, artifacts=None, duration=None, peak_rss=None):
+        if not self.state_store:
+            return
+
+        try:
+            self.state_store.record(build_config.name, git_tag, result, commit, artifacts, duration, peak_rss)
+        except Exception as err:
+            logging.warning("Could not record state of %s: %s", build_config.name, err)
+
+    def get_project_lock(self, build_config: BuildConfig) -> threading.Lock:
+        with self._project_locks_lock:
+            return self._project_locks.setdefault(build_config.name, threading.Lock())
+
+    def _build_project_guarded(self, build_config: BuildConfig, git_tag: str, tracer: Tracer) -> bool:
+        # name the worker after the project so interleaved log lines can be told apart
+        threading.current_thread().name = build_config.name
+        try:
+            with self.get_project_lock(build_config):
+                return self._build_project(build_config, git_tag, tracer)
+        except Exception as err:
+            logging.error("Building %s failed: %s", build_config.name, err)
+            return False
+
+    def refresh(self):
+        """ Makes long-running builders pick up changes of the nfpm configs and package repositories. """
+        with self._nfpm_configs_lock:
+            self._nfpm_configs = None
+        for repo in (self.rpm_repo, self.deb_repo):
+            if repo:
+                repo.refresh()
+
+    def build_packages(self, build_configs=None, tags=None, tracer: Tracer = None) -> dict:
+        """ Builds the given (by default all configured) projects and returns a dict of project name to success. """
+        if build_configs is None:
+            build_configs = self.conf.buildconfigs
+        # concurrent callers pass their own tracer instead of sharing the builder's
+        if not tracer:
+            tracer = self.tracer
+
+        with tracer.span("run"):
+            with tracer.span("nfpm_configs"):
+                self._get_nfpm_configs()
+
+            if tags is None:
+                logging.info("Checking for new releases of %d projects", len(build_configs))
+                with tracer.span("tags"):
+                    tags = self.git_wrapper.get_latest_release_tags(build_configs, tracer=tracer)
+
+            jobs = max(1, self.conf.jobs)
+            logging.info("Building %d projects using %d jobs", len(build_configs), jobs)
+
+            history = self.state_store.get_history() if self.state_store else None
+            scheduler = Scheduler(jobs, self.conf.memory_budget * MEGABYTE, history)
+            if self.conf.pipeline:
+                results = Pipeline(self, scheduler, self.conf.fetch_workers, self.conf.package_workers, tracer).run(build_configs, tags)
+            else:
+                results = scheduler.run(build_configs, lambda build_config: self._build_project_guarded(build_config, tags.get(build_config), tracer))
+
+            if self.conf.generate_repodata:
+                with tracer.span("repodata"):
+                    self.update_repodata()
+
+            failed = [name for name, success in results.items() if not success]
+            if failed:
+                logging.error("Failed to build %d of %d projects: %s", len(failed), len(results), ", ".join(failed))
+            return results
+
+    def update_repodata(self):
+        """ Adds new rpms in the artifacts path to its repository metadata, only reading packages that changed. """
+        path = os.path.join(self.conf.artifacts_path, "rpm")
+        try:
+            with self._repodata_lock:
+                RepoMetadata(path, self.conf.cache_path, self.conf.repodata_retention).update()
+        except Exception as err:
+            logging.error("Could not update repository metadata of %s: %s", path, err)
+
+    def plan(self) -> list:
+        """ Decides for every configured project whether it would be built, without cloning or compiling anything. """
+        build_configs = self.conf.buildconfigs
+        if not build_configs:
+            return list()
+
+        # the remote package repositories are loaded while the releases are being resolved
+        workers = max(1, min(DEFAULT_TAG_WORKERS, len(build_configs)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="repo") as executor:
+            versions = {build_config.name: executor.submit(self._get_packaged_version, build_config) for build_config in build_configs}
+            tags = self.git_wrapper.get_latest_release_tags(build_configs, tracer=self.tracer)
+
+        plan = list()
+        for build_config in build_configs:
+            git_tag = tags.get(build_config)
+            try:
+                decision, package_version = self.decide(build_config, git_tag, versions[build_config.name].result())
+            except Exception as err:
+                logging.error("Could not plan %s: %s", build_config.name, err)
+                decision, package_version = DECISION_ERROR, None
+
+            plan.append({
+                "project": build_config.name,
+                "packaged_version": package_version,
+                "tag": git_tag,
+                "decision": decision,
+            })
+        return plan
@@ -0,0 +1,483 @@
+import io
+import os
+import re
+import gzip
+import json
+import stat
+import time
+import struct
+import hashlib
+import logging
+
+from functools import cmp_to_key
+from typing import Optional
+from xml.sax.saxutils import escape, quoteattr
+
+from batchnfpm.rpmrepository import rpm_evrcmp
+
+REPODATA_DIR = "repodata"
+# newest versions kept per package name and arch, 0 keeps all of them
+DEFAULT_RETENTION = 3
+# newest changelog entries written to other.xml, like createrepo
+CHANGELOG_LIMIT = 10
+
+_LEAD_SIZE = 96
+_LEAD_MAGIC = b"\xed\xab\xee\xdb"
+_HEADER_MAGIC = b"\x8e\xad\xe8\x01"
+
+# header tags, see rpmtag.h
+TAG_NAME = 1000
+TAG_VERSION = 1001
+TAG_RELEASE = 1002
+TAG_EPOCH = 1003
+TAG_SUMMARY = 1004
+TAG_DESCRIPTION = 1005
+TAG_BUILDTIME = 1006
+TAG_BUILDHOST = 1007
+TAG_SIZE = 1009
+TAG_VENDOR = 1011
+TAG_LICENSE = 1014
+TAG_PACKAGER = 1015
+TAG_GROUP = 1016
+TAG_URL = 1020
+TAG_ARCH = 1022
+TAG_OLDFILENAMES = 1027
+TAG_FILEMODES = 1030
+TAG_FILEFLAGS = 1037
+TAG_SOURCERPM = 1044
+TAG_ARCHIVESIZE = 1046
+TAG_PROVIDENAME = 1047
+TAG_REQUIREFLAGS = 1048
+TAG_REQUIRENAME = 1049
+TAG_REQUIREVERSION = 1050
+TAG_CONFLICTFLAGS = 1053
+TAG_CONFLICTNAME = 1054
+TAG_CONFLICTVERSION = 1055
+TAG_CHANGELOGTIME = 1080
+TAG_CHANGELOGNAME = 1081
+TAG_CHANGELOGTEXT = 1082
+TAG_OBSOLETENAME = 1090
+TAG_PROVIDEFLAGS = 1112
+TAG_PROVIDEVERSION = 1113
+TAG_OBSOLETEFLAGS = 1114
+TAG_OBSOLETEVERSION = 1115
+TAG_DIRINDEXES = 1116
+TAG_BASENAMES = 1117
+TAG_DIRNAMES = 1118
+SIGTAG_PAYLOADSIZE = 1007
+
+_TYPE_CHAR = 1
+_TYPE_INT8 = 2
+_TYPE_INT16 = 3
+_TYPE_INT32 = 4
+_TYPE_INT64 = 5
+_TYPE_STRING = 6
+_TYPE_BIN = 7
+_TYPE_STRING_ARRAY = 8
+_TYPE_I18NSTRING = 9
+_INT_FORMATS = {_TYPE_INT16: "H", _TYPE_INT32: "I", _TYPE_INT64: "Q"}
+
+_FILEFLAG_GHOST = 1 << 6
+_SENSE_FLAGS = {2: "LT", 4: "GT", 8: "EQ", 10: "LE", 12: "GE"}
+# prerequisites of scriptlets, marked pre="1" like createrepo does
+_SENSE_PRE = (1 << 6) | (1 << 9) | (1 << 10)
+
+# primary.xml only lists the files dependencies usually point at
+_PRIMARY_FILES = re.compile(r"^(/etc/|.*bin/|/usr/lib/sendmail$)")
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+NS_COMMON = "http://linux.duke.edu/metadata/common"
+NS_RPM = "http://linux.duke.edu/metadata/rpm"
+NS_FILELISTS = "http://linux.duke.edu/metadata/filelists"
+NS_OTHER = "http://linux.duke.edu/metadata/other"
+NS_REPO = "http://linux.duke.edu/metadata/repo"
+
+METADATA_TYPES = ["primary", "filelists", "other"]
+_METADATA_ROOTS = {
+    "primary": f'<metadata xmlns="{NS_COMMON}" xmlns:rpm="{NS_RPM}" packages="%d">',
+    "filelists": f'<filelists xmlns="{NS_FILELISTS}" packages="%d">',
+    "other": f'<otherdata xmlns="{NS_OTHER}" packages="%d">',
+}
+
+
+def _gzip(content: bytes) -> bytes:
+    # a fixed mtime makes unchanged metadata compress to identical files, gzip.compress only accepts it since 3.8
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) as compressed:
+        compressed.write(content)
+    return buffer.getvalue()
+
+
+class _HashingReader:
+    """ Reads a file sequentially while hashing everything that was read. """
+
+    def __init__(self, opened):
+        self._opened = opened
+        self.sha256 = hashlib.sha256()
+        self.position = 0
+
+    def read(self, size: int) -> bytes:
+        data = self._opened.read(size)
+        if len(data) != size:
+            raise ValueError("unexpected end of file")
+        self.sha256.update(data)
+        self.position += size
+        return data
+
+    def drain(self) -> str:
+        for chunk in iter(lambda: self._opened.read(1024 * 1024), b""):
+            self.sha256.update(chunk)
+        return self.sha256.hexdigest()
+
+
+def _read_header(reader: _HashingReader) -> dict:
+    """ Reads a header structure and returns its entries as tag to value. """
+    intro = reader.read(16)
+    if intro[:4] != _HEADER_MAGIC:
+        raise ValueError("not an rpm header")
+    count, size = struct.unpack(">II", intro[8:])
+    index = reader.read(count * 16)
+    store = reader.read(size)
+
+    entries = dict()
+    for position in range(0, len(index), 16):
+        tag, data_type, offset, length = struct.unpack(">IIII", index[position:position + 16])
+        if data_type == _TYPE_STRING:
+            entries[tag] = store[offset:store.index(b"\0", offset)].decode("utf-8", "replace")
+        elif data_type in (_TYPE_STRING_ARRAY, _TYPE_I18NSTRING):
+            values = list()
+            for _ in range(length):
+                end = store.index(b"\0", offset)
+                values.append(store[offset:end].decode("utf-8", "replace"))
+                offset = end + 1
+            # translated strings only hold the C locale here
+            entries[tag] = values[0] if data_type == _TYPE_I18NSTRING else values
+        elif data_type in _INT_FORMATS:
+            item = _INT_FORMATS[data_type]
+            entries[tag] = list(struct.unpack_from(f">{length}{item}", store, offset))
+        elif data_type in (_TYPE_CHAR, _TYPE_INT8):
+            entries[tag] = list(store[offset:offset + length])
+        elif data_type == _TYPE_BIN:
+            entries[tag] = store[offset:offset + length]
+    return entries
+
+
+def read_rpm(path: str) -> dict:
+    """ Reads the headers of an rpm file and hashes it in a single pass, without extracting the payload. """
+    with open(path, "rb") as opened:
+        reader = _HashingReader(opened)
+        if reader.read(_LEAD_SIZE)[:4] != _LEAD_MAGIC:
+            raise ValueError(f"{path} is not an rpm file")
+
+        signature = _read_header(reader)
+        # the signature is padded to a multiple of 8 bytes
+        reader.read(-reader.position % 8)
+        start = reader.position
+        header = _read_header(reader)
+        end = reader.position
+        checksum = reader.drain()
+
+    return {"signature": signature, "header": header, "header_range": (start, end), "checksum": checksum}
+
+
+def _first(header: dict, tag: int, default=None):
+    value = header.get(tag)
+    if isinstance(value, list):
+        return value[0] if value else default
+    return default if value is None else value
+
+
+def _text(value) -> str:
+    return escape(_INVALID_XML.sub("", str(value if value is not None else "")))
+
+
+def _attr(value) -> str:
+    return quoteattr(_INVALID_XML.sub("", str(value if value is not None else "")))
+
+
+def _split_evr(evr: str):
+    epoch, _, rest = evr.rpartition(":")
+    version, _, release = rest.partition("-")
+    return epoch or "0", version, release or None
+
+
+def _get_files(header: dict) -> list:
+    """ Returns (path, type) of all files, type is None, "dir" or "ghost". """
+    if TAG_BASENAMES in header:
+        dirnames = header.get(TAG_DIRNAMES, list())
+        paths = [dirnames[index] + name for index, name in zip(header.get(TAG_DIRINDEXES, list()), header[TAG_BASENAMES])]
+    else:
+        paths = header.get(TAG_OLDFILENAMES, list())
+
+    modes = header.get(TAG_FILEMODES, list())
+    flags = header.get(TAG_FILEFLAGS, list())
+    files = list()
+    for index, path in enumerate(paths):
+        file_type = None
+        if index < len(modes) and stat.S_ISDIR(modes[index]):
+            file_type = "dir"
+        elif index < len(flags) and flags[index] & _FILEFLAG_GHOST:
+            file_type = "ghost"
+        files.append((path, file_type))
+    return files
+
+
+def _format_file(path: str, file_type) -> str:
+    if file_type:
+        return f"<file type={_attr(file_type)}>{_text(path)}</file>"
+    return f"<file>{_text(path)}</file>"
+
+
+def _format_dependencies(header: dict, element: str, name_tag: int, flags_tag: int, version_tag: int) -> str:
+    names = header.get(name_tag)
+    if not names:
+        return ""
+
+    flags = header.get(flags_tag) or [0] * len(names)
+    versions = header.get(version_tag) or [""] * len(names)
+    entries = list()
+    for name, flag, version in zip(names, flags, versions):
+        # rpmlib() requirements are satisfied by rpm itself
+        if name.startswith("rpmlib("):
+            continue
+
+        entry = f"<rpm:entry name={_attr(name)}"
+        sense = _SENSE_FLAGS.get(flag & 0xf)
+        if sense and version:
+            epoch, ver, rel = _split_evr(version)
+            entry += f" flags={_attr(sense)} epoch={_attr(epoch)} ver={_attr(ver)}"
+            if rel:
+                entry += f" rel={_attr(rel)}"
+        if element == "requires" and flag & _SENSE_PRE:
+            entry += ' pre="1"'
+        entries.append(entry + "/>")
+
+    if not entries:
+        return ""
+    return f"<rpm:{element}>{''.join(entries)}</rpm:{element}>"
+
+
+def get_package(path: str, location: str) -> dict:
+    """ Reads an rpm and renders its entries of primary.xml, filelists.xml and other.xml. """
+    rpm = read_rpm(path)
+    header, signature = rpm["header"], rpm["signature"]
+    name, arch = _first(header, TAG_NAME), _first(header, TAG_ARCH)
+    if not name or not arch:
+        raise ValueError(f"{path} has no name or arch")
+
+    epoch = str(_first(header, TAG_EPOCH, 0))
+    version, release = _first(header, TAG_VERSION, ""), _first(header, TAG_RELEASE, "")
+    checksum = rpm["checksum"]
+    version_element = f"<version epoch={_attr(epoch)} ver={_attr(version)} rel={_attr(release)}/>"
+    files = _get_files(header)
+    file_stat = os.stat(path)
+
+    archive_size = _first(signature, SIGTAG_PAYLOADSIZE, _first(header, TAG_ARCHIVESIZE, 0))
+    start, end = rpm["header_range"]
+    primary = "".join([
+        '<package type="rpm">',
+        f"<name>{_text(name)}</name><arch>{_text(arch)}</arch>{version_element}",
+        f'<checksum type="sha256" pkgid="YES">{checksum}</checksum>',
+        f"<summary>{_text(_first(header, TAG_SUMMARY))}</summary>",
+        f"<description>{_text(_first(header, TAG_DESCRIPTION))}</description>",
+        f"<packager>{_text(_first(header, TAG_PACKAGER))}</packager>",
+        f"<url>{_text(_first(header, TAG_URL))}</url>",
+        f'<time file="{int(file_stat.st_mtime)}" build="{_first(header, TAG_BUILDTIME, 0)}"/>',
+        f'<size package="{file_stat.st_size}" installed="{_first(header, TAG_SIZE, 0)}" archive="{archive_size}"/>',
+        f"<location href={_attr(location)}/>",
+        "<format>",
+        f"<rpm:license>{_text(_first(header, TAG_LICENSE))}</rpm:license>",
+        f"<rpm:vendor>{_text(_first(header, TAG_VENDOR))}</rpm:vendor>",
+        f"<rpm:group>{_text(_first(header, TAG_GROUP))}</rpm:group>",
+        f"<rpm:buildhost>{_text(_first(header, TAG_BUILDHOST))}</rpm:buildhost>",
+        f"<rpm:sourcerpm>{_text(_first(header, TAG_SOURCERPM))}</rpm:sourcerpm>",
+        f'<rpm:header-range start="{start}" end="{end}"/>',
+        _format_dependencies(header, "provides", TAG_PROVIDENAME, TAG_PROVIDEFLAGS, TAG_PROVIDEVERSION),
+        _format_dependencies(header, "requires", TAG_REQUIRENAME, TAG_REQUIREFLAGS, TAG_REQUIREVERSION),
+        _format_dependencies(header, "conflicts", TAG_CONFLICTNAME, TAG_CONFLICTFLAGS, TAG_CONFLICTVERSION),
+        _format_dependencies(header, "obsoletes", TAG_OBSOLETENAME, TAG_OBSOLETEFLAGS, TAG_OBSOLETEVERSION),
+        "".join(_format_file(path, file_type) for path, file_type in files if _PRIMARY_FILES.match(path)),
+        "</format></package>",
+    ])
+
+    package_attrs = f"pkgid={_attr(checksum)} name={_attr(name)} arch={_attr(arch)}"
+    filelists = f"<package {package_attrs}>{version_element}{''.join(_format_file(path, file_type) for path, file_type in files)}</package>"
+
+    changelogs = list(zip(header.get(TAG_CHANGELOGTIME, list()), header.get(TAG_CHANGELOGNAME, list()), header.get(TAG_CHANGELOGTEXT, list())))
+    changelog = "".join(f"<changelog author={_attr(author)} date=\"{date}\">{_text(text)}</changelog>" for date, author, text in changelogs[:CHANGELOG_LIMIT])
+    other = f"<package {package_attrs}>{version_element}{changelog}</package>"
+
+    return {
+        "name": name,
+        "arch": arch,
+        "evr": [epoch, version, release],
+        "size": file_stat.st_size,
+        "mtime_ns": file_stat.st_mtime_ns,
+        "primary": primary,
+        "filelists": filelists,
+        "other": other,
+    }
+
+
+class RepoMetadata:
+    """ Maintains the repodata of a directory of rpms, only reading packages that were added or changed since the last update. """
+
+    def __init__(self, path: str, cache_path=None, retention=DEFAULT_RETENTION):
+        if not path:
+            raise ValueError("path must be set")
+        self.path = path
+
+        if retention < 0:
+            raise ValueError("retention must not be negative")
+        self.retention = retention
+
+        # the rendered packages are kept outside of the published directory
+        self.state_file = None
+        if cache_path:
+            name = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+            self.state_file = os.path.join(cache_path, REPODATA_DIR, f"{name}.json")
+
+    def _load_state(self) -> dict:
+        if not self.state_file:
+            return dict()
+        try:
+            with open(self.state_file, "r") as opened:
+                return json.load(opened).get("packages", dict())
+        except FileNotFoundError:
+            return dict()
+        except Exception as err:
+            logging.warning("Ignoring unreadable repodata state %s: %s", self.state_file, err)
+            return dict()
+
+    def _save_state(self, packages: dict):
+        if not self.state_file:
+            return
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, "w") as opened:
+            json.dump({"path": self.path, "packages": packages}, opened)
+        os.replace(tmp_path, self.state_file)
+
+    def _scan(self, packages: dict) -> tuple:
+        """ Returns the current packages and whether anything changed, reading only new or modified files. """
+        current = dict()
+        changed = False
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".rpm") or not entry.is_file():
+                    continue
+
+                known = packages.get(entry.name)
+                entry_stat = entry.stat()
+                if known and known["size"] == entry_stat.st_size and known["mtime_ns"] == entry_stat.st_mtime_ns:
+                    current[entry.name] = known
+                    continue
+
+                try:
+                    current[entry.name] = get_package(entry.path, entry.name)
+                    logging.info("Added %s to repository metadata", entry.name)
+                except Exception as err:
+                    logging.error("Could not read rpm %s: %s", entry.path, err)
+                    continue
+                changed = True
+
+        return current, changed or set(current) != set(packages)
+
+    def _prune(self, packages: dict) -> bool:
+        """ Deletes all but the newest retention versions of every package name and arch. """
+        if not self.retention:
+            return False
+
+        versions = dict()
+        for filename, package in packages.items():
+            versions.setdefault((package["name"], package["arch"]), list()).append(filename)
+
+        pruned = False
+        for filenames in versions.values():
+            if len(filenames) <= self.retention:
+                continue
+
+            ordered = sorted(filenames, key=cmp_to_key(lambda a, b: rpm_evrcmp(packages[b]["evr"], packages[a]["evr"])))
+            for filename in ordered[self.retention:]:
+                logging.info("Removing superseded package %s", filename)
+                del packages[filename]
+                try:
+                    os.remove(os.path.join(self.path, filename))
+                except FileNotFoundError:
+                    pass
+                pruned = True
+        return pruned
+
+    @staticmethod
+    def _write_metadata(directory: str, metadata_type: str, packages: list) -> dict:
+        content = "".join([
+            '<?xml version="1.0" encoding="UTF-8"?>\n',
+            _METADATA_ROOTS[metadata_type] % len(packages),
+            "".join(package[metadata_type] for package in packages),
+            _METADATA_ROOTS[metadata_type].split(" ", 1)[0].replace("<", "</") + ">\n",
+        ]).encode()
+        compressed = _gzip(content)
+        checksum = hashlib.sha256(compressed).hexdigest()
+        filename = f"{checksum}-{metadata_type}.xml.gz"
+        file_path = os.path.join(directory, filename)
+        if not os.path.isfile(file_path):
+            with open(f"{file_path}.tmp", "wb") as opened:
+                opened.write(compressed)
+            os.replace(f"{file_path}.tmp", file_path)
+
+        return {
+            "type": metadata_type,
+            "checksum": checksum,
+            "open_checksum": hashlib.sha256(content).hexdigest(),
+            "href": f"{REPODATA_DIR}/{filename}",
+            "size": len(compressed),
+            "open_size": len(content),
+        }
+
+    def _write(self, packages: dict):
+        directory = os.path.join(self.path, REPODATA_DIR)
+        os.makedirs(directory, exist_ok=True)
+        ordered = [packages[filename] for filename in sorted(packages)]
+        written = [RepoMetadata._write_metadata(directory, metadata_type, ordered) for metadata_type in METADATA_TYPES]
+
+        now = int(time.time())
+        repomd = [f'<?xml version="1.0" encoding="UTF-8"?>\n<repomd xmlns="{NS_REPO}" xmlns:rpm="{NS_RPM}">', f"<revision>{now}</revision>"]
+        for data in written:
+            repomd.append("".join([
+                f'<data type="{data["type"]}">',
+                f'<checksum type="sha256">{data["checksum"]}</checksum>',
+                f'<open-checksum type="sha256">{data["open_checksum"]}</open-checksum>',
+                f'<location href="{data["href"]}"/>',
+                f"<timestamp>{now}</timestamp>",
+                f'<size>{data["size"]}</size>',
+                f'<open-size>{data["open_size"]}</open-size>',
+                "</data>",
+            ]))
+        repomd.append("</repomd>\n")
+
+        # clients either see the previous or the new repomd.xml, never a partial one
+        repomd_path = os.path.join(directory, "repomd.xml")
+        with open(f"{repomd_path}.tmp", "w") as opened:
+            opened.write("\n".join(repomd))
+        os.replace(f"{repomd_path}.tmp", repomd_path)
+
+        referenced = {os.path.basename(data["href"]) for data in written}
+        for filename in os.listdir(directory):
+            if filename not in referenced and any(filename.endswith(f"-{metadata_type}.xml.gz") for metadata_type in METADATA_TYPES):
+                os.remove(os.path.join(directory, filename))
+
+    def update(self) -> Optional[bool]:
+        """ Brings the repodata up to date with the rpms in path, returns whether it had to be rewritten. """
+        if not os.path.isdir(self.path):
+            return None
+
+        packages, changed = self._scan(self._load_state())
+        changed = self._prune(packages) or changed
+        if not changed and os.path.isfile(os.path.join(self.path, REPODATA_DIR, "repomd.xml")):
+            logging.info("Repository metadata of %s is up to date", self.path)
+            return False
+
+        self._write(packages)
+        self._save_state(packages)
+        logging.info("Wrote repository metadata for %d packages to %s", len(packages), self.path)
+        return True
@@ -1,17 +1,176 @@
-import repomd
+import os
+import re
+import logging
+import threading
+
+from typing import Optional
+from urllib.parse import urljoin
+from xml.etree import ElementTree
+
+from batchnfpm.indexcache import IndexCache, open_compressed
+from batchnfpm.httpclient import get_client
+
+REPO_NS = "{http://linux.duke.edu/metadata/repo}"
+COMMON_NS = "{http://linux.duke.edu/metadata/common}"
+
+_RPM_SEGMENT = re.compile(r"~|\^|[a-zA-Z]+|[0-9]+")
+
+
+def rpm_vercmp(a: str, b: str) -> int:
+    """ Compares two rpm version or release strings like rpmvercmp, returns -1, 0 or 1. """
+    if a == b:
+        return 0
+
+    a_segments = _RPM_SEGMENT.findall(a or "")
+    b_segments = _RPM_SEGMENT.findall(b or "")
+    for i in range(max(len(a_segments), len(b_segments)) + 1):
+        a_seg = a_segments[i] if i < len(a_segments) else None
+        b_seg = b_segments[i] if i < len(b_segments) else None
+
+        # a tilde sorts before everything, even the end of the version
+        if "~" in (a_seg, b_seg):
+            if a_seg != "~":
+                return 1
+            if b_seg != "~":
+                return -1
+            continue
+
+        # a caret sorts after the end of the version but before everything else
+        if "^" in (a_seg, b_seg):
+            if a_seg is None:
+                return -1
+            if b_seg is None:
+                return 1
+            if a_seg != "^":
+                return 1
+            if b_seg != "^":
+                return -1
+            continue
+
+        if a_seg is None and b_seg is None:
+            return 0
+        if a_seg is None:
+            return -1
+        if b_seg is None:
+            return 1
+
+        if a_seg.isdigit() != b_seg.isdigit():
+            # numeric segments are always newer than alphabetic ones
+            return 1 if a_seg.isdigit() else -1
+
+        if a_seg.isdigit():
+            a_seg, b_seg = int(a_seg), int(b_seg)
+        if a_seg != b_seg:
+            return 1 if a_seg > b_seg else -1
+
+    return 0
+
+
+def rpm_evrcmp(a: list, b: list) -> int:
+    """ Compares two [epoch, version, release] lists. """
+    a_epoch, b_epoch = int(a[0] or 0), int(b[0] or 0)
+    if a_epoch != b_epoch:
+        return 1 if a_epoch > b_epoch else -1
+
+    return rpm_vercmp(a[1], b[1]) or rpm_vercmp(a[2], b[2])
+
 
 class RpmRepository:
-    def __init__(self, rpm_repo):
+    def __init__(self, rpm_repo, cache_path=None):
         if not rpm_repo:
             raise ValueError("No repo given")
-        self._load_repo(rpm_repo)
 
-    def _load_repo(self, rpm_repo: str):
-        self.rpm_repo = repomd.load(rpm_repo)
+        # urljoin drops the last path segment unless the base url ends with a slash
+        self.url = rpm_repo if rpm_repo.endswith("/") else f"{rpm_repo}/"
+        self.index_cache = None
+        if cache_path:
+            self.index_cache = IndexCache(os.path.join(cache_path, "rpm"))
+        # loaded on first use, runs that decide everything locally never download it
+        self._index = None
+        self._revision = None
+        self._stale = False
+        self._index_lock = threading.Lock()
+
+    def __repr__(self):
+        return self.url
+
+    @staticmethod
+    def _parse_repomd(content: bytes):
+        """ Returns the location of the primary metadata and a revision that changes with it. """
+        root = ElementTree.fromstring(content)
+        revision = root.findtext(f"{REPO_NS}revision") or ""
+        for data in root.iter(f"{REPO_NS}data"):
+            if data.get("type") == "primary":
+                href = data.find(f"{REPO_NS}location").get("href")
+                checksum = data.findtext(f"{REPO_NS}checksum") or ""
+                return href, f"{revision}:{checksum}"
+
+        raise ValueError("repomd.xml does not reference primary metadata")
+
+    @staticmethod
+    def _index_primary(stream) -> dict:
+        """ Parses primary.xml incrementally and keeps only the latest [epoch, version, release] per name. """
+        index = dict()
+        root = None
+        for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+            if root is None:
+                root = element
+            if event != "end" or element.tag != f"{COMMON_NS}package":
+                continue
+
+            name = element.findtext(f"{COMMON_NS}name")
+            version = element.find(f"{COMMON_NS}version")
+            if name and version is not None:
+                evr = [version.get("epoch", "0"), version.get("ver"), version.get("rel")]
+                if name not in index or rpm_evrcmp(evr, index[name]) > 0:
+                    index[name] = evr
+
+            # drop parsed packages so memory stays bounded by the index
+            root.clear()
+
+        return index
+
+    def _load_repo(self):
+        repomd_url = urljoin(self.url, "repodata/repomd.xml")
+        response = get_client().get(repomd_url)
+        response.raise_for_status()
+        primary_href, revision = RpmRepository._parse_repomd(response.content)
+        if self._index is not None and revision == self._revision:
+            return
+
+        if self.index_cache:
+            index = self.index_cache.get(self.url, revision)
+            if index is not None:
+                self._index, self._revision = index, revision
+                return
+
+        primary_url = urljoin(self.url, primary_href)
+        logging.info("Loading package metadata from %s", primary_url)
+        with get_client().get(primary_url, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            self._index = RpmRepository._index_primary(open_compressed(response.raw, primary_href))
+        self._revision = revision
+        logging.info("Indexed %d packages of %s", len(self._index), self.url)
+
+        if self.index_cache:
+            self.index_cache.put(self.url, revision, self._index)
+
+    def _get_index(self) -> dict:
+        with self._index_lock:
+            if self._index is None or self._stale:
+                self._load_repo()
+                self._stale = False
+            return self._index
+
+    def refresh(self):
+        """ Makes the next lookup revalidate the loaded index against the repository's current metadata. """
+        with self._index_lock:
+            self._stale = True
 
-    def get_rpm_version(self, name: str) -> str:
-        package = self.rpm_repo.find(name)
-        if not package:
+    def get_rpm_version(self, name: str) -> Optional[str]:
+        evr = self._get_index().get(name)
+        if not evr:
             return None
 
-        return package.version
\ No newline at end of file
+        return evr[1]
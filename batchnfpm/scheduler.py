@@ -0,0 +1,105 @@
+import logging
+import statistics
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from batchnfpm.config import BuildConfig
+
+MEGABYTE = 1024 * 1024
+
+
+class Scheduler:
+    """ Runs builds longest-first based on previous runs, admitting them only while CPU slots and memory budget allow. """
+
+    def __init__(self, slots: int, memory_budget=0, history=None):
+        if slots < 1:
+            raise ValueError("slots must be at least 1")
+        self.slots = slots
+
+        if memory_budget < 0:
+            raise ValueError("memory_budget must not be negative")
+        # in bytes, 0 disables the memory limit
+        self.memory_budget = memory_budget
+
+        # project name to (duration in seconds, peak rss in bytes) of its last build
+        self.history = history or dict()
+        # projects without history are assumed to be typical
+        self._default_duration = Scheduler._median(duration for duration, _ in self.history.values())
+        self._default_memory = Scheduler._median(memory for _, memory in self.history.values())
+
+        self._changed = threading.Condition()
+        self._running = 0
+        self._memory = 0
+
+    @staticmethod
+    def _median(values) -> float:
+        values = [value for value in values if value]
+        if not values:
+            return 0
+        return statistics.median(values)
+
+    def estimate(self, build_config: BuildConfig) -> tuple:
+        duration, memory = self.history.get(build_config.name, (None, None))
+        return duration or self._default_duration, memory or self._default_memory
+
+    def order(self, build_configs: list) -> list:
+        """ Sorts longest processing time first, the stable sort keeps the config order for ties. """
+        return sorted(build_configs, key=lambda build_config: self.estimate(build_config)[0], reverse=True)
+
+    def _fits(self, memory: float, used: float, running: int) -> bool:
+        if running >= self.slots:
+            return False
+        # a job larger than the whole budget still runs, but only on its own
+        return not self.memory_budget or running == 0 or used + memory <= self.memory_budget
+
+    def _acquire(self, memory: float):
+        # callers hold self._changed
+        self._running += 1
+        self._memory += memory
+
+    def _release(self, memory: float):
+        with self._changed:
+            self._running -= 1
+            self._memory -= memory
+            self._changed.notify_all()
+
+    @contextmanager
+    def admit(self, memory: float):
+        """ Blocks until a slot is free and memory fits the budget, holding both while the context is active. """
+        with self._changed:
+            while not self._fits(memory, self._memory, self._running):
+                self._changed.wait()
+            self._acquire(memory)
+        try:
+            yield
+        finally:
+            self._release(memory)
+
+    def run(self, build_configs: list, build) -> dict:
+        """ Calls build(build_config) for all build_configs and returns a dict of project name to its result. """
+        pending = self.order(build_configs)
+        futures = dict()
+
+        def release(memory):
+            return lambda _: self._release(memory)
+
+        with ThreadPoolExecutor(max_workers=self.slots) as executor:
+            with self._changed:
+                while pending:
+                    # the longest job that fits is started, smaller ones fill up what is left of the budget
+                    admitted = next((build_config for build_config in pending if self._fits(self.estimate(build_config)[1], self._memory, self._running)), None)
+                    if not admitted:
+                        self._changed.wait()
+                        continue
+
+                    pending.remove(admitted)
+                    memory = self.estimate(admitted)[1]
+                    self._acquire(memory)
+                    logging.debug("Starting %s, %d running using %d MB", admitted.name, self._running, self._memory // MEGABYTE)
+                    future = executor.submit(build, admitted)
+                    futures[admitted.name] = future
+                    future.add_done_callback(release(memory))
+
+        return {build_config.name: futures[build_config.name].result() for build_config in build_configs}
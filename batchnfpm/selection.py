@@ -0,0 +1,33 @@
+import hashlib
+
+from fnmatch import fnmatchcase
+
+
+def get_shard(name: str, shard_count: int) -> int:
+    """ Returns the shard a project belongs to, stable across processes, hosts and config order. """
+    return int(hashlib.sha1(name.encode()).hexdigest(), 16) % shard_count
+
+
+def _matches(name: str, patterns: list) -> bool:
+    return any(fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def select_build_configs(build_configs: list, only=None, exclude=None, shard_index=0, shard_count=1) -> list:
+    """ Filters build_configs by glob patterns on their 'hoster/owner/project' name and keeps only the given shard. """
+    if shard_count < 1:
+        raise ValueError("shard_count must be at least 1")
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"shard_index must be between 0 and {shard_count - 1}")
+
+    selected = list()
+    for build_config in build_configs:
+        name = build_config.name
+        if only and not _matches(name, only):
+            continue
+        if exclude and _matches(name, exclude):
+            continue
+        if shard_count > 1 and get_shard(name, shard_count) != shard_index:
+            continue
+        selected.append(build_config)
+
+    return selected
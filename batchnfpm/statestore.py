@@ -0,0 +1,87 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from typing import Optional
+
+STATE_FILE_NAME = "state.db"
+
+RESULT_SUCCESS = "success"
+RESULT_FAILED = "failed"
+# the remote package repository already contained the tag, nothing was built
+RESULT_CURRENT = "current"
+
+_COLUMNS = ["name", "tag", "commit_id", "artifacts", "result", "duration", "updated", "peak_rss"]
+
+
+class StateStore:
+    """ Remembers the outcome of the last run of every project in a local SQLite database. """
+
+    def __init__(self, cache_path: str):
+        if not cache_path:
+            raise ValueError("cache_path must be set")
+
+        os.makedirs(cache_path, exist_ok=True)
+        self.path = os.path.join(cache_path, STATE_FILE_NAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS projects ("
+                "name TEXT PRIMARY KEY, tag TEXT, commit_id TEXT, artifacts TEXT, "
+                "result TEXT, duration REAL, updated REAL)"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(projects)")]
+            if "peak_rss" not in columns:
+                self._conn.execute("ALTER TABLE projects ADD COLUMN peak_rss INTEGER")
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        state = dict(zip(_COLUMNS, row))
+        state["artifacts"] = json.loads(state["artifacts"] or "[]")
+        return state
+
+    def get(self, name: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM projects WHERE name = ?", (name,)).fetchone()
+        if not row:
+            return None
+        return StateStore._to_dict(row)
+
+    def get_all(self) -> list:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM projects ORDER BY name").fetchall()
+        return [StateStore._to_dict(row) for row in rows]
+
+    def record(self, name: str, tag: str, result: str, commit_id=None, artifacts=None, duration=None, peak_rss=None):
+        values = (name, tag, commit_id, json.dumps(artifacts or list()), result, duration, time.time(), peak_rss)
+        # runs that did not build keep the duration and memory of the last build, the scheduler relies on them
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO projects ({', '.join(_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET tag = excluded.tag, commit_id = excluded.commit_id, artifacts = excluded.artifacts, "
+                "result = excluded.result, duration = COALESCE(excluded.duration, duration), updated = excluded.updated, "
+                "peak_rss = COALESCE(excluded.peak_rss, peak_rss)",
+                values,
+            )
+
+    def get_history(self) -> dict:
+        """ Returns the duration and peak memory of the last build of every project as name to (seconds, bytes). """
+        with self._lock:
+            rows = self._conn.execute("SELECT name, duration, peak_rss FROM projects").fetchall()
+        return {name: (duration, peak_rss) for name, duration, peak_rss in rows}
+
+    def is_up_to_date(self, name: str, tag: str) -> bool:
+        state = self.get(name)
+        if not state or state["tag"] != tag:
+            return False
+
+        if state["result"] == RESULT_CURRENT:
+            return True
+        return state["result"] == RESULT_SUCCESS and all(os.path.isfile(path) for path in state["artifacts"])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,228 @@
+import hmac
+import json
+import time
+import hashlib
+import logging
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from batchnfpm.config import BuildConfig, Hoster, GITHUB_SECRET_ENV_VAR, GITLAB_TOKEN_ENV_VAR
+from batchnfpm.gitwrapper import GitWrapper
+from batchnfpm.metrics import Tracer
+from batchnfpm.rpmbuilder import PackageBuilder
+
+# in seconds, events for the same project arriving within this window trigger a single build
+DEFAULT_DEBOUNCE = 5
+MAX_BODY_SIZE = 5 * 1024 * 1024
+
+TAG_REF_PREFIX = "refs/tags/"
+
+
+def parse_address(address: str) -> tuple:
+    """ Parses 'host:port' or ':port' into a tuple accepted by the HTTP server. """
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"invalid listen address '{address}', expected host:port")
+    return host or "0.0.0.0", int(port)
+
+
+def _strip_tag_ref(ref: str) -> Optional[str]:
+    if ref and ref.startswith(TAG_REF_PREFIX):
+        return ref[len(TAG_REF_PREFIX):]
+    return None
+
+
+def _split_path(path: str) -> tuple:
+    # gitlab projects may live in nested groups, the owner is everything but the last segment
+    owner, _, project = (path or "").rpartition("/")
+    return owner, project
+
+
+def parse_github_event(event: str, payload: dict) -> Optional[tuple]:
+    """ Returns (owner, project, tag) of a GitHub release or tag push event, None for all other events. """
+    full_name = payload.get("repository", {}).get("full_name")
+    tag = None
+    if "release" == event and payload.get("action") in ("published", "released"):
+        release = payload.get("release", {})
+        # the releases api never returns drafts and pre-releases as the latest release, neither do webhooks
+        if not release.get("draft") and not release.get("prerelease"):
+            tag = release.get("tag_name")
+    elif "push" == event and not payload.get("deleted"):
+        tag = _strip_tag_ref(payload.get("ref"))
+    elif "create" == event and "tag" == payload.get("ref_type"):
+        tag = payload.get("ref")
+
+    if not tag or not full_name:
+        return None
+    owner, project = _split_path(full_name)
+    return owner, project, tag
+
+
+def parse_gitlab_event(event: str, payload: dict) -> Optional[tuple]:
+    """ Returns (owner, project, tag) of a GitLab release or tag push event, None for all other events. """
+    path = payload.get("project", {}).get("path_with_namespace")
+    tag = None
+    if "Release Hook" == event and payload.get("action") in ("create", None):
+        tag = payload.get("tag")
+    elif "Tag Push Hook" == event and payload.get("checkout_sha"):
+        # deleting a tag sends a tag push without checkout_sha
+        tag = _strip_tag_ref(payload.get("ref"))
+
+    if not tag or not path:
+        return None
+    owner, project = _split_path(path)
+    return owner, project, tag
+
+
+def verify_github_signature(secret: str, body: bytes, signature: str) -> bool:
+    if not secret or not signature:
+        return False
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def verify_gitlab_token(secret: str, token: str) -> bool:
+    if not secret or not token:
+        return False
+    return hmac.compare_digest(secret.encode(), token.encode())
+
+
+class WebhookReceiver:
+    """ Accepts GitHub and GitLab release webhooks and builds the single project and tag they announce. """
+
+    def __init__(self, builder: PackageBuilder, address: tuple, github_secret=None, gitlab_token=None, debounce=DEFAULT_DEBOUNCE):
+        if not builder:
+            raise ValueError("No builder provided")
+        self.builder = builder
+
+        if not github_secret and not gitlab_token:
+            raise ValueError(f"neither {GITHUB_SECRET_ENV_VAR} nor {GITLAB_TOKEN_ENV_VAR} is set, refusing to accept unauthenticated webhooks")
+        self.github_secret = github_secret
+        self.gitlab_token = gitlab_token
+        self.debounce = debounce
+
+        self._build_configs = {WebhookReceiver._get_key(build_config.hoster, build_config.owner, build_config.project): build_config for build_config in builder.conf.buildconfigs}
+        # project name to (build_config, tag, time the build is due)
+        self._pending = dict()
+        self._pending_changed = threading.Condition()
+        self._stopped = False
+
+        self.server = ThreadingHTTPServer(address, self._create_handler())
+        self.server.daemon_threads = True
+
+    @staticmethod
+    def _get_key(hoster: Hoster, owner: str, project: str) -> tuple:
+        return hoster, owner.lower(), project.lower()
+
+    def find_build_config(self, hoster: Hoster, owner: str, project: str) -> Optional[BuildConfig]:
+        return self._build_configs.get(WebhookReceiver._get_key(hoster, owner, project))
+
+    def enqueue(self, build_config: BuildConfig, tag: str, now=None):
+        """ Queues a build of tag, replacing a pending build of the same project and restarting its debounce window. """
+        if now is None:
+            now = time.monotonic()
+        with self._pending_changed:
+            self._pending[build_config.name] = (build_config, tag, now + self.debounce)
+            self._pending_changed.notify()
+
+    def take_due(self, now=None) -> list:
+        """ Removes and returns the pending (build_config, tag) tuples whose debounce window has passed. """
+        if now is None:
+            now = time.monotonic()
+        with self._pending_changed:
+            due = [name for name, (_, _, due_at) in self._pending.items() if due_at <= now]
+            return [self._pending.pop(name)[:2] for name in due]
+
+    def _get_timeout(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        return max(0.0, min(due_at for _, _, due_at in self._pending.values()) - time.monotonic())
+
+    def _work(self):
+        while True:
+            with self._pending_changed:
+                while not self._stopped and (not self._pending or self._get_timeout() > 0):
+                    self._pending_changed.wait(self._get_timeout())
+                if self._stopped:
+                    return
+
+            due = self.take_due()
+            if not due:
+                continue
+
+            tags = {build_config: tag for build_config, tag in due}
+            logging.info("Building %d projects announced by webhooks", len(tags))
+            try:
+                self.builder.build_packages(list(tags), tags, tracer=Tracer())
+            except Exception as err:
+                logging.error("Webhook build failed: %s", err)
+
+    def handle(self, headers, body: bytes) -> int:
+        """ Authenticates and processes a webhook request, returns the HTTP status to respond with. """
+        if "X-GitHub-Event" in headers:
+            if not verify_github_signature(self.github_secret, body, headers.get("X-Hub-Signature-256")):
+                return 401
+            hoster, event, parse = Hoster.GITHUB, headers["X-GitHub-Event"], parse_github_event
+        elif "X-Gitlab-Event" in headers:
+            if not verify_gitlab_token(self.gitlab_token, headers.get("X-Gitlab-Token")):
+                return 401
+            hoster, event, parse = Hoster.GITLAB, headers["X-Gitlab-Event"], parse_gitlab_event
+        else:
+            return 400
+
+        try:
+            parsed = parse(event, json.loads(body))
+        except (ValueError, AttributeError) as err:
+            logging.warning("Could not parse %s webhook: %s", hoster.value.lower(), err)
+            return 400
+
+        if not parsed:
+            logging.debug("Ignoring %s event '%s'", hoster.value.lower(), event)
+            return 204
+
+        owner, project, tag = parsed
+        build_config = self.find_build_config(hoster, owner, project)
+        if not build_config:
+            logging.info("Ignoring webhook for unknown project %s/%s", owner, project)
+            return 404
+
+        if not GitWrapper.is_release_tag(tag, build_config.tag_include, build_config.tag_exclude):
+            logging.info("Ignoring tag %s of %s announced by webhook, it is filtered or a pre-release", tag, build_config.name)
+            return 204
+
+        logging.info("Webhook announced tag %s of %s", tag, build_config.name)
+        self.enqueue(build_config, tag)
+        return 202
+
+    def _create_handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logging.debug("Webhook request: " + format, *args)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_BODY_SIZE:
+                    status = 413
+                else:
+                    status = receiver.handle(self.headers, self.rfile.read(length))
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        return Handler
+
+    def start(self):
+        logging.info("Listening for webhooks on %s:%d", *self.server.server_address[:2])
+        threading.Thread(target=self.server.serve_forever, name="webhook", daemon=True).start()
+        threading.Thread(target=self._work, name="webhook-builds", daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self._pending_changed:
+            self._stopped = True
+            self._pending_changed.notify()
@@ -0,0 +1,159 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+
+from typing import Optional
+
+QUEUE_FILE_NAME = "queue.db"
+# in seconds, a worker that did not heartbeat for this long is considered dead
+DEFAULT_LEASE_SECONDS = 300
+# a job that lost its lease this often is given up instead of being requeued again
+MAX_ATTEMPTS = 3
+
+STATE_QUEUED = "queued"
+STATE_LEASED = "leased"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+_COLUMNS = ["id", "project", "tag", "build_index", "arch", "state", "worker", "lease_expires", "attempts", "updated"]
+
+
+class WorkQueue:
+    """ A queue of (project, tag, arch) build jobs in a SQLite database that several processes lease jobs from. """
+
+    def __init__(self, path: str):
+        if not path:
+            raise ValueError("path must be set")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # no WAL: the database is meant to live on a shared volume, where WAL's shared memory does not work
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._transaction(WorkQueue._create_table)
+
+    @staticmethod
+    def _create_table(cursor):
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(jobs)").fetchall()]
+        if columns and "build_index" not in columns:
+            # jobs used to be keyed by arch, which merges builds sharing an arch. the next coordinator run queues them again
+            logging.warning("Dropping jobs of an older queue format")
+            cursor.execute("DROP TABLE jobs")
+
+        # a project may have several builds for the same arch, so jobs are keyed by the index of the build
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, project TEXT NOT NULL, tag TEXT NOT NULL, build_index INTEGER NOT NULL, arch TEXT NOT NULL, "
+            "state TEXT NOT NULL, worker TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, updated REAL, "
+            "UNIQUE (project, tag, build_index))"
+        )
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        return dict(zip(_COLUMNS, row))
+
+    def _transaction(self, statements):
+        """ Runs statements(cursor) in a write transaction that is exclusive across processes. """
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(cursor)
+                cursor.execute("COMMIT")
+                return result
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, project: str, tag: str, build_index: int, arch: str, force=False) -> bool:
+        """ Queues a job, returns False if it is already queued, running or done. Failed jobs, and done jobs if forced, are queued again. """
+        requeued = [STATE_FAILED, STATE_DONE] if force else [STATE_FAILED]
+
+        def statements(cursor):
+            now = time.time()
+            cursor.execute(
+                "INSERT OR IGNORE INTO jobs (project, tag, build_index, arch, state, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                (project, tag, build_index, arch, STATE_QUEUED, now),
+            )
+            if cursor.rowcount:
+                return True
+            cursor.execute(
+                "UPDATE jobs SET arch = ?, state = ?, worker = NULL, lease_expires = NULL, attempts = 0, updated = ? WHERE project = ? AND tag = ? AND build_index = ? AND state IN (" + ", ".join("?" * len(requeued)) + ")",
+                (arch, STATE_QUEUED, now, project, tag, build_index, *requeued),
+            )
+            return cursor.rowcount > 0
+
+        return self._transaction(statements)
+
+    @staticmethod
+    def _requeue_expired(cursor, now: float):
+        cursor.execute("UPDATE jobs SET state = ?, updated = ? WHERE state = ? AND lease_expires < ? AND attempts >= ?", (STATE_FAILED, now, STATE_LEASED, now, MAX_ATTEMPTS))
+        cursor.execute("UPDATE jobs SET state = ?, worker = NULL, lease_expires = NULL, updated = ? WHERE state = ? AND lease_expires < ?", (STATE_QUEUED, now, STATE_LEASED, now))
+
+    def requeue_expired(self):
+        """ Puts jobs whose worker stopped heartbeating back into the queue. """
+        self._transaction(lambda cursor: WorkQueue._requeue_expired(cursor, time.time()))
+
+    def lease(self, worker: str, lease_seconds=DEFAULT_LEASE_SECONDS) -> Optional[dict]:
+        """ Hands the oldest queued job to worker for lease_seconds, None if the queue is empty. """
+        def statements(cursor):
+            now = time.time()
+            WorkQueue._requeue_expired(cursor, now)
+            row = cursor.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE state = ? ORDER BY id LIMIT 1", (STATE_QUEUED,)).fetchone()
+            if not row:
+                return None
+
+            job = WorkQueue._to_dict(row)
+            cursor.execute(
+                "UPDATE jobs SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (STATE_LEASED, worker, now + lease_seconds, now, job["id"]),
+            )
+            job.update(state=STATE_LEASED, worker=worker, lease_expires=now + lease_seconds, attempts=job["attempts"] + 1)
+            return job
+
+        return self._transaction(statements)
+
+    def heartbeat(self, job_id: int, worker: str, lease_seconds=DEFAULT_LEASE_SECONDS) -> bool:
+        """ Extends the lease, returns False if the job was taken away from worker in the meantime. """
+        def statements(cursor):
+            now = time.time()
+            cursor.execute("UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND worker = ? AND state = ?", (now + lease_seconds, now, job_id, worker, STATE_LEASED))
+            return cursor.rowcount > 0
+
+        return self._transaction(statements)
+
+    def complete(self, job_id: int, worker: str, success: bool) -> bool:
+        def statements(cursor):
+            state = STATE_DONE if success else STATE_FAILED
+            cursor.execute("UPDATE jobs SET state = ?, lease_expires = NULL, updated = ? WHERE id = ? AND worker = ? AND state = ?", (state, time.time(), job_id, worker, STATE_LEASED))
+            return cursor.rowcount > 0
+
+        return self._transaction(statements)
+
+    def get_jobs(self, project=None, tag=None) -> list:
+        query = f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+        conditions, values = list(), list()
+        if project:
+            conditions.append("project = ?")
+            values.append(project)
+        if tag:
+            conditions.append("tag = ?")
+            values.append(tag)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id", values).fetchall()
+        return [WorkQueue._to_dict(row) for row in rows]
+
+    def count_unfinished(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE state IN (?, ?)", (STATE_QUEUED, STATE_LEASED)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,275 @@
+"""
+Offline end-to-end benchmark of PackageBuilder.build_packages.
+
+Generates synthetic projects as local bare git repositories, serves fake GitHub and
+GitLab release APIs as well as a fake DNF repository from a local HTTP server and puts
+a stub nfpm on the PATH. Every combination of project count and job count is run
+against fresh clone, artifact and cache directories.
+
+    PYTHONPATH=. python3 benchmarks/bench_build_packages.py --projects 10,50 --jobs 1,4,8
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+import threading
+import subprocess
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from batchnfpm.config import Config, BuildConfig, NfpmConfig
+from batchnfpm.gitwrapper import GitWrapper
+from batchnfpm.metrics import Tracer
+from batchnfpm.releasecache import ReleaseCache
+from batchnfpm.rpmbuilder import PackageBuilder
+from batchnfpm.rpmrepository import RpmRepository
+
+OWNER = "bench"
+TAG = "v1.1.0"
+PHASES = ["tags", "repo", "clone", "compile", "package"]
+
+STUB_NFPM = """#!/bin/sh
+# stub nfpm: answers --help and writes a dummy package to the target given with -t
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -t) target="$2"; shift ;;
+    esac
+    shift
+done
+[ -n "$target" ] && echo "$ARCH $NFPM_APP_VERSION" > "$target"
+exit 0
+"""
+
+BUILD_SCRIPT = """#!/bin/sh
+sleep {compile_seconds}
+echo "$GOARCH" > build.out
+"""
+
+
+def _git(cwd: str, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME="bench", GIT_AUTHOR_EMAIL="bench@localhost", GIT_COMMITTER_NAME="bench", GIT_COMMITTER_EMAIL="bench@localhost")
+    subprocess.run(["git", *args], cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _project_name(index: int) -> str:
+    return f"project{index:04d}"
+
+
+def _hoster(index: int) -> str:
+    return "github" if index % 2 == 0 else "gitlab"
+
+
+class Fixture:
+    """ Everything that is shared between scenarios: upstream repos, nfpm configs, stub nfpm and the fake APIs. """
+
+    def __init__(self, root: str, max_projects: int, compile_seconds: float, current_ratio: float, latency: float):
+        self.root = root
+        self.latency = latency
+        self.current = {_project_name(i) for i in range(max_projects) if i < max_projects * current_ratio}
+        self._create_stub_nfpm()
+        self._create_upstreams(max_projects, compile_seconds)
+        self._create_nfpm_configs(max_projects)
+        self._start_server(max_projects)
+
+    def _create_stub_nfpm(self):
+        bin_dir = os.path.join(self.root, "bin")
+        os.makedirs(bin_dir)
+        path = os.path.join(bin_dir, "nfpm")
+        with open(path, "w") as opened:
+            opened.write(STUB_NFPM)
+        os.chmod(path, 0o755)
+        os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+
+    def _create_upstreams(self, count: int, compile_seconds: float):
+        template = os.path.join(self.root, "template")
+        os.makedirs(template)
+        _git(template, "init", "-q")
+        with open(os.path.join(template, "build.sh"), "w") as opened:
+            opened.write(BUILD_SCRIPT.format(compile_seconds=compile_seconds))
+        _git(template, "add", "build.sh")
+        _git(template, "commit", "-q", "-m", "initial")
+        _git(template, "tag", TAG)
+
+        self.upstreams = os.path.join(self.root, "upstreams")
+        os.makedirs(self.upstreams)
+        for i in range(count):
+            _git(self.upstreams, "clone", "-q", "--bare", template, f"{_project_name(i)}.git")
+
+    def _create_nfpm_configs(self, count: int):
+        self.nfpm_configs = os.path.join(self.root, "nfpm-configs")
+        for i in range(count):
+            host = "github.com" if _hoster(i) == "github" else "gitlab.com"
+            directory = os.path.join(self.nfpm_configs, host, OWNER, _project_name(i))
+            os.makedirs(directory)
+            with open(os.path.join(directory, "nfpm.yaml"), "w") as opened:
+                opened.write(f"name: {_project_name(i)}\n")
+
+    def _primary_xml(self, count: int) -> bytes:
+        packages = list()
+        for i in range(count):
+            name = _project_name(i)
+            version = TAG[1:] if name in self.current else "1.0.0"
+            packages.append(f'<package type="rpm"><name>{name}</name><arch>x86_64</arch><version epoch="0" ver="{version}" rel="1"/></package>')
+        body = "\n".join(packages)
+        return gzip.compress(f'<metadata xmlns="http://linux.duke.edu/metadata/common" packages="{count}">\n{body}\n</metadata>'.encode())
+
+    def _start_server(self, count: int):
+        primary = self._primary_xml(count)
+        repomd = (
+            '<repomd xmlns="http://linux.duke.edu/metadata/repo"><revision>1</revision>'
+            '<data type="primary"><checksum type="sha256">bench</checksum><location href="repodata/primary.xml.gz"/></data>'
+            '</repomd>'
+        ).encode()
+        latency = self.latency
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body=b"", content_type="application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", '"bench"')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                time.sleep(latency)
+                path = unquote(self.path)
+                parts = path.strip("/").split("/")
+                if self.headers.get("If-None-Match") == '"bench"' and not path.startswith("/dnf/"):
+                    self._send(304)
+                elif path == "/dnf/repodata/repomd.xml":
+                    self._send(200, repomd, "application/xml")
+                elif path == "/dnf/repodata/primary.xml.gz":
+                    self._send(200, primary, "application/gzip")
+                elif path.startswith("/github/repos/") and path.endswith("/releases/latest"):
+                    self._send(200, json.dumps({"tag_name": TAG}).encode())
+                elif path.startswith("/gitlab/api/v4/projects/") and path.endswith("/releases"):
+                    self._send(200, json.dumps([{"tag_name": TAG}]).encode())
+                elif path.startswith("/gitlab/api/v4/projects/"):
+                    self._send(200, json.dumps({"id": abs(hash(parts[-1])) % 100000}).encode())
+                else:
+                    self._send(404)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def build_configs(self, count: int) -> list:
+        configs = list()
+        for i in range(count):
+            name = _project_name(i)
+            builds = [{"arch": "amd64", "env": {"GOARCH": "amd64"}, "buildsteps": ["sh build.sh"]}]
+            url = f"file://{os.path.join(self.upstreams, name)}.git"
+            configs.append(BuildConfig(builds, OWNER, name, hoster=_hoster(i), url=url))
+        return configs
+
+    def close(self):
+        self.server.shutdown()
+
+
+def _percentile(values: list, percentile: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percentile * (len(values) - 1))))]
+
+
+def run_scenario(fixture: Fixture, projects: int, jobs: int, checkout_mode: str, pipeline=False) -> dict:
+    scenario = tempfile.mkdtemp(dir=fixture.root, prefix=f"p{projects}-j{jobs}-")
+    try:
+        conf = Config(fixture.build_configs(projects), os.path.join(scenario, "artifacts"), os.path.join(scenario, "clones"), NfpmConfig(fixture.nfpm_configs))
+        conf.jobs = jobs
+        conf.pipeline = pipeline
+        conf.cache_path = os.path.join(scenario, "cache")
+
+        git_wrapper = GitWrapper(conf.clone_path, ReleaseCache(conf.cache_path), checkout_mode, f"{fixture.url}/github", f"{fixture.url}/gitlab")
+        rpm_repo = RpmRepository(f"{fixture.url}/dnf", conf.cache_path)
+        tracer = Tracer()
+        builder = PackageBuilder(conf, git_wrapper, rpm_repo, tracer=tracer)
+
+        started = time.monotonic()
+        results = builder.build_packages()
+        wall = time.monotonic() - started
+    finally:
+        shutil.rmtree(scenario, ignore_errors=True)
+
+    phases = dict()
+    for phase in PHASES:
+        durations = [span.duration for span in tracer.spans if span.phase == phase and span.project]
+        phases[phase] = {"count": len(durations), "p50": _percentile(durations, 0.5), "p95": _percentile(durations, 0.95), "max": max(durations, default=0.0)}
+
+    return {
+        "projects": projects,
+        "jobs": jobs,
+        "wall_seconds": wall,
+        "projects_per_second": projects / wall if wall else 0.0,
+        "failed": sum(1 for success in results.values() if not success),
+        "phases": phases,
+    }
+
+
+def _print_results(results: list):
+    header = f"{'projects':>8} {'jobs':>4} {'wall[s]':>8} {'proj/s':>7} {'failed':>6}"
+    for phase in PHASES:
+        header += f" {phase + ' p50/p95[ms]':>22}"
+    print(header)
+    for result in results:
+        line = f"{result['projects']:>8} {result['jobs']:>4} {result['wall_seconds']:>8.2f} {result['projects_per_second']:>7.1f} {result['failed']:>6}"
+        for phase in PHASES:
+            stats = result["phases"][phase]
+            line += f" {stats['p50'] * 1000:>10.1f}/{stats['p95'] * 1000:<11.1f}"
+        print(line)
+
+
+def _int_list(value: str) -> list:
+    return [int(v) for v in value.split(",") if v]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of batchnfpm")
+    parser.add_argument("--projects", type=_int_list, default=[10, 50], help="comma separated project counts")
+    parser.add_argument("--jobs", type=_int_list, default=[1, 4, 8], help="comma separated job counts")
+    parser.add_argument("--compile-seconds", type=float, default=0.1, help="simulated compile time per project")
+    parser.add_argument("--latency-ms", type=float, default=20, help="simulated round-trip time of the fake APIs")
+    parser.add_argument("--current-ratio", type=float, default=0.5, help="share of projects already current in the fake repository")
+    parser.add_argument("--checkout-mode", default="mirror", choices=["clone", "mirror"])
+    parser.add_argument("--pipeline", action="store_true", help="run fetch, compile and package as pipelined stages")
+    parser.add_argument("--json", dest="json_file", default=None, help="additionally write the results as JSON to this file")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(levelname)s\t %(asctime)s [%(threadName)s] %(message)s")
+
+    root = tempfile.mkdtemp(prefix="batchnfpm-bench-")
+    fixture = None
+    try:
+        fixture = Fixture(root, max(args.projects), args.compile_seconds, args.current_ratio, args.latency_ms / 1000)
+        results = [run_scenario(fixture, projects, jobs, args.checkout_mode, args.pipeline) for projects in args.projects for jobs in args.jobs]
+    finally:
+        if fixture:
+            fixture.close()
+        shutil.rmtree(root, ignore_errors=True)
+
+    _print_results(results)
+    if args.json_file:
+        with open(args.json_file, "w") as opened:
+            json.dump(results, opened, indent=2)
+
+    if any(result["failed"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+from batchnfpm.config import BuildConfig
+
+
+def make_build_config(project: str, owner="soerenschneider", hoster="github", archs=("amd64",), **kwargs) -> BuildConfig:
+    """ Returns a build config that runs 'make build' for every arch. """
+    builds = [{"arch": arch, "buildsteps": ["make build"]} for arch in archs]
+    return BuildConfig(builds, owner, project, hoster=hoster, **kwargs)
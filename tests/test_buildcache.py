@@ -0,0 +1,50 @@
+from batchnfpm.buildcache import BuildCache, MEGABYTE
+from batchnfpm.config import Build
+
+import os
+import time
+import tempfile
+import unittest
+
+
+class Test_TestBuildCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.nfpm_config = os.path.join(self.tmp.name, "nfpm.yaml")
+        with open(self.nfpm_config, "w") as opened:
+            opened.write("name: prometheus")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _package(self, name: str, size: int) -> str:
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as opened:
+            opened.write(b"x" * size)
+        return path
+
+    def test_get_key(self):
+        build = Build("amd64", ["make build"], {"GOARCH": "amd64"})
+        key = BuildCache.get_key("abc", build, self.nfpm_config, "2.4.1", ["p.rpm"])
+        self.assertEqual(key, BuildCache.get_key("abc", build, self.nfpm_config, "2.4.1", ["p.rpm"]))
+        self.assertNotEqual(key, BuildCache.get_key("def", build, self.nfpm_config, "2.4.1", ["p.rpm"]))
+        self.assertNotEqual(key, BuildCache.get_key("abc", Build("arm64", ["make build"], None), self.nfpm_config, "2.4.1", ["p.rpm"]))
+
+    def test_store_and_restore(self):
+        cache = BuildCache(os.path.join(self.tmp.name, "cache"), 1)
+        package = self._package("p.rpm", 10)
+        cache.store("key", [package])
+        os.remove(package)
+
+        self.assertTrue(cache.restore("key", [package]))
+        self.assertTrue(os.path.isfile(package))
+        self.assertFalse(cache.restore("other", [package]))
+
+    def test_evict_least_recently_used(self):
+        cache = BuildCache(os.path.join(self.tmp.name, "cache"), 1)
+        cache.store("old", [self._package("old.rpm", MEGABYTE // 2)])
+        os.utime(os.path.join(cache.path, "old"), (time.time() - 60, time.time() - 60))
+        cache.store("new", [self._package("new.rpm", MEGABYTE // 2 + 1)])
+
+        self.assertFalse(os.path.isdir(os.path.join(cache.path, "old")))
+        self.assertTrue(os.path.isdir(os.path.join(cache.path, "new")))
@@ -0,0 +1,26 @@
+from batchnfpm.buildlog import BuildLog
+
+import os
+import sys
+import tempfile
+import unittest
+
+
+class Test_TestBuildLog(unittest.TestCase):
+    def test_run_and_tail(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "github", "owner", "project", "amd64.log")
+            script = "import sys\nfor i in range(10000): print(i)\nsys.stderr.write('failed\\n')\nsys.exit(3)"
+            with BuildLog(path, tail_lines=3) as build_log:
+                exitcode = build_log.run([sys.executable, "-c", script], tmp, dict(os.environ))
+                tail = build_log.tail()
+
+            self.assertEqual(exitcode, 3)
+            self.assertEqual(tail, ["9999", "failed", "# exit code 3"])
+            self.assertGreater(os.path.getsize(path), 10000)
+
+    def test_tail_short_log(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with BuildLog(os.path.join(tmp, "amd64.log")) as build_log:
+                build_log.write("hello")
+                self.assertEqual(build_log.tail(), ["hello"])
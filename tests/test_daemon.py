@@ -0,0 +1,57 @@
+from batchnfpm.daemon import Daemon
+from batchnfpm.config import Config, NfpmConfig
+from tests.helpers import make_build_config
+
+import unittest
+from unittest import mock
+
+
+class Test_TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.fast = make_build_config("fast", interval=60)
+        self.slow = make_build_config("slow")
+        conf = Config([self.fast, self.slow], "/tmp/artifacts", "/tmp/clones", NfpmConfig("/tmp/nfpm"))
+        self.builder = mock.Mock()
+        self.builder.conf = conf
+        self.tags = {self.fast: "v1.0.0", self.slow: "v2.0.0"}
+        self.builder.git_wrapper.get_latest_release_tags.side_effect = lambda due, tracer: {build_config: self.tags[build_config] for build_config in due}
+        self.builder.build_packages.side_effect = lambda build_configs, tags, tracer: {build_config.name: True for build_config in build_configs}
+        self.daemon = Daemon(self.builder, interval=600, jitter=0)
+
+    def test_builds_only_changed_projects(self):
+        results = self.daemon.run_once(now=0)
+        self.assertEqual(set(results), {self.fast.name, self.slow.name})
+
+        results = self.daemon.run_once(now=600)
+        self.assertEqual(results, dict())
+        self.assertEqual(self.builder.build_packages.call_count, 1)
+
+        self.tags[self.slow] = "v2.1.0"
+        results = self.daemon.run_once(now=1200)
+        self.assertEqual(set(results), {self.slow.name})
+
+    def test_per_project_interval(self):
+        self.daemon.run_once(now=0)
+        self.builder.git_wrapper.get_latest_release_tags.reset_mock()
+
+        self.daemon.run_once(now=60)
+        due = self.builder.git_wrapper.get_latest_release_tags.call_args[0][0]
+        self.assertEqual(due, [self.fast])
+
+    def test_failed_builds_are_retried(self):
+        self.builder.build_packages.side_effect = lambda build_configs, tags, tracer: {build_config.name: False for build_config in build_configs}
+        self.daemon.run_once(now=0)
+        self.builder.build_packages.side_effect = lambda build_configs, tags, tracer: {build_config.name: True for build_config in build_configs}
+
+        results = self.daemon.run_once(now=600)
+        self.assertEqual(set(results), {self.fast.name, self.slow.name})
+
+    def test_tracer_is_passed_per_cycle(self):
+        tracer = self.builder.tracer
+        self.daemon.run_once(now=0)
+
+        # the builder is shared with webhook builds, the cycle's tracer must not replace its own
+        self.assertIs(self.builder.tracer, tracer)
+        cycle_tracer = self.builder.build_packages.call_args[1]["tracer"]
+        self.assertIsNot(cycle_tracer, tracer)
+        self.assertIs(self.builder.git_wrapper.get_latest_release_tags.call_args[1]["tracer"], cycle_tracer)
@@ -0,0 +1,52 @@
+from batchnfpm.debrepository import DebRepository, deb_vercmp
+from batchnfpm.indexcache import open_compressed
+
+import io
+import lzma
+import unittest
+
+PACKAGES = b"""Package: prometheus
+Version: 2.9.2+ds-1
+Architecture: amd64
+
+Package: prometheus
+Version: 2.10.0+ds-1
+Architecture: amd64
+Description: monitoring system
+ multi line description
+ Version: 0.0.1
+
+Package: node-exporter
+Version: 1:0.18.1-2
+Architecture: amd64
+"""
+
+RELEASE = """Origin: Debian
+Suite: stable
+MD5Sum:
+ 0123 100 main/binary-amd64/Packages.xz
+SHA256:
+ abcd 200 main/binary-amd64/Packages
+ ef01 100 main/binary-amd64/Packages.xz
+ 2345 150 main/binary-amd64/Packages.gz
+"""
+
+
+class Test_TestDebRepository(unittest.TestCase):
+    def test_deb_vercmp(self):
+        self.assertEqual(deb_vercmp("2.10.0", "2.9.2"), 1)
+        self.assertEqual(deb_vercmp("1.0~rc1", "1.0"), -1)
+        self.assertEqual(deb_vercmp("1:0.1", "2.0"), 1)
+        self.assertEqual(deb_vercmp("1.0-1", "1.0-2"), -1)
+        self.assertEqual(deb_vercmp("1.0", "1.0"), 0)
+        self.assertEqual(deb_vercmp("1.0a", "1.0"), 1)
+
+    def test_parse_release(self):
+        path, revision = DebRepository._parse_release(RELEASE, "main", "amd64")
+        self.assertEqual(path, "main/binary-amd64/Packages.xz")
+        self.assertEqual(revision, "ef01")
+
+    def test_index_packages(self):
+        stream = open_compressed(io.BytesIO(lzma.compress(PACKAGES)), "Packages.xz")
+        index = DebRepository._index_packages(stream)
+        self.assertEqual(index, {"prometheus": "2.10.0+ds-1", "node-exporter": "1:0.18.1-2"})
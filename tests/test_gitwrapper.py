@@ -0,0 +1,111 @@
+from batchnfpm.gitwrapper import GitWrapper
+from batchnfpm.config import BuildConfig
+from tests.helpers import make_build_config
+
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+
+def _git(cwd: str, *args):
+    env = dict(os.environ, GIT_AUTHOR_NAME="test", GIT_AUTHOR_EMAIL="test@example.com", GIT_COMMITTER_NAME="test", GIT_COMMITTER_EMAIL="test@example.com")
+    subprocess.run(["git", *args], cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _create_upstream(path: str, versions=("v1.0.0", "v1.1.0")):
+    os.makedirs(path)
+    _git(path, "init", "-q")
+    for version in versions:
+        with open(os.path.join(path, "VERSION"), "w") as opened:
+            opened.write(version)
+        _git(path, "add", "VERSION")
+        _git(path, "commit", "-q", "-m", version)
+        _git(path, "tag", version)
+
+
+class Test_TestGitWrapper(unittest.TestCase):
+    def test_get_latest_release_tags(self):
+        configs = [make_build_config("a"), make_build_config("b"), make_build_config("c")]
+
+        def resolve(build_config):
+            if build_config.project == "c":
+                raise Exception("rate limited")
+            return f"v1.0.{build_config.project}"
+
+        git_wrapper = GitWrapper("/tmp/clones")
+        with mock.patch.object(git_wrapper, "get_latest_release_tag", side_effect=resolve):
+            tags = git_wrapper.get_latest_release_tags(configs, max_workers=2)
+
+        self.assertEqual(tags[configs[0]], "v1.0.a")
+        self.assertEqual(tags[configs[1]], "v1.0.b")
+        self.assertIsNone(tags[configs[2]])
+
+    def test_get_latest_release_tags_empty(self):
+        self.assertEqual(GitWrapper("/tmp/clones").get_latest_release_tags([]), dict())
+
+    def test_checkout_from_mirror(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            upstream = os.path.join(tmp, "upstream")
+            _create_upstream(upstream)
+            mirror = os.path.join(tmp, "mirror.git")
+            worktree = os.path.join(tmp, "worktree")
+
+            for version in ["v1.0.0", "v1.1.0"]:
+                GitWrapper.checkout_from_mirror(f"file://{upstream}", mirror, worktree, version)
+                with open(os.path.join(worktree, "VERSION")) as opened:
+                    self.assertEqual(opened.read(), version)
+
+            self.assertTrue(os.path.isfile(os.path.join(mirror, "shallow")))
+
+    def test_add_and_remove_worktree(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            upstream = os.path.join(tmp, "upstream")
+            _create_upstream(upstream)
+            worktree = os.path.join(tmp, "worktrees", "0-amd64")
+
+            GitWrapper.add_worktree(upstream, worktree)
+            with open(os.path.join(worktree, "VERSION")) as opened:
+                self.assertEqual(opened.read(), "v1.1.0")
+
+            GitWrapper.remove_worktree(upstream, worktree)
+            self.assertFalse(os.path.isdir(worktree))
+
+    def test_select_latest_tag(self):
+        tags = ["v1.2.0", "v1.10.0", "v2.0.0-rc1", "nightly", "docs/v3.0.0", "v0.9.0"]
+        self.assertEqual(GitWrapper.select_latest_tag(tags), "v1.10.0")
+        self.assertEqual(GitWrapper.select_latest_tag(tags, include=["v1.2.*", "v0.*"]), "v1.2.0")
+        self.assertEqual(GitWrapper.select_latest_tag(tags, exclude=["v1.1*"]), "v1.2.0")
+        self.assertIsNone(GitWrapper.select_latest_tag(["nightly", "v2.0.0-rc1"]))
+
+    def test_get_latest_release_tag_from_git(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            upstream = os.path.join(tmp, "upstream")
+            _create_upstream(upstream, versions=("v1.0.0", "v1.2.0", "v1.10.0", "v2.0.0-beta.1"))
+            build_config = BuildConfig([{"arch": "amd64", "buildsteps": ["make build"]}], "soerenschneider", "upstream", hoster="git", url=f"file://{upstream}")
+
+            self.assertEqual(sorted(GitWrapper.list_remote_tags(build_config.url)), ["v1.0.0", "v1.10.0", "v1.2.0", "v2.0.0-beta.1"])
+            git_wrapper = GitWrapper(os.path.join(tmp, "clones"))
+            with mock.patch.object(git_wrapper, "_get_github_tag") as github:
+                self.assertEqual(git_wrapper.get_latest_release_tag(build_config), "v1.10.0")
+                build_config.tag_exclude = ["v1.10.*"]
+                self.assertEqual(git_wrapper.get_latest_release_tag(build_config), "v1.2.0")
+            github.assert_not_called()
+
+    def test_tag_resolver_validation(self):
+        builds = [{"arch": "amd64", "buildsteps": ["make build"]}]
+        self.assertEqual(make_build_config("a").tag_resolver, "api")
+        self.assertEqual(BuildConfig(builds, "owner", "project", hoster="git", url="git@git.example.com:owner/project.git").host, "git.example.com")
+        with self.assertRaises(ValueError):
+            BuildConfig(builds, "owner", "project", hoster="git")
+        with self.assertRaises(ValueError):
+            BuildConfig(builds, "owner", "project", hoster="git", url="https://git.example.com/owner/project.git", tag_resolver="api")
+        with self.assertRaises(ValueError):
+            BuildConfig(builds, "owner", "project", tag_resolver="scrape")
+
+        build_config = BuildConfig(builds, "owner", "project", tag_resolver="git", tag_include="v*", tag_exclude="v2.*")
+        self.assertEqual((build_config.tag_include, build_config.tag_exclude), (["v*"], ["v2.*"]))
+        self.assertEqual(GitWrapper.select_latest_tag(["v1.0.0", "v1.1.0", "v2.0.0"], build_config.tag_include, build_config.tag_exclude), "v1.1.0")
+        with self.assertRaises(ValueError):
+            BuildConfig(builds, "owner", "project", tag_exclude=42)
@@ -0,0 +1,67 @@
+from batchnfpm.httpclient import HttpClient, RateLimitExceeded, TOKEN_GITHUB, _HostBudget
+
+import os
+import time
+import unittest
+from unittest import mock
+
+
+def _response(status_code: int, headers=None):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.headers = headers or dict()
+    return response
+
+
+class Test_TestHttpClient(unittest.TestCase):
+    def test_budget_paces_when_low(self):
+        budget = _HostBudget()
+        reset = time.time() + 100
+        self.assertFalse(budget.update({"X-RateLimit-Remaining": "4000", "X-RateLimit-Limit": "5000", "X-RateLimit-Reset": str(reset)}, 200))
+        self.assertEqual(budget.reserve(), 0)
+        self.assertEqual(budget.reserve(), 0)
+
+        # 10 requests left for 100 seconds: one every 10 seconds
+        budget.update({"RateLimit-Remaining": "10", "RateLimit-Limit": "600", "RateLimit-Reset": "100"}, 200)
+        budget.reserve()
+        self.assertAlmostEqual(budget.reserve(), 10, delta=1)
+
+    def test_budget_waits_for_reset(self):
+        budget = _HostBudget()
+        self.assertTrue(budget.update({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(time.time() + 30)}, 403))
+        self.assertAlmostEqual(budget.reserve(), 30, delta=1)
+
+        budget = _HostBudget()
+        self.assertTrue(budget.update({"Retry-After": "5"}, 429))
+        self.assertAlmostEqual(budget.reserve(), 5, delta=1)
+
+    def test_get_retries_after_rate_limit(self):
+        client = HttpClient(max_wait=1)
+        client.session = mock.Mock()
+        client.session.get.side_effect = [_response(429, {"Retry-After": "0.1"}), _response(200)]
+
+        self.assertEqual(client.get("https://api.github.com/repos").status_code, 200)
+        self.assertEqual(client.session.get.call_count, 2)
+
+    def test_get_gives_up_on_long_waits(self):
+        client = HttpClient(max_wait=1)
+        client.session = mock.Mock()
+        client.session.get.return_value = _response(403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(time.time() + 3600)})
+
+        with self.assertRaises(RateLimitExceeded):
+            client.get("https://api.github.com/repos")
+        # other hosts are not affected
+        client.session.get.return_value = _response(200)
+        self.assertEqual(client.get("https://gitlab.com/api").status_code, 200)
+
+    def test_token_only_sent_to_its_host(self):
+        client = HttpClient()
+        client.session = mock.Mock()
+        client.session.get.return_value = _response(200)
+        with mock.patch.dict(os.environ, {"GITHUB_TOKEN": "secret"}):
+            self.assertTrue(client.add_token("https://api.github.com", TOKEN_GITHUB))
+
+        client.get("https://api.github.com/repos")
+        self.assertEqual(client.session.get.call_args[1]["headers"], {"Authorization": "Bearer secret"})
+        client.get("https://example.com/config.yaml")
+        self.assertEqual(client.session.get.call_args[1]["headers"], dict())
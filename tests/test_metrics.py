@@ -0,0 +1,47 @@
+from batchnfpm.metrics import Tracer, wait
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+import subprocess
+
+
+class Test_TestMetrics(unittest.TestCase):
+    def test_wait_records_rusage(self):
+        tracer = Tracer()
+        with tracer.span("compile", "github/prometheus/prometheus", "amd64") as span:
+            p = subprocess.Popen([sys.executable, "-c", "import sys; sum(range(10**6)); sys.exit(4)"])
+            self.assertEqual(wait(p, span), 4)
+
+        self.assertEqual(p.returncode, 4)
+        self.assertGreater(span.cpu_seconds, 0)
+        self.assertGreater(span.max_rss_bytes, 0)
+        self.assertGreater(span.duration, 0)
+
+    def test_prometheus(self):
+        tracer = Tracer()
+        with tracer.span("package", "github/prometheus/prometheus", "amd64"):
+            pass
+        with tracer.span("package", "github/prometheus/prometheus", "amd64"):
+            pass
+
+        text = tracer.to_prometheus()
+        self.assertIn("# TYPE batchnfpm_phase_duration_seconds gauge", text)
+        self.assertEqual(text.count('batchnfpm_phase_cpu_seconds{phase="package",project="github/prometheus/prometheus",arch="amd64"}'), 1)
+        self.assertIn("batchnfpm_last_run_timestamp_seconds", text)
+
+    def test_write_json(self):
+        tracer = Tracer()
+        with tracer.span("tags", "github/prometheus/prometheus"):
+            pass
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.json")
+            tracer.write_json(path)
+            with open(path) as opened:
+                trace = json.load(opened)
+
+        self.assertEqual(trace["spans"][0]["phase"], "tags")
+        self.assertEqual(trace["spans"][0]["project"], "github/prometheus/prometheus")
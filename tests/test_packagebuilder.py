@@ -1,6 +1,13 @@
-from batchnfpm.rpmbuilder import PackageBuilder
+from batchnfpm.rpmbuilder import PackageBuilder, DECISION_BUILD, DECISION_CURRENT, DECISION_NO_RELEASE
+from batchnfpm.projectbuild import ArchBuild
+from batchnfpm.config import Config, BuildConfig, NfpmConfig
+from tests.helpers import make_build_config
 
+import os
+import tempfile
 import unittest
+from unittest import mock
+
 
 class Test_TestPackageBuilder(unittest.TestCase):
     def test_get_normalized_version(self):
@@ -44,3 +51,130 @@ class Test_TestPackageBuilder(unittest.TestCase):
         arch = "amd64"
         name = PackageBuilder._get_target_filename(project, package_type, arch, version)
         self.assertEqual(name, f"{project}-{version}.{arch}.{package_type}")
+
+    def test_build_packages_reports_failures_per_project(self):
+        conf = Config([make_build_config("ok"), make_build_config("broken")], "/tmp/artifacts", "/tmp/clones", NfpmConfig("/tmp/nfpm"))
+        conf.jobs = 2
+        git_wrapper = mock.Mock()
+        git_wrapper.get_latest_release_tags.return_value = {build_config: "v1.0.0" for build_config in conf.buildconfigs}
+        builder = PackageBuilder(conf, git_wrapper)
+
+        def build(build_config, git_tag, tracer):
+            if build_config.project == "broken":
+                raise Exception("boom")
+            return True
+
+        with mock.patch.object(builder, "_build_project", side_effect=build):
+            results = builder.build_packages()
+
+        self.assertEqual(results, {"github/soerenschneider/ok": True, "github/soerenschneider/broken": False})
+
+    def test_plan(self):
+        conf = Config([make_build_config("outdated"), make_build_config("current"), make_build_config("unreleased")], "/tmp/artifacts", "/tmp/clones", NfpmConfig("/tmp/nfpm"))
+        tags = {"outdated": "v1.1.0", "current": "v1.0.0", "unreleased": None}
+        git_wrapper = mock.Mock()
+        git_wrapper.get_latest_release_tags.return_value = {build_config: tags[build_config.project] for build_config in conf.buildconfigs}
+        rpm_repo = mock.Mock()
+        rpm_repo.get_rpm_version.return_value = "1.0.0"
+        builder = PackageBuilder(conf, git_wrapper, rpm_repo)
+
+        plan = builder.plan()
+
+        self.assertEqual([entry["decision"] for entry in plan], [DECISION_BUILD, DECISION_CURRENT, DECISION_NO_RELEASE])
+        self.assertEqual(plan[0], {"project": "github/soerenschneider/outdated", "packaged_version": "1.0.0", "tag": "v1.1.0", "decision": DECISION_BUILD})
+        git_wrapper.checkout_build_config.assert_not_called()
+
+    def test_find_nfpm_config(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config_dir = os.path.join(tmp, "github.com", "soerenschneider", "indexed")
+            os.makedirs(config_dir)
+            open(os.path.join(config_dir, "nfpm.yaml"), "w").close()
+            os.makedirs(os.path.join(tmp, ".git"))
+            open(os.path.join(tmp, ".git", "HEAD"), "w").close()
+
+            conf = Config([make_build_config("indexed")], "/tmp/artifacts", "/tmp/clones", NfpmConfig(tmp))
+            builder = PackageBuilder(conf, mock.Mock())
+
+            found = builder._find_nfpm_config(make_build_config("indexed"), "/nonexistent")
+            self.assertEqual(found, os.path.join(config_dir, "nfpm.yaml"))
+            self.assertIsNone(builder._find_nfpm_config(make_build_config("missing"), "/nonexistent"))
+            self.assertEqual(len(builder._get_nfpm_configs()), 1)
+
+    def test_get_packaged_version_oldest_format(self):
+        build_config = BuildConfig([{"arch": "amd64", "buildsteps": ["make build"]}], "prometheus", "prometheus", formats=["rpm", "deb", "apk"])
+        conf = Config([build_config], "/tmp/artifacts", "/tmp/clones", NfpmConfig("/tmp/nfpm"))
+        rpm_repo = mock.Mock()
+        rpm_repo.get_rpm_version.return_value = "2.10.0"
+        deb_repo = mock.Mock()
+        deb_repo.get_deb_version.return_value = "2.9.2"
+
+        builder = PackageBuilder(conf, mock.Mock(), rpm_repo, deb_repo)
+        self.assertEqual(builder._get_packaged_version(build_config), "2.9.2")
+        rpm_repo.get_rpm_version.assert_called_with("prometheus")
+
+        deb_repo.get_deb_version.return_value = None
+        self.assertIsNone(builder._get_packaged_version(build_config))
+
+    def test_build_package_env_per_invocation(self):
+        build_config = BuildConfig([{"arch": "amd64", "buildsteps": ["make build"]}], "prometheus", "prometheus", formats=["rpm", "deb"])
+        with tempfile.TemporaryDirectory() as tmp:
+            conf = Config([build_config], tmp, "/tmp/clones", NfpmConfig("/tmp/nfpm"))
+            builder = PackageBuilder(conf, mock.Mock())
+
+            with mock.patch("batchnfpm.rpmbuilder.subprocess.Popen") as popen, \
+                    mock.patch("batchnfpm.rpmbuilder.wait", return_value=0):
+                self.assertTrue(builder._build_package(build_config, "arm64", "nfpm.yaml", "2.4.1", tmp))
+
+            self.assertEqual(popen.call_count, 2)
+            targets = sorted(call[0][0][-1] for call in popen.call_args_list)
+            self.assertEqual(targets, [os.path.join(tmp, "deb", "prometheus-2.4.1.arm64.deb"), os.path.join(tmp, "rpm", "prometheus-2.4.1.arm64.rpm")])
+            for call in popen.call_args_list:
+                self.assertEqual(call[1]["env"]["NFPM_APP_VERSION"], "2.4.1")
+                self.assertEqual(call[1]["env"]["ARCH"], "arm64")
+            self.assertNotEqual(os.environ.get("NFPM_APP_VERSION"), "2.4.1")
+
+    def test_relocate(self):
+        relocated = PackageBuilder._relocate("/tmp/clones/owner/project/nfpm.yaml", "/tmp/clones/owner/project", "/tmp/worktrees/0-amd64")
+        self.assertEqual(relocated, "/tmp/worktrees/0-amd64/nfpm.yaml")
+        self.assertEqual(PackageBuilder._relocate("/tmp/nfpm/nfpm.yaml", "/tmp/clones/owner/project", "/tmp/worktrees/0-amd64"), "/tmp/nfpm/nfpm.yaml")
+
+    def test_open_build_log_per_build(self):
+        builds = [{"arch": "amd64", "buildsteps": ["make build"]}, {"arch": "amd64", "buildsteps": ["make build"], "env": ["CGO_ENABLED=0"]}]
+        build_config = BuildConfig(builds, "prometheus", "prometheus")
+        with tempfile.TemporaryDirectory() as tmp:
+            builder = PackageBuilder(Config([build_config], tmp, "/tmp/clones", NfpmConfig("/tmp/nfpm")), mock.Mock())
+            paths = list()
+            for build in build_config.builds:
+                with builder._open_build_log(build_config, build) as build_log:
+                    paths.append(build_log.path)
+
+        self.assertEqual([os.path.basename(path) for path in paths], ["0-amd64.log", "1-amd64.log"])
+
+    def test_build_project_builds_every_arch(self):
+        build_config = make_build_config("multi", archs=("amd64", "arm64"))
+        builder = PackageBuilder(Config([build_config], "/tmp/artifacts", "/tmp/clones", NfpmConfig("/tmp/nfpm")), mock.Mock())
+
+        def prepare(project, build_index=None):
+            project.archs = [ArchBuild(build_config, index, build, "nfpm.yaml", "1.0.0", "/tmp/clones", project.tracer) for index, build in enumerate(build_config.builds)]
+            return True
+
+        with mock.patch.object(builder, "needs_build", return_value=True), \
+                mock.patch.object(builder, "prepare", side_effect=prepare), \
+                mock.patch.object(builder, "restore", return_value=False), \
+                mock.patch.object(builder, "compile", side_effect=lambda arch: arch.build.arch == "amd64"), \
+                mock.patch.object(builder, "package", return_value=True) as package, \
+                mock.patch.object(builder, "finish") as finish:
+            self.assertFalse(builder._build_project(build_config, "v1.0.0", builder.tracer))
+
+        self.assertEqual([args[0].name for args, _ in package.call_args_list], [f"{build_config.name}/0-amd64"])
+        self.assertFalse(finish.call_args[0][1])
+
+    def test_compile_project_fails_on_exit_code(self):
+        build_config = BuildConfig([{"arch": "amd64", "buildsteps": ["make build", "make test"]}], "prometheus", "prometheus")
+        builder = PackageBuilder(Config([build_config], "/tmp/artifacts", "/tmp/clones", NfpmConfig("/tmp/nfpm")), mock.Mock())
+        with mock.patch.object(PackageBuilder, "_run", return_value=2) as run:
+            self.assertFalse(builder._compile_project(build_config.builds[0], "/tmp/clones"))
+        self.assertEqual(run.call_count, 1)
+
+        with mock.patch.object(PackageBuilder, "_run", return_value=0):
+            self.assertTrue(builder._compile_project(build_config.builds[0], "/tmp/clones"))
@@ -0,0 +1,62 @@
+from batchnfpm.pipeline import Pipeline
+from batchnfpm.projectbuild import ArchBuild
+from batchnfpm.scheduler import Scheduler
+from tests.helpers import make_build_config
+
+import threading
+import unittest
+from unittest import mock
+
+
+def _prepare(project, build_index=None):
+    build_config = project.build_config
+    project.archs = [ArchBuild(build_config, index, build, "nfpm.yaml", "1.0.0", "/tmp/clones", project.tracer) for index, build in enumerate(build_config.builds)]
+    return True
+
+
+class Test_TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.builder = mock.Mock()
+        self.builder.needs_build.return_value = True
+        self.builder.get_project_lock.side_effect = lambda _: threading.Lock()
+        self.builder.prepare.side_effect = _prepare
+        self.builder.restore.return_value = False
+        self.builder.compile.return_value = True
+        self.builder.package.return_value = True
+
+    def _finished(self) -> dict:
+        return {args[0].build_config.name: args[1] for args, _ in self.builder.finish.call_args_list}
+
+    def test_run(self):
+        current, fine, broken = make_build_config("current"), make_build_config("fine", archs=("amd64", "arm64")), make_build_config("broken")
+        self.builder.needs_build.side_effect = lambda build_config, tag, tracer: build_config is not current
+        self.builder.compile.side_effect = lambda arch: arch.build_config is not broken
+
+        tags = {current: "v1.0.0", fine: "v1.0.0", broken: "v1.0.0"}
+        results = Pipeline(self.builder, Scheduler(2), fetch_workers=2, package_workers=1).run([current, fine, broken], tags)
+
+        self.assertEqual(results, {current.name: True, fine.name: True, broken.name: False})
+        self.assertEqual(sorted(args[0].name for args, _ in self.builder.package.call_args_list), [f"{fine.name}/0-amd64", f"{fine.name}/1-arm64"])
+        self.assertEqual(self._finished(), {fine.name: True, broken.name: False})
+
+    def test_run_restores_from_cache(self):
+        build_config = make_build_config("cached")
+        self.builder.restore.return_value = True
+
+        results = Pipeline(self.builder, Scheduler(1)).run([build_config], {build_config: "v1.0.0"})
+        self.assertEqual(results, {build_config.name: True})
+        self.builder.compile.assert_not_called()
+        self.builder.package.assert_not_called()
+        self.assertEqual(self._finished(), {build_config.name: True})
+
+    def test_failed_checkout_releases_lock(self):
+        build_config = make_build_config("unreachable")
+        lock = threading.Lock()
+        self.builder.get_project_lock.side_effect = None
+        self.builder.get_project_lock.return_value = lock
+        self.builder.prepare.side_effect = Exception("connection refused")
+
+        results = Pipeline(self.builder, Scheduler(1)).run([build_config], {build_config: "v1.0.0"})
+        self.assertEqual(results, {build_config.name: False})
+        self.assertEqual(self._finished(), {build_config.name: False})
+        self.assertFalse(lock.locked())
@@ -0,0 +1,60 @@
+from batchnfpm.gitwrapper import GitWrapper
+from batchnfpm.releasecache import ReleaseCache
+
+import tempfile
+import unittest
+from unittest import mock
+
+
+def _response(status_code: int, payload=None, headers=None):
+    response = mock.Mock()
+    response.status_code = status_code
+    response.ok = status_code < 400
+    response.json.return_value = payload
+    response.headers = headers or dict()
+    return response
+
+
+class Test_TestReleaseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_persist(self):
+        cache = ReleaseCache(self.tmp.name)
+        cache.set_project_id("gitlab.com", "soerenschneider", "batch-nfpm", 42)
+        cache.set_response("https://example.com", "v1.0.0", etag='"abc"')
+        cache.save()
+
+        reloaded = ReleaseCache(self.tmp.name)
+        self.assertEqual(reloaded.get_project_id("gitlab.com", "soerenschneider", "batch-nfpm"), 42)
+        self.assertEqual(reloaded.get_response("https://example.com")["value"], "v1.0.0")
+
+    def test_not_modified_is_cache_hit(self):
+        git_wrapper = GitWrapper("/tmp/clones", ReleaseCache(self.tmp.name))
+        session = mock.Mock()
+        session.get.side_effect = [
+            _response(200, {"tag_name": "v2.0.0"}, {"ETag": '"abc"'}),
+            _response(304),
+        ]
+
+        with mock.patch.object(git_wrapper, "http", session):
+            self.assertEqual(git_wrapper._get_github_tag("prometheus", "prometheus"), "v2.0.0")
+            self.assertEqual(git_wrapper._get_github_tag("prometheus", "prometheus"), "v2.0.0")
+
+        _, kwargs = session.get.call_args
+        self.assertEqual(kwargs["headers"]["If-None-Match"], '"abc"')
+
+    def test_gitlab_project_id_cached(self):
+        git_wrapper = GitWrapper("/tmp/clones", ReleaseCache(self.tmp.name))
+        session = mock.Mock()
+        session.get.return_value = _response(200, {"id": 7})
+
+        with mock.patch.object(git_wrapper, "http", session):
+            git_wrapper._get_gitlab_project_id("soerenschneider", "batch-nfpm")
+            project_id = git_wrapper._get_gitlab_project_id("soerenschneider", "batch-nfpm")
+
+        self.assertEqual(project_id, 7)
+        self.assertEqual(session.get.call_count, 1)
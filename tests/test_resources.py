@@ -1,8 +1,89 @@
-from batchnfpm.resources import ResourceReader
+from batchnfpm.resources import ResourceReader, _write_json
 
+import os
+import datetime
+import tempfile
 import unittest
+from unittest import mock
+
+MAIN_CONFIG = """
+builds:
+  artifacts_path: /tmp/artifacts
+  clone_path: /tmp/clones
+  nfpm_config: /tmp/nfpm
+  include:
+    - conf.d/*.yaml
+  build_configurations:
+    - hoster: github
+      owner: prometheus
+      project: prometheus
+      buildsteps:
+        - arch: amd64
+          buildsteps:
+            - make build
+"""
+
+FRAGMENT = """
+- hoster: gitlab
+  owner: soerenschneider
+  project: {project}
+  buildsteps:
+    - arch: amd64
+      buildsteps:
+        - make build
+"""
 
 class Test_TestResourceReader(unittest.TestCase):
     def test_read(self):
         r = ResourceReader.read_from_file("bla")
-        print(r)
\ No newline at end of file
+        print(r)
+
+    def test_read_config_includes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "conf.d"))
+            with open(os.path.join(tmp, "config.yaml"), "w") as opened:
+                opened.write(MAIN_CONFIG)
+            for project in ["b", "a"]:
+                with open(os.path.join(tmp, "conf.d", f"{project}.yaml"), "w") as opened:
+                    opened.write(FRAGMENT.format(project=project))
+
+            raw = ResourceReader.read_config(os.path.join(tmp, "config.yaml"), os.path.join(tmp, "cache"))
+
+        projects = [entry["project"] for entry in raw["builds"]["build_configurations"]]
+        self.assertEqual(projects, ["prometheus", "a", "b"])
+        self.assertNotIn("include", raw["builds"])
+
+    def test_read_config_rejects_includes_over_http(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with mock.patch.object(ResourceReader, "read_from_http", return_value=MAIN_CONFIG):
+                self.assertIsNone(ResourceReader.read_config("https://example.com/config.yaml", tmp))
+
+        with self.assertRaisesRegex(ValueError, "include"):
+            ResourceReader._resolve_includes({"builds": {"include": ["conf.d/*.yaml"]}}, None)
+
+    def test_parse_yaml_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            first = ResourceReader.parse_yaml("a: 1", "config.yaml", tmp)
+            cached = ResourceReader.parse_yaml("a: 1", "config.yaml", tmp)
+            changed = ResourceReader.parse_yaml("a: 2", "config.yaml", tmp)
+
+        self.assertEqual(first, {"a": 1})
+        self.assertEqual(cached, {"a": 1})
+        self.assertEqual(changed, {"a": 2})
+
+    def test_parse_yaml_cache_skips_lossy_values(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for _ in range(2):
+                dated = ResourceReader.parse_yaml("updated: 2020-01-01", "dated.yaml", tmp)
+                numbered = ResourceReader.parse_yaml("1: one", "numbered.yaml", tmp)
+            leftovers = os.listdir(os.path.join(tmp, "configs")) if os.path.isdir(os.path.join(tmp, "configs")) else list()
+
+        self.assertEqual(dated, {"updated": datetime.date(2020, 1, 1)})
+        self.assertEqual(numbered, {1: "one"})
+        self.assertEqual(leftovers, list())
+
+    def test_write_json_unserializable(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "configs", "cache.json")
+            _write_json(path, {"updated": datetime.date(2020, 1, 1)})
+            self.assertEqual(os.listdir(os.path.join(tmp, "configs")), list())
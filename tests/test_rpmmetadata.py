@@ -0,0 +1,121 @@
+from batchnfpm.rpmmetadata import RepoMetadata, read_rpm, get_package, _gzip, NS_COMMON, NS_FILELISTS, NS_REPO
+
+import os
+import gzip
+import struct
+import time
+import hashlib
+import tempfile
+import unittest
+from unittest import mock
+from xml.etree import ElementTree
+
+
+def _header(entries: list) -> bytes:
+    """ Builds an rpm header structure from (tag, type, value) entries. """
+    index, store = b"", b""
+    for tag, data_type, value in entries:
+        if data_type == 4:
+            store += b"\0" * (-len(store) % 4)
+            data, count = struct.pack(f">{len(value)}I", *value), len(value)
+        elif data_type == 6:
+            data, count = value.encode() + b"\0", 1
+        else:
+            data, count = b"".join(item.encode() + b"\0" for item in value), len(value)
+        index += struct.pack(">IIII", tag, data_type, len(store), count)
+        store += data
+    return b"\x8e\xad\xe8\x01\0\0\0\0" + struct.pack(">II", len(entries), len(store)) + index + store
+
+
+def _write_rpm(path: str, name: str, version: str, release="1", arch="x86_64"):
+    lead = b"\xed\xab\xee\xdb" + b"\0" * 92
+    signature = _header([(1007, 4, [1234])])
+    header = _header([
+        (1000, 6, name), (1001, 6, version), (1002, 6, release), (1022, 6, arch),
+        (1004, 6, f"{name} & friends"), (1009, 4, [4096]),
+        (1030, 4, [0o40755, 0o100755]), (1037, 4, [0, 0]),
+        (1116, 4, [0, 1]), (1117, 8, ["bin", name]), (1118, 8, ["/usr/", "/usr/bin/"]),
+        (1047, 8, [name]), (1112, 4, [8]), (1113, 8, [f"{version}-{release}"]),
+        (1049, 8, ["glibc", "rpmlib(PayloadIsXz)"]), (1048, 4, [12, 16777224]), (1050, 8, ["2.17", "5.2-1"]),
+    ])
+    padding = b"\0" * (-(len(lead) + len(signature)) % 8)
+    with open(path, "wb") as opened:
+        opened.write(lead + signature + padding + header + b"payload")
+    return len(lead) + len(signature) + len(padding), len(header)
+
+
+class Test_TestRpmMetadata(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = os.path.join(self.tmp.name, "rpm")
+        self.cache = os.path.join(self.tmp.name, "cache")
+        os.makedirs(self.repo)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _read_metadata(self, metadata_type: str):
+        root = ElementTree.parse(os.path.join(self.repo, "repodata", "repomd.xml")).getroot()
+        for data in root.iter(f"{{{NS_REPO}}}data"):
+            if data.get("type") == metadata_type:
+                href = data.find(f"{{{NS_REPO}}}location").get("href")
+                with gzip.open(os.path.join(self.repo, href)) as opened:
+                    return ElementTree.parse(opened).getroot()
+
+    def test_read_rpm(self):
+        path = os.path.join(self.repo, "tool-1.0.0.x86_64.rpm")
+        start, size = _write_rpm(path, "tool", "1.0.0")
+
+        rpm = read_rpm(path)
+        self.assertEqual(rpm["header"][1000], "tool")
+        self.assertEqual(rpm["signature"][1007], [1234])
+        self.assertEqual(rpm["header_range"], (start, start + size))
+        with open(path, "rb") as opened:
+            self.assertEqual(rpm["checksum"], hashlib.sha256(opened.read()).hexdigest())
+
+        package = get_package(path, "tool-1.0.0.x86_64.rpm")
+        self.assertEqual(package["evr"], ["0", "1.0.0", "1"])
+        self.assertIn('<rpm:entry name="glibc" flags="GE" epoch="0" ver="2.17"/>', package["primary"])
+        self.assertNotIn("rpmlib", package["primary"])
+        self.assertIn("tool &amp; friends", package["primary"])
+
+    def test_update(self):
+        _write_rpm(os.path.join(self.repo, "tool-1.0.0.x86_64.rpm"), "tool", "1.0.0")
+        _write_rpm(os.path.join(self.repo, "other-2.0.0.x86_64.rpm"), "other", "2.0.0")
+        metadata = RepoMetadata(self.repo, self.cache)
+        self.assertTrue(metadata.update())
+
+        primary = self._read_metadata("primary")
+        self.assertEqual(primary.get("packages"), "2")
+        names = sorted(package.findtext(f"{{{NS_COMMON}}}name") for package in primary)
+        self.assertEqual(names, ["other", "tool"])
+        files = [element.text for element in self._read_metadata("filelists").iter(f"{{{NS_FILELISTS}}}file")]
+        self.assertIn("/usr/bin/tool", files)
+
+        # nothing changed, nothing is read or written
+        self.assertFalse(metadata.update())
+
+        _write_rpm(os.path.join(self.repo, "tool-1.1.0.x86_64.rpm"), "tool", "1.1.0")
+        self.assertTrue(RepoMetadata(self.repo, self.cache).update())
+        self.assertEqual(self._read_metadata("primary").get("packages"), "3")
+        self.assertEqual(len([name for name in os.listdir(os.path.join(self.repo, "repodata")) if name.endswith(".xml.gz")]), 3)
+
+    def test_retention(self):
+        for version in ["1.2.0", "1.10.0", "1.9.0"]:
+            _write_rpm(os.path.join(self.repo, f"tool-{version}.x86_64.rpm"), "tool", version)
+
+        RepoMetadata(self.repo, self.cache, retention=2).update()
+        self.assertEqual(sorted(os.listdir(self.repo)), ["repodata", "tool-1.10.0.x86_64.rpm", "tool-1.9.0.x86_64.rpm"])
+        self.assertEqual(self._read_metadata("other").get("packages"), "2")
+
+    def test_gzip_is_reproducible_without_compress(self):
+        # gzip.compress does not accept mtime before Python 3.8
+        with mock.patch("batchnfpm.rpmmetadata.gzip.compress", side_effect=AssertionError("needs Python 3.8")):
+            first = _gzip(b"<metadata/>")
+            time.sleep(1.1)
+            second = _gzip(b"<metadata/>")
+            _write_rpm(os.path.join(self.repo, "tool-1.0.0.x86_64.rpm"), "tool", "1.0.0")
+            self.assertTrue(RepoMetadata(self.repo, self.cache).update())
+
+        self.assertEqual(first, second)
+        self.assertEqual(gzip.decompress(first), b"<metadata/>")
@@ -0,0 +1,54 @@
+from batchnfpm.rpmrepository import RpmRepository, rpm_vercmp, rpm_evrcmp
+from batchnfpm.indexcache import IndexCache, open_compressed
+
+import io
+import gzip
+import tempfile
+import unittest
+
+PRIMARY = b"""<?xml version="1.0" encoding="UTF-8"?>
+<metadata xmlns="http://linux.duke.edu/metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="3">
+<package type="rpm"><name>prometheus</name><arch>x86_64</arch><version epoch="0" ver="2.10.0" rel="1"/></package>
+<package type="rpm"><name>prometheus</name><arch>x86_64</arch><version epoch="0" ver="2.9.2" rel="1"/></package>
+<package type="rpm"><name>node_exporter</name><arch>x86_64</arch><version epoch="0" ver="1.0.0~rc1" rel="1"/></package>
+</metadata>
+"""
+
+REPOMD = b"""<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="http://linux.duke.edu/metadata/repo">
+  <revision>1588000000</revision>
+  <data type="filelists"><checksum type="sha256">aaa</checksum><location href="repodata/aaa-filelists.xml.gz"/></data>
+  <data type="primary"><checksum type="sha256">bbb</checksum><location href="repodata/bbb-primary.xml.gz"/></data>
+</repomd>
+"""
+
+
+class Test_TestRpmRepository(unittest.TestCase):
+    def test_rpm_vercmp(self):
+        self.assertEqual(rpm_vercmp("2.10.0", "2.9.2"), 1)
+        self.assertEqual(rpm_vercmp("1.0", "1.0"), 0)
+        self.assertEqual(rpm_vercmp("1.0~rc1", "1.0"), -1)
+        self.assertEqual(rpm_vercmp("1.0^git1", "1.0"), 1)
+        self.assertEqual(rpm_vercmp("1.0a", "1.0.1"), -1)
+        self.assertEqual(rpm_vercmp("1.0.1", "1.0"), 1)
+
+    def test_rpm_evrcmp_epoch(self):
+        self.assertEqual(rpm_evrcmp(["1", "1.0", "1"], ["0", "2.0", "1"]), 1)
+
+    def test_index_primary(self):
+        stream = open_compressed(io.BytesIO(gzip.compress(PRIMARY)), "primary.xml.gz")
+        index = RpmRepository._index_primary(stream)
+        self.assertEqual(index["prometheus"], ["0", "2.10.0", "1"])
+        self.assertEqual(index["node_exporter"][1], "1.0.0~rc1")
+
+    def test_parse_repomd(self):
+        href, revision = RpmRepository._parse_repomd(REPOMD)
+        self.assertEqual(href, "repodata/bbb-primary.xml.gz")
+        self.assertEqual(revision, "1588000000:bbb")
+
+    def test_index_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = IndexCache(tmp)
+            cache.put("https://repo.example.com/", "1:abc", {"prometheus": ["0", "2.10.0", "1"]})
+            self.assertEqual(cache.get("https://repo.example.com/", "1:abc"), {"prometheus": ["0", "2.10.0", "1"]})
+            self.assertIsNone(cache.get("https://repo.example.com/", "2:def"))
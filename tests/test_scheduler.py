@@ -0,0 +1,48 @@
+from batchnfpm.scheduler import Scheduler, MEGABYTE
+from tests.helpers import make_build_config
+
+import time
+import threading
+import unittest
+
+
+class Test_TestScheduler(unittest.TestCase):
+    def test_order_longest_first(self):
+        build_configs = [make_build_config("tiny"), make_build_config("unknown"), make_build_config("huge"), make_build_config("medium")]
+        history = {"github/soerenschneider/tiny": (5, None), "github/soerenschneider/huge": (1200, None), "github/soerenschneider/medium": (60, None)}
+        scheduler = Scheduler(2, history=history)
+
+        ordered = [build_config.project for build_config in scheduler.order(build_configs)]
+        # without history a project is assumed to take the median duration, ties keep the config order
+        self.assertEqual(ordered, ["huge", "unknown", "medium", "tiny"])
+
+    def test_memory_budget(self):
+        build_configs = [make_build_config(f"project{i}") for i in range(6)]
+        history = {build_config.name: (1, 600 * MEGABYTE) for build_config in build_configs}
+        scheduler = Scheduler(4, memory_budget=1024 * MEGABYTE, history=history)
+
+        lock = threading.Lock()
+        running = {"now": 0, "max": 0}
+
+        def build(build_config):
+            with lock:
+                running["now"] += 1
+                running["max"] = max(running["max"], running["now"])
+            time.sleep(0.01)
+            with lock:
+                running["now"] -= 1
+            return build_config.project
+
+        results = scheduler.run(build_configs, build)
+
+        self.assertEqual(list(results), [build_config.name for build_config in build_configs])
+        self.assertEqual(running["max"], 1)
+
+    def test_oversized_job_runs_alone(self):
+        build_configs = [make_build_config("huge"), make_build_config("small")]
+        history = {"github/soerenschneider/huge": (10, 4096 * MEGABYTE), "github/soerenschneider/small": (1, 100 * MEGABYTE)}
+        scheduler = Scheduler(2, memory_budget=1024 * MEGABYTE, history=history)
+
+        self.assertEqual(scheduler.run(build_configs, lambda build_config: True), {"github/soerenschneider/huge": True, "github/soerenschneider/small": True})
+        self.assertFalse(scheduler._fits(100 * MEGABYTE, 4096 * MEGABYTE, 1))
+        self.assertTrue(scheduler._fits(4096 * MEGABYTE, 0, 0))
@@ -0,0 +1,46 @@
+from batchnfpm.selection import select_build_configs, get_shard
+from batchnfpm.config import Config
+from tests.helpers import make_build_config
+
+import unittest
+
+
+class Test_TestSelection(unittest.TestCase):
+    def setUp(self):
+        self.build_configs = [make_build_config("prometheus", owner="prometheus"), make_build_config("node_exporter", owner="prometheus"), make_build_config("tool", hoster="gitlab")]
+
+    def test_only_and_exclude(self):
+        selected = select_build_configs(self.build_configs, only=["github/prometheus/*"], exclude=["*/node_exporter"])
+        self.assertEqual([build_config.project for build_config in selected], ["prometheus"])
+
+        selected = select_build_configs(self.build_configs, exclude=["gitlab/*"])
+        self.assertEqual([build_config.project for build_config in selected], ["prometheus", "node_exporter"])
+
+    def test_shards_are_disjoint_and_complete(self):
+        build_configs = [make_build_config(f"project{i}", owner="owner") for i in range(100)]
+        shards = [select_build_configs(build_configs, shard_index=index, shard_count=3) for index in range(3)]
+
+        names = [build_config.name for shard in shards for build_config in shard]
+        self.assertEqual(sorted(names), sorted(build_config.name for build_config in build_configs))
+        self.assertTrue(all(shards))
+
+    def test_shard_is_stable(self):
+        self.assertEqual(get_shard("github/prometheus/prometheus", 7), get_shard("github/prometheus/prometheus", 7))
+        self.assertEqual(select_build_configs(self.build_configs, shard_index=0, shard_count=1), self.build_configs)
+
+    def test_invalid_shard(self):
+        self.assertRaises(ValueError, select_build_configs, self.build_configs, shard_index=2, shard_count=2)
+        self.assertRaises(ValueError, select_build_configs, self.build_configs, shard_count=0)
+
+    def test_patterns_from_config(self):
+        build_configuration = {"hoster": "github", "owner": "prometheus", "project": "prometheus", "buildsteps": [{"arch": "amd64", "buildsteps": ["make build"]}]}
+        raw = {"builds": {"artifacts_path": "/tmp/artifacts", "clone_path": "/tmp/clones", "nfpm_config": "/tmp/nfpm", "build_configurations": [build_configuration]}}
+
+        raw["builds"].update(only="github/*", exclude="gitlab/*")
+        config = Config.from_json(raw)
+        self.assertEqual((config.only, config.exclude), (["github/*"], ["gitlab/*"]))
+        self.assertEqual(len(select_build_configs(config.buildconfigs, config.only, config.exclude)), 1)
+
+        raw["builds"].update(exclude={"hoster": "gitlab"})
+        with self.assertRaises(ValueError):
+            Config.from_json(raw)
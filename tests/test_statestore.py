@@ -0,0 +1,46 @@
+from batchnfpm.statestore import StateStore, RESULT_SUCCESS, RESULT_FAILED, RESULT_CURRENT
+
+import os
+import tempfile
+import unittest
+
+
+class Test_TestStateStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = StateStore(self.tmp.name)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_record(self):
+        self.store.record("github/prometheus/prometheus", "v2.4.1", RESULT_SUCCESS, "abc", ["/tmp/p.rpm"], 12.5)
+        state = self.store.get("github/prometheus/prometheus")
+        self.assertEqual(state["tag"], "v2.4.1")
+        self.assertEqual(state["artifacts"], ["/tmp/p.rpm"])
+        self.assertEqual(state["duration"], 12.5)
+        self.assertEqual(len(self.store.get_all()), 1)
+        self.assertIsNone(self.store.get("github/prometheus/node_exporter"))
+
+    def test_is_up_to_date(self):
+        artifact = os.path.join(self.tmp.name, "p.rpm")
+        open(artifact, "w").close()
+        self.store.record("built", "v1.0.0", RESULT_SUCCESS, artifacts=[artifact])
+        self.store.record("current", "v1.0.0", RESULT_CURRENT)
+        self.store.record("failed", "v1.0.0", RESULT_FAILED)
+        self.store.record("deleted", "v1.0.0", RESULT_SUCCESS, artifacts=[os.path.join(self.tmp.name, "gone.rpm")])
+
+        self.assertTrue(self.store.is_up_to_date("built", "v1.0.0"))
+        self.assertFalse(self.store.is_up_to_date("built", "v1.1.0"))
+        self.assertTrue(self.store.is_up_to_date("current", "v1.0.0"))
+        self.assertFalse(self.store.is_up_to_date("failed", "v1.0.0"))
+        self.assertFalse(self.store.is_up_to_date("deleted", "v1.0.0"))
+        self.assertFalse(self.store.is_up_to_date("unknown", "v1.0.0"))
+
+    def test_history_survives_runs_without_build(self):
+        self.store.record("built", "v1.0.0", RESULT_SUCCESS, duration=300.0, peak_rss=2048)
+        self.store.record("built", "v1.0.0", RESULT_CURRENT)
+
+        self.assertEqual(self.store.get("built")["result"], RESULT_CURRENT)
+        self.assertEqual(self.store.get_history(), {"built": (300.0, 2048)})
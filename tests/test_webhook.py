@@ -0,0 +1,87 @@
+from batchnfpm.webhook import WebhookReceiver, parse_address, parse_github_event, parse_gitlab_event, verify_github_signature
+from batchnfpm.config import Config, NfpmConfig, Hoster
+from tests.helpers import make_build_config
+
+import hmac
+import json
+import hashlib
+import unittest
+from unittest import mock
+
+SECRET = "s3cret"
+
+
+def _github_headers(body: bytes, event="release") -> dict:
+    signature = "sha256=" + hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return {"X-GitHub-Event": event, "X-Hub-Signature-256": signature}
+
+
+class Test_TestWebhook(unittest.TestCase):
+    def setUp(self):
+        self.github = make_build_config("Tool")
+        self.gitlab = make_build_config("other", hoster="gitlab")
+        conf = Config([self.github, self.gitlab], "/tmp/artifacts", "/tmp/clones", NfpmConfig("/tmp/nfpm"))
+        self.builder = mock.Mock()
+        self.builder.conf = conf
+        self.receiver = WebhookReceiver(self.builder, ("127.0.0.1", 0), github_secret=SECRET, gitlab_token=SECRET)
+
+    def tearDown(self):
+        self.receiver.server.server_close()
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address(":8080"), ("0.0.0.0", 8080))
+        self.assertEqual(parse_address("127.0.0.1:9000"), ("127.0.0.1", 9000))
+        self.assertRaises(ValueError, parse_address, "localhost")
+
+    def test_parse_github_event(self):
+        release = {"action": "published", "release": {"tag_name": "v1.2.0"}, "repository": {"full_name": "soerenschneider/tool"}}
+        self.assertEqual(parse_github_event("release", release), ("soerenschneider", "tool", "v1.2.0"))
+        push = {"ref": "refs/tags/v1.2.0", "repository": {"full_name": "soerenschneider/tool"}}
+        self.assertEqual(parse_github_event("push", push), ("soerenschneider", "tool", "v1.2.0"))
+        self.assertIsNone(parse_github_event("push", {"ref": "refs/heads/main", "repository": {"full_name": "soerenschneider/tool"}}))
+        release["release"]["prerelease"] = True
+        self.assertIsNone(parse_github_event("release", release))
+        release["release"] = {"tag_name": "v1.2.0", "draft": True}
+        self.assertIsNone(parse_github_event("release", release))
+
+    def test_parse_gitlab_event(self):
+        push = {"ref": "refs/tags/v2.0.0", "checkout_sha": "abc", "project": {"path_with_namespace": "group/sub/other"}}
+        self.assertEqual(parse_gitlab_event("Tag Push Hook", push), ("group/sub", "other", "v2.0.0"))
+        push["checkout_sha"] = None
+        self.assertIsNone(parse_gitlab_event("Tag Push Hook", push))
+
+    def test_verify_github_signature(self):
+        body = b'{"zen": "hi"}'
+        self.assertTrue(verify_github_signature(SECRET, body, _github_headers(body)["X-Hub-Signature-256"]))
+        self.assertFalse(verify_github_signature(SECRET, body + b" ", _github_headers(body)["X-Hub-Signature-256"]))
+        self.assertFalse(verify_github_signature(None, body, _github_headers(body)["X-Hub-Signature-256"]))
+
+    def test_handle_queues_matching_project(self):
+        body = json.dumps({"action": "published", "release": {"tag_name": "v1.2.0"}, "repository": {"full_name": "soerenschneider/tool"}}).encode()
+        self.assertEqual(self.receiver.handle(_github_headers(body), body), 202)
+        self.assertEqual(self.receiver.take_due(now=float("inf")), [(self.github, "v1.2.0")])
+
+    def test_handle_ignores_filtered_tags(self):
+        self.github.tag_exclude = ["v1.3.*"]
+        for tag in ["v1.4.0-rc1", "v1.3.0", "nightly"]:
+            push = json.dumps({"ref": f"refs/tags/{tag}", "repository": {"full_name": "soerenschneider/tool"}}).encode()
+            self.assertEqual(self.receiver.handle(_github_headers(push, event="push"), push), 204)
+        self.assertEqual(self.receiver.take_due(now=float("inf")), [])
+
+    def test_handle_rejects_bad_signature(self):
+        body = json.dumps({"action": "published", "release": {"tag_name": "v1.2.0"}, "repository": {"full_name": "soerenschneider/tool"}}).encode()
+        headers = {"X-GitHub-Event": "release", "X-Hub-Signature-256": "sha256=00"}
+        self.assertEqual(self.receiver.handle(headers, body), 401)
+        self.assertEqual(self.receiver.handle({"X-Gitlab-Event": "Tag Push Hook", "X-Gitlab-Token": "wrong"}, b"{}"), 401)
+        self.assertEqual(self.receiver.take_due(now=float("inf")), [])
+
+    def test_handle_unknown_project(self):
+        body = json.dumps({"action": "published", "release": {"tag_name": "v1.2.0"}, "repository": {"full_name": "someone/else"}}).encode()
+        self.assertEqual(self.receiver.handle(_github_headers(body), body), 404)
+
+    def test_debounce(self):
+        self.receiver.enqueue(self.gitlab, "v1.0.0", now=0)
+        self.receiver.enqueue(self.gitlab, "v1.0.1", now=3)
+        self.assertEqual(self.receiver.take_due(now=5), [])
+        self.assertEqual(self.receiver.take_due(now=8), [(self.gitlab, "v1.0.1")])
+        self.assertIs(self.receiver.find_build_config(Hoster.GITLAB, "SoerenSchneider", "other"), self.gitlab)
@@ -0,0 +1,117 @@
+from batchnfpm.workqueue import WorkQueue, MAX_ATTEMPTS, STATE_DONE, STATE_FAILED, STATE_QUEUED
+from batchnfpm.distributed import Coordinator, Worker
+from batchnfpm.rpmbuilder import DECISION_BUILD
+from batchnfpm.config import Config, NfpmConfig
+from batchnfpm.metrics import Tracer
+from tests.helpers import make_build_config
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+
+class Test_TestWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = WorkQueue(os.path.join(self.tmp.name, "queue.db"))
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp.cleanup()
+
+    def test_enqueue_deduplicates(self):
+        self.assertTrue(self.queue.enqueue("github/a/b", "v1.0.0", 0, "amd64"))
+        self.assertFalse(self.queue.enqueue("github/a/b", "v1.0.0", 0, "amd64"))
+        self.assertTrue(self.queue.enqueue("github/a/b", "v1.0.0", 1, "arm64"))
+        self.assertEqual(self.queue.count_unfinished(), 2)
+
+    def test_enqueue_forced_requeues_done_jobs(self):
+        self.queue.enqueue("github/a/b", "v1.0.0", 0, "amd64")
+        job = self.queue.lease("w1")
+        self.queue.complete(job["id"], "w1", True)
+
+        self.assertFalse(self.queue.enqueue("github/a/b", "v1.0.0", 0, "amd64"))
+        self.assertTrue(self.queue.enqueue("github/a/b", "v1.0.0", 0, "amd64", force=True))
+        self.assertEqual(self.queue.get_jobs()[0]["state"], STATE_QUEUED)
+        # running jobs are left alone
+        self.queue.lease("w1")
+        self.assertFalse(self.queue.enqueue("github/a/b", "v1.0.0", 0, "amd64", force=True))
+
+    def test_lease_and_complete(self):
+        self.queue.enqueue("github/a/b", "v1.0.0", 0, "amd64")
+        job = self.queue.lease("w1")
+        self.assertEqual((job["project"], job["tag"], job["arch"]), ("github/a/b", "v1.0.0", "amd64"))
+        self.assertIsNone(self.queue.lease("w2"))
+
+        self.assertFalse(self.queue.complete(job["id"], "w2", True))
+        self.assertTrue(self.queue.complete(job["id"], "w1", True))
+        self.assertEqual(self.queue.get_jobs()[0]["state"], STATE_DONE)
+
+    def test_expired_lease_is_requeued(self):
+        self.queue.enqueue("github/a/b", "v1.0.0", 0, "amd64")
+        job = self.queue.lease("w1", lease_seconds=-1)
+
+        other = self.queue.lease("w2")
+        self.assertEqual(other["id"], job["id"])
+        self.assertFalse(self.queue.heartbeat(job["id"], "w1"))
+        self.assertTrue(self.queue.heartbeat(job["id"], "w2"))
+
+    def test_gives_up_after_max_attempts(self):
+        self.queue.enqueue("github/a/b", "v1.0.0", 0, "amd64")
+        for _ in range(MAX_ATTEMPTS):
+            self.assertIsNotNone(self.queue.lease("w1", lease_seconds=-1))
+
+        self.assertIsNone(self.queue.lease("w1"))
+        self.assertEqual(self.queue.get_jobs()[0]["state"], STATE_FAILED)
+
+        # a failed job can be queued again by the next coordinator run
+        self.assertTrue(self.queue.enqueue("github/a/b", "v1.0.0", 0, "amd64"))
+        self.assertEqual(self.queue.get_jobs()[0]["state"], STATE_QUEUED)
+
+    def test_coordinator_and_worker(self):
+        ok, broken = make_build_config("ok", archs=("amd64", "arm64")), make_build_config("broken", archs=("amd64", "arm64"))
+        conf = Config([ok, broken], "/tmp/artifacts", "/tmp/clones", NfpmConfig("/tmp/nfpm"))
+        builder = mock.Mock()
+        builder.conf = conf
+        builder.tracer = Tracer()
+        builder.git_wrapper.get_latest_release_tags.return_value = {ok: "v1.0.0", broken: "v2.0.0"}
+        builder.decide.return_value = (DECISION_BUILD, None)
+        builder.build_arch.side_effect = lambda build_config, tag, build_index: not (build_config is broken and build_index == 1)
+
+        coordinator = Coordinator(builder, self.queue, poll_interval=0)
+        queued = coordinator.enqueue()
+        self.assertEqual(len(queued), 2)
+        self.assertEqual(self.queue.count_unfinished(), 4)
+
+        Worker(builder, self.queue).run(until_empty=True)
+        self.assertEqual(builder.build_arch.call_count, 4)
+
+        results = coordinator.collect(queued)
+        self.assertEqual(results, {ok.name: True, broken.name: False})
+
+    def test_builds_sharing_an_arch(self):
+        build_config = make_build_config("p", archs=("amd64", "amd64"))
+        builder = mock.Mock()
+        builder.conf = Config([build_config], "/tmp/artifacts", "/tmp/clones", NfpmConfig("/tmp/nfpm"))
+        builder.tracer = Tracer()
+        builder.git_wrapper.get_latest_release_tags.return_value = {build_config: "v1.0.0"}
+        builder.decide.return_value = (DECISION_BUILD, None)
+        builder.build_arch.return_value = True
+
+        Coordinator(builder, self.queue, poll_interval=0).enqueue()
+        self.assertEqual(self.queue.count_unfinished(), 2)
+
+        Worker(builder, self.queue).run(until_empty=True)
+        indexes = sorted(call[0][2] for call in builder.build_arch.call_args_list)
+        self.assertEqual(indexes, [0, 1])
+
+    def test_worker_survives_lease_errors(self):
+        builder = mock.Mock()
+        builder.conf = Config([make_build_config("p")], "/tmp/artifacts", "/tmp/clones", NfpmConfig("/tmp/nfpm"))
+        queue = mock.Mock()
+        queue.lease.side_effect = [sqlite3.OperationalError("database is locked"), None]
+
+        Worker(builder, queue, poll_interval=0).run(until_empty=True)
+        self.assertEqual(queue.lease.call_count, 2)